@@ -0,0 +1,206 @@
+"""
+Synthetic PDF corpus generator for the benchmarks.
+
+Writes French administrative documents (invoices, quotes, letters, bank
+statements...) as PDF files of varying page counts, of three kinds:
+
+- "text": every page has a text layer;
+- "scanned": every page is an image without a text layer, as produced by
+  a scanner, so it goes through OCR;
+- "mixed": text pages with a scanned page every other page.
+
+The PDF files are written directly, without any PDF library.
+
+Usage:
+    python benchmarks/corpus.py /tmp/corpus --count 60 --kinds text mixed --pages 1 3 10
+"""
+import os
+import zlib
+import random
+import argparse
+
+KINDS = ["text", "scanned", "mixed"]
+
+# Page size in PDF points (A4) and line layout of the text pages.
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+LINES_PER_PAGE = 50
+
+DOCUMENT_TYPES = {
+    "facture": "FACTURE N° {number}",
+    "devis": "DEVIS N° {number}",
+    "mail": "Objet : suivi de votre dossier {number}",
+    "relevé de comptes": "RELEVÉ DE COMPTES N° {number}",
+    "impots": "AVIS D'IMPÔT SUR LE REVENU {number}",
+    "arrêt maladie": "AVIS D'ARRÊT DE TRAVAIL {number}",
+}
+EMITTERS = ["EDF", "Orange", "Crédit Agricole", "TechCorp Solutions", "Plomberie Martin", "CPAM de Paris"]
+RECIPIENTS = ["Jérôme", "Pauline", "Grégoire", "OLTMANNS", "WAX"]
+
+
+def _escape(text):
+    data = text.encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _text_stream(lines):
+    stream = [b"BT /F1 10 Tf 14 TL 50 800 Td"]
+    for line in lines:
+        stream.append(b"(" + _escape(line) + b") Tj T*")
+    stream.append(b"ET")
+    return b"\n".join(stream)
+
+
+def write_pdf(path, pages):
+    """
+    Writes a PDF file.
+
+    :param path: Path of the PDF file to write.
+    :param pages: List of pages, each a list of text lines (a page with a
+                  text layer) or a PIL image (a scanned page).
+    """
+    objects = []
+
+    def add(data):
+        objects.append(data)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    page_ids = []
+    for page in pages:
+        if isinstance(page, list):
+            content = _text_stream(page)
+            resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+        else:
+            image = page.convert("L")
+            data = zlib.compress(image.tobytes())
+            xobject = add(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                          b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream"
+                          % (image.width, image.height, len(data), data))
+            content = b"q %d 0 0 %d 0 0 cm /Im1 Do Q" % (PAGE_WIDTH, PAGE_HEIGHT)
+            resources = b"<< /XObject << /Im1 %d 0 R >> >>" % xobject
+        stream = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>"
+                            % (page_tree, PAGE_WIDTH, PAGE_HEIGHT, resources, stream)))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, data in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, data)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, xref)
+    with open(path, "wb") as file:
+        file.write(output)
+
+
+def render_page(lines, dpi=100):
+    """
+    Renders text lines as a scanned page image.
+
+    :param lines: The text lines of the page.
+    :param dpi: Resolution of the page image.
+    :return: A grayscale PIL image.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("L", (PAGE_WIDTH * dpi // 72, PAGE_HEIGHT * dpi // 72), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=10 * dpi // 72)
+    except TypeError:
+        font = ImageFont.load_default()
+    for index, line in enumerate(lines):
+        draw.text((50 * dpi // 72, (42 + index * 14) * dpi // 72), line, fill=0, font=font)
+    return image
+
+
+def document_lines(rng, page_count):
+    """
+    Generates the text of a document.
+
+    :param rng: The random.Random instance to draw from.
+    :param page_count: Number of pages of the document.
+    :return: A (metadata, pages) tuple, pages being lists of text lines.
+    """
+    doc_type = rng.choice(list(DOCUMENT_TYPES))
+    emitter = rng.choice(EMITTERS)
+    recipient = rng.choice(RECIPIENTS)
+    day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2019, 2025)
+    number = rng.randint(1000, 99999)
+    header = [
+        emitter,
+        f"12 rue de la République, 750{rng.randint(10, 20)} Paris",
+        "",
+        DOCUMENT_TYPES[doc_type].format(number=number),
+        f"Date : {day:02d}/{month:02d}/{year}",
+        f"Destinataire : {recipient}",
+        "",
+    ]
+    pages = []
+    for page_number in range(1, page_count + 1):
+        lines = list(header) if page_number == 1 else [f"{emitter} - suite du document {number}", ""]
+        while len(lines) < LINES_PER_PAGE - 2:
+            amount = rng.randint(100, 999999) / 100
+            lines.append(f"{rng.randint(1, 9999):04d}  Prestation {rng.choice(['maintenance', 'conseil', 'fourniture', 'abonnement'])}"
+                         f" {rng.randint(1, 99)}  {amount:>10.2f} EUR")
+        lines += ["", f"Page {page_number}/{page_count}"]
+        pages.append(lines)
+    metadata = {"type": doc_type, "date": f"{year}-{month:02d}-{day:02d}", "emitter": emitter,
+                "recipient": recipient}
+    return metadata, pages
+
+
+def make_corpus(directory, count=30, kinds=None, page_counts=(1, 3, 10), seed=0):
+    """
+    Writes a synthetic corpus of PDF documents.
+
+    :param directory: The directory to write the files into.
+    :param count: Number of documents.
+    :param kinds: Kinds of documents to cycle through, among KINDS.
+    :param page_counts: Page counts to cycle through.
+    :param seed: Seed of the random generator, for reproducible corpora.
+    :return: A list of (file_path, metadata) tuples.
+    """
+    kinds = kinds or KINDS
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    documents = []
+    for index in range(count):
+        kind = kinds[index % len(kinds)]
+        page_count = page_counts[(index // len(kinds)) % len(page_counts)]
+        metadata, pages = document_lines(rng, page_count)
+        if kind == "scanned":
+            pages = [render_page(lines) for lines in pages]
+        elif kind == "mixed":
+            pages = [render_page(lines) if number % 2 else lines for number, lines in enumerate(pages)]
+        file_path = os.path.join(directory, f"{index:05d}-{kind}-{page_count}p.pdf")
+        write_pdf(file_path, pages)
+        documents.append((file_path, dict(metadata, kind=kind, pages=page_count)))
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic corpus of PDF documents.')
+    parser.add_argument('directory', type=str, help='The directory to write the files into.')
+    parser.add_argument('--count', type=int, default=30, help='Number of documents.')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS,
+                        help='Kinds of documents to cycle through.')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 3, 10],
+                        help='Page counts to cycle through.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator.')
+    args = parser.parse_args()
+
+    documents = make_corpus(args.directory, args.count, args.kinds, args.pages, args.seed)
+    print(f"Wrote {len(documents)} documents to {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
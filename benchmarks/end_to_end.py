@@ -0,0 +1,169 @@
+"""
+Offline end-to-end benchmark of main.process_directory.
+
+Runs a synthetic corpus (see corpus.py) through text extraction, analysis
+against stand-in Ollama servers (see fake_ollama.py) and organization,
+and prints a JSON report: overall and per-stage throughput, median and
+95th percentile time per file in each stage, LLM requests, the metrics
+totals (see metrics.py) and peak memory.
+The progress output of the run goes to stderr, so stdout only holds the
+report.
+
+With --baseline, the throughput is compared with a previous report and the
+script exits with status 1 when it regressed by more than --tolerance, so
+it can run in CI.
+
+With --hosts, the requests are spread over several stand-in servers, to
+measure how the throughput grows with the number of Ollama hosts.
+
+Scanned pages need poppler (pdftoppm) and tesseract; use --kinds text
+where they are not installed.
+
+Usage:
+    python benchmarks/end_to_end.py --count 60 --kinds text mixed > report.json
+    python benchmarks/end_to_end.py --extract-workers 4 --llm-workers 4 --baseline report.json
+    python benchmarks/end_to_end.py --hosts 3 --parallel 2 --llm-workers 6
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import KINDS, make_corpus
+from fake_ollama import FakeOllamaServer
+
+
+def run(corpus_directory, args):
+    """
+    Processes a copy of a corpus and measures the run.
+
+    :param corpus_directory: The directory holding the PDF files.
+    :param args: The parsed command-line arguments.
+    :return: The report, as a dictionary.
+    """
+    # The pool of Ollama hosts reads OLLAMA_HOSTS when it is created, on the
+    # first request, once the servers are up.
+    import main
+    import metrics
+    from document_analyzer import llm_stats
+
+    with tempfile.TemporaryDirectory() as directory:
+        inbox = os.path.join(directory, "inbox")
+        output = os.path.join(directory, "output")
+        shutil.copytree(corpus_directory, inbox)
+        files = len(os.listdir(inbox))
+
+        start = time.perf_counter()
+        main.startup_stats.update(started=start, first_result=None)
+        with contextlib.redirect_stdout(sys.stderr):
+            stage_stats = main.process_directory(
+                inbox, output, combined=args.combined, max_in_flight=args.max_in_flight,
+                extract_workers=args.extract_workers, llm_workers=args.llm_workers,
+                queue_size=args.queue_size, rules=args.rules)
+        elapsed = time.perf_counter() - start
+        organized = sum(len(names) for _, _, names in os.walk(output))
+
+    return {
+        "files": files,
+        "organized": organized,
+        "elapsed": round(elapsed, 3),
+        "files_per_second": round(files / elapsed, 3) if elapsed else 0.0,
+        "first_result_seconds": round(main.startup_stats["first_result"] or 0.0, 3),
+        "stages": {
+            name: {
+                "workers": stats["workers"],
+                "items": stats["items"],
+                "items_per_second": round(stats["items"] / elapsed, 3) if elapsed else 0.0,
+                "busy_time": round(stats["busy_time"], 3),
+                "p50": round(stats["p50"], 4),
+                "p95": round(stats["p95"], 4),
+            }
+            for name, stats in stage_stats.items()
+        },
+        "llm": {"calls": llm_stats["calls"], "prompt_tokens": llm_stats["prompt_tokens"]},
+        "metrics": metrics.summary(),
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_children_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark process_directory end to end, offline.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--corpus', type=str, default=None,
+                        help='Directory of PDF files to process. A synthetic corpus is generated if omitted.')
+    parser.add_argument('--count', type=int, default=30, help='Number of generated documents.')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS,
+                        help='Kinds of generated documents.')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 3, 10],
+                        help='Page counts of the generated documents.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds spent on each LLM request.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra LLM latency, in seconds.')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of the LLM requests failing with an HTTP 500 error.')
+    parser.add_argument('--malformed-rate', type=float, default=0.0,
+                        help='Share of the LLM requests answered with the tool call written in the content.')
+    parser.add_argument('--garbled-rate', type=float, default=0.0,
+                        help='Share of the LLM requests answered with prose only.')
+    parser.add_argument('--parallel', type=int, default=4,
+                        help='Maximum number of LLM requests served at once by each server.')
+    parser.add_argument('--hosts', type=int, default=1, help='Number of stand-in Ollama servers.')
+    parser.add_argument('--combined', action='store_true', help='Use the combined extraction mode.')
+    parser.add_argument('--rules', action='store_true', help='Use the rule-based fast path.')
+    parser.add_argument('--max-in-flight', type=int, default=1,
+                        help='Maximum number of concurrent per-field LLM requests.')
+    parser.add_argument('--extract-workers', type=int, default=1, help='Number of text extraction processes.')
+    parser.add_argument('--llm-workers', type=int, default=1, help='Number of documents analyzed concurrently.')
+    parser.add_argument('--queue-size', type=int, default=8, help='Pipeline queue size.')
+    parser.add_argument('--output', type=str, default=None, help='Also write the report to this file.')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Report of a previous run to compare the throughput with.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Accepted throughput drop against the baseline, as a fraction.')
+    args = parser.parse_args()
+
+    servers = [FakeOllamaServer(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                                malformed_rate=args.malformed_rate, parallel=args.parallel, seed=seed,
+                                garbled_rate=args.garbled_rate)
+               for seed in range(args.hosts)]
+    os.environ["OLLAMA_HOST"] = servers[0].url
+    os.environ["OLLAMA_HOSTS"] = ",".join(server.url for server in servers)
+    with contextlib.ExitStack() as stack, tempfile.TemporaryDirectory() as directory:
+        for server in servers:
+            stack.enter_context(server)
+        corpus_directory = args.corpus
+        if corpus_directory is None:
+            corpus_directory = os.path.join(directory, "corpus")
+            make_corpus(corpus_directory, args.count, args.kinds, args.pages)
+        report = run(corpus_directory, args)
+        report["server"] = {key: sum(server.stats[key] for server in servers) for key in servers[0].stats}
+        report["server"]["hosts"] = [dict(server.stats) for server in servers]
+
+    report["config"] = {key: value for key, value in vars(args).items()
+                        if key not in ("output", "baseline", "tolerance")}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        floor = baseline["files_per_second"] * (1 - args.tolerance)
+        if report["files_per_second"] < floor:
+            print(f"Throughput regression: {report['files_per_second']} files/s, "
+                  f"baseline {baseline['files_per_second']} files/s.", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+A stand-in Ollama HTTP server for offline benchmarks and tests.
+
+It answers /api/chat requests with a tool call for the requested tool,
+after a configurable latency. The arguments are valid (enum values found in
+the prompt, the first date of the prompt) but not meant to be right. A share
+of the requests can fail with an HTTP 500 error, come back with the tool
+call written as JSON in the message content instead of a tool call (as
+small models often do), or come back with prose only, to exercise the
+repair and retry paths. At most `parallel` requests are
+served at once, like OLLAMA_NUM_PARALLEL.
+
+Like the Ollama runner, each of the `parallel` slots keeps the last prompt
+it evaluated and only evaluates (and counts in prompt_eval_count) the part
+of a new prompt past their common prefix. With token_latency, each request
+also takes that many seconds per prompt token evaluated, so prompt layouts
+can be compared offline.
+
+Usage:
+    python benchmarks/fake_ollama.py --port 11435 --latency 0.2 --failure-rate 0.05
+    OLLAMA_HOST=http://127.0.0.1:11435 python main.py /path/to/pdfs /path/to/output
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_date = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b|\b(\d{4})-(\d{2})-(\d{2})\b")
+
+
+def _first_date(text):
+    match = _date.search(text)
+    if not match:
+        return "2024-01-15"
+    if match.group(1):
+        day, month, year = match.group(1, 2, 3)
+    else:
+        year, month, day = match.group(4, 5, 6)
+    return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+
+
+def render_prompt(request):
+    """
+    Renders a chat request as the prompt text, the tools going into the last
+    user message like the Llama 3.2 chat template does.
+
+    :param request: The decoded JSON chat request.
+    :return: The prompt text.
+    """
+    messages = request.get("messages", [])
+    last_user = max((index for index, message in enumerate(messages) if message.get("role") == "user"),
+                    default=len(messages))
+    parts = []
+    for index, message in enumerate(messages):
+        if index == last_user and request.get("tools"):
+            parts.append(json.dumps(request["tools"], ensure_ascii=False, sort_keys=True))
+        parts.append(f"<{message.get('role')}>{message.get('content', '')}")
+    return "\n".join(parts)
+
+
+def tool_arguments(tool, text):
+    """
+    Builds valid arguments for a tool call from the text of the prompt.
+
+    :param tool: The tool definition of the request.
+    :param text: The text of the prompt.
+    :return: A dictionary of arguments.
+    """
+    parameters = tool["function"]["parameters"]
+    lowered = text.lower()
+    arguments = {}
+    for name in parameters.get("required", []):
+        schema = parameters["properties"].get(name, {})
+        if "enum" in schema:
+            found = [value for value in schema["enum"] if value.lower() in lowered]
+            arguments[name] = found[0] if found else schema["enum"][0]
+        elif name == "date":
+            arguments[name] = _first_date(text)
+        elif name == "subject":
+            arguments[name] = "Document"
+        elif name == "emitter":
+            arguments[name] = "Emitter"
+        else:
+            arguments[name] = "Stand-in answer."
+    return arguments
+
+
+class FakeOllamaServer:
+    """A stand-in Ollama server running in a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, failure_rate=0.0,
+                 malformed_rate=0.0, parallel=4, model="llama3.2", seed=0, garbled_rate=0.0,
+                 token_latency=0.0):
+        """
+        :param host: Address to listen on.
+        :param port: Port to listen on, 0 for a free port.
+        :param latency: Seconds spent on each chat request.
+        :param jitter: Random extra latency, up to this many seconds.
+        :param failure_rate: Share of the chat requests failing with an HTTP 500 error.
+        :param malformed_rate: Share of the chat requests answered with the tool
+                               call written as JSON in the message content.
+        :param parallel: Maximum number of requests served at once.
+        :param model: Name of the model the server reports.
+        :param seed: Seed of the random generator deciding latencies and failures.
+        :param garbled_rate: Share of the chat requests answered with prose only.
+        :param token_latency: Seconds spent per prompt token evaluated.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.garbled_rate = garbled_rate
+        self.token_latency = token_latency
+        self.model = model
+        self.stats = {"requests": 0, "failures": 0, "malformed": 0, "garbled": 0, "loads": 0}
+        self.keep_alive = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(parallel)
+        self._cached_prompts = [""] * parallel
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if roll < self.failure_rate:
+                self.stats["failures"] += 1
+                return delay, "failure"
+            if roll < self.failure_rate + self.malformed_rate:
+                self.stats["malformed"] += 1
+                return delay, "malformed"
+            if roll < self.failure_rate + self.malformed_rate + self.garbled_rate:
+                self.stats["garbled"] += 1
+                return delay, "garbled"
+        return delay, "ok"
+
+    def _evaluate(self, prompt):
+        """
+        Picks the slot whose cached prompt shares the longest prefix with a
+        prompt and stores the prompt there.
+
+        :return: The number of tokens evaluated, at 4 characters per token.
+        """
+        with self._lock:
+            shared = [len(os.path.commonprefix([cached, prompt])) for cached in self._cached_prompts]
+            slot = max(range(len(shared)), key=shared.__getitem__)
+            self._cached_prompts[slot] = prompt
+        return (len(prompt) - shared[slot]) // 4
+
+    def chat(self, request):
+        """
+        Answers a chat request.
+
+        :param request: The decoded JSON request.
+        :return: A (status, response) tuple.
+        """
+        delay, outcome = self._draw()
+        with self._slots:
+            evaluated = self._evaluate(render_prompt(request))
+            prompt_eval_time = evaluated * self.token_latency
+            time.sleep(delay + prompt_eval_time)
+        if outcome == "failure":
+            return 500, {"error": "stand-in server failure"}
+
+        text = "\n".join(message.get("content", "") for message in request.get("messages", []))
+        message = {"role": "assistant", "content": ""}
+        tools = request.get("tools") or []
+        if outcome == "garbled" or not tools:
+            message["content"] = "I think this document is an invoice."
+        elif outcome == "malformed":
+            call = {"name": tools[0]["function"]["name"], "parameters": tool_arguments(tools[0], text)}
+            message["content"] = "```json\n" + json.dumps(call, ensure_ascii=False) + "\n```"
+        else:
+            message["tool_calls"] = [{"function": {
+                "name": tools[0]["function"]["name"],
+                "arguments": tool_arguments(tools[0], text),
+            }}]
+        return 200, {
+            "model": request.get("model", self.model),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": message,
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((delay + prompt_eval_time) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int((delay * 0.8 + prompt_eval_time) * 1e9),
+            "eval_count": 30,
+            "eval_duration": int(delay * 0.2e9),
+        }
+
+    def _known(self, name):
+        """Tells whether a model name designates the served model, like Ollama ignoring case and :latest."""
+        return (name or "").lower().removesuffix(":latest") == self.model.lower().removesuffix(":latest")
+
+    def show(self, request):
+        """
+        Answers a model information request.
+
+        :param request: The decoded JSON request.
+        :return: A (status, response) tuple.
+        """
+        if not self._known(request.get("model") or request.get("name")):
+            return 404, {"error": f"model '{request.get('model')}' not found"}
+        return 200, {
+            "modelfile": f"FROM {self.model}",
+            "parameters": "",
+            "template": "{{- if .Tools }}{{ .Tools }}{{ end }}{{ .Prompt }}",
+            "details": {"format": "gguf", "family": "llama", "parameter_size": "3.2B",
+                        "quantization_level": "Q4_K_M"},
+            "model_info": {"general.architecture": "llama"},
+            "capabilities": ["completion", "tools"],
+            "modified_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def generate(self, request):
+        """
+        Answers a generate request. Only the empty prompts loading the model
+        are supported; the last keep-alive asked for is kept in keep_alive.
+
+        :param request: The decoded JSON request.
+        :return: A (status, response) tuple.
+        """
+        if not self._known(request.get("model")):
+            return 404, {"error": f"model '{request.get('model')}' not found"}
+        with self._lock:
+            self.stats["loads"] += 1
+            self.keep_alive = request.get("keep_alive")
+        return 200, {"model": request.get("model"), "created_at": datetime.now(timezone.utc).isoformat(),
+                     "response": "", "done": True, "done_reason": "load"}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._reply(200, {"models": [{"name": server.model, "model": server.model}]})
+                elif self.path == "/api/version":
+                    self._reply(200, {"version": "0.0.0-fake"})
+                elif self.path == "/":
+                    self._reply(200, {"status": "Ollama is running"})
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/chat":
+                    self._reply(*server.chat(request))
+                elif self.path == "/api/show":
+                    self._reply(*server.show(request))
+                elif self.path == "/api/generate":
+                    self._reply(*server.generate(request))
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Starts serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving, or releases the port of a server that was never started."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a stand-in Ollama server.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=11435, help='Port to listen on.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds spent on each chat request.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency, in seconds.')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of the chat requests failing with an HTTP 500 error.')
+    parser.add_argument('--malformed-rate', type=float, default=0.0,
+                        help='Share of the chat requests answered with the tool call written in the content.')
+    parser.add_argument('--garbled-rate', type=float, default=0.0,
+                        help='Share of the chat requests answered with prose only.')
+    parser.add_argument('--parallel', type=int, default=4, help='Maximum number of requests served at once.')
+    parser.add_argument('--token-latency', type=float, default=0.0,
+                        help='Seconds spent per prompt token evaluated, past the prefix cached in the slot.')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.latency, args.jitter, args.failure_rate,
+                              args.malformed_rate, args.parallel, garbled_rate=args.garbled_rate,
+                              token_latency=args.token_latency)
+    print(f"Stand-in Ollama server listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark of adaptive-DPI OCR against fixed-resolution OCR on a corpus of
+scanned PDFs of mixed quality.
+
+Most pages are clean, high-contrast scans that OCR well at a low
+resolution; the others are faint, low-contrast and noisy, like old faxes.
+Each strategy OCRs the whole corpus and reports its time, the mean word
+confidence, the pages escalated to a further pass, and the share of the
+expected words found in the text:
+
+- "fixed-200" and "fixed-300": every page is OCR'd once, at 200 or 300 DPI;
+- "adaptive": pages are OCR'd at 150 DPI, and only the pages below the
+  confidence threshold again at 300 DPI, then binarized.
+
+Requires poppler (pdftoppm) and tesseract.
+
+Usage:
+    python benchmarks/ocr_adaptive.py --files 20 --pages 3 --poor 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_processor
+
+STRATEGIES = {
+    "fixed-200": {"dpi": 200, "escalation_dpi": [], "min_confidence": 0, "binarize": False},
+    "fixed-300": {"dpi": 300, "escalation_dpi": [], "min_confidence": 0, "binarize": False},
+    "adaptive": {"dpi": 150, "escalation_dpi": [300], "min_confidence": 70.0, "binarize": True},
+}
+
+WORDS = ["facture", "montant", "total", "date", "client", "contrat", "paiement", "échéance",
+         "référence", "adresse", "virement", "compte", "période", "consommation", "abonnement"]
+
+
+def make_scanned_pdf(path, pages, poor, rng, dpi=300):
+    """
+    Writes a PDF made of A4 page images without a text layer.
+
+    :param path: Path of the PDF file to write.
+    :param pages: Number of pages.
+    :param poor: Probability of a page being a faint, noisy scan.
+    :param rng: The random.Random generating the words and the noise.
+    :param dpi: Resolution of the page images.
+    :return: The words written on the pages.
+    """
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    size = (int(8.27 * dpi), int(11.69 * dpi))
+    font = ImageFont.load_default(size=dpi // 8)
+    images = []
+    words = []
+    for _ in range(pages):
+        faint = rng.random() < poor
+        image = Image.new("L", size, 235 if faint else 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(30):
+            text = " ".join(rng.choice(WORDS) for _ in range(6))
+            words.extend(text.split())
+            draw.text((dpi, dpi + line * dpi // 3), text, fill=170 if faint else 0, font=font)
+        if faint:
+            for _ in range(size[0] * size[1] // 200):
+                draw.point((rng.randrange(size[0]), rng.randrange(size[1])), fill=rng.randrange(120, 256))
+            image = image.filter(ImageFilter.GaussianBlur(1))
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    return words
+
+
+def measure(files, strategy):
+    """OCRs the corpus with a strategy and returns its time, confidence and word recall."""
+    pdf_processor.ocr_settings.update(STRATEGIES[strategy])
+    escalated = pdf_processor.extraction_stats["pages_escalated"]
+    confidences = []
+    found = expected = 0
+    start = time.perf_counter()
+    for file_path, words in files:
+        pages = pdf_processor.extract_pages(file_path)
+        text = " ".join(page["text"] for page in pages).lower().split()
+        confidences.extend(page["confidence"] for page in pages if "confidence" in page)
+        remaining = {}
+        for word in text:
+            remaining[word] = remaining.get(word, 0) + 1
+        for word in words:
+            if remaining.get(word):
+                remaining[word] -= 1
+                found += 1
+        expected += len(words)
+    return {
+        "strategy": strategy,
+        "seconds": round(time.perf_counter() - start, 3),
+        "pages": len(confidences),
+        "escalated": pdf_processor.extraction_stats["pages_escalated"] - escalated,
+        "mean_confidence": round(sum(confidences) / len(confidences), 1) if confidences else 0.0,
+        "word_recall": round(found / expected, 3) if expected else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare adaptive-DPI OCR with fixed-resolution OCR.')
+    parser.add_argument('--files', type=int, default=20, help='Number of scanned PDF files.')
+    parser.add_argument('--pages', type=int, default=3, help='Number of pages per file.')
+    parser.add_argument('--poor', type=float, default=0.2,
+                        help='Share of faint, noisy pages in the corpus.')
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES),
+                        help='OCR strategies to benchmark.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the corpus generator.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for index in range(args.files):
+            file_path = os.path.join(directory, f"scan-{index}.pdf")
+            files.append((file_path, make_scanned_pdf(file_path, args.pages, args.poor, rng)))
+        for strategy in args.strategies:
+            print(json.dumps(measure(files, strategy)))
+
+
+if __name__ == '__main__':
+    main()
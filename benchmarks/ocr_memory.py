@@ -0,0 +1,104 @@
+"""
+Benchmark of the time and peak memory used to OCR scanned PDFs, against
+page count.
+
+Each measurement runs in a fresh process, so ru_maxrss reports the peak RSS
+of that extraction alone. The "whole" mode renders every page at once, like
+the original convert_from_path(file_path) call; the "window" and "disk"
+modes stream through windows of pages, in memory or through a temporary
+directory; the "parallel" mode spreads the windows over one OCR worker
+process per core.
+
+Requires poppler (pdftoppm) and tesseract.
+
+Usage:
+    python benchmarks/ocr_memory.py --pages 1 10 50 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = {
+    "whole": {"window": 100000, "to_disk": False, "max_memory_mb": 0, "ocr_workers": 1},
+    "window": {"window": 4, "to_disk": False, "max_memory_mb": 256, "ocr_workers": 1},
+    "disk": {"window": 4, "to_disk": True, "max_memory_mb": 256, "ocr_workers": 1},
+    "parallel": {"window": 4, "to_disk": True, "max_memory_mb": 256, "ocr_workers": os.cpu_count()},
+}
+
+
+def make_scanned_pdf(path, pages, dpi=200):
+    """
+    Writes a PDF made of A4 page images without a text layer.
+
+    :param path: Path of the PDF file to write.
+    :param pages: Number of pages.
+    :param dpi: Resolution of the page images.
+    """
+    from PIL import Image, ImageDraw
+
+    size = (int(8.27 * dpi), int(11.69 * dpi))
+    images = []
+    for number in range(1, pages + 1):
+        image = Image.new("L", size, 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(40):
+            draw.text((dpi, dpi + line * dpi // 4),
+                      f"Page {number} line {line}: scanned contract clause", fill=0)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def measure(file_path, mode):
+    """Extracts a file in this process and returns its time and peak memory."""
+    import pdf_processor
+
+    pdf_processor.raster_settings.update(MODES[mode])
+    start = time.perf_counter()
+    pages = pdf_processor.extract_pages(file_path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux.
+    return {
+        "pages": len(pages),
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_children_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure OCR time and peak RSS against page count.')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 50, 100],
+                        help='Page counts to benchmark.')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES),
+                        help='Rasterization modes to benchmark.')
+    parser.add_argument('--measure', nargs=2, metavar=('FILE', 'MODE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in args.pages:
+            file_path = os.path.join(directory, f"scan-{pages}.pdf")
+            make_scanned_pdf(file_path, pages)
+            for mode in args.modes:
+                output = subprocess.run(
+                    [sys.executable, __file__, '--measure', file_path, mode],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                result["mode"] = mode
+                print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark of the prompt layouts of document_analyzer.py.
+
+Analyzes the same synthetic documents with the per-field extractions in
+each prompt layout and prints a JSON report of the prompt tokens evaluated
+by the server, the prompt evaluation time and the wall time per document.
+In the shared-prefix layout, the five prompts of a document start with the
+same system message and document, so the server only evaluates the
+document once and reuses its KV cache for the other fields.
+
+By default the requests go to a stand-in server (see fake_ollama.py)
+simulating the per-slot prefix cache of the Ollama runner, at
+--token-latency seconds per evaluated prompt token. With --host, they go
+to a real Ollama server instead, which must have the model pulled and
+OLLAMA_NUM_PARALLEL=1 (or --max-in-flight 1 traffic only) for the calls of
+a document to land on the same slot.
+
+Usage:
+    python benchmarks/prompt_layout.py --count 10 --pages 1 3
+    python benchmarks/prompt_layout.py --host http://localhost:11434 --count 5 --keep-alive 30m
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+import document_analyzer
+from corpus import document_lines
+from fake_ollama import FakeOllamaServer
+
+
+def documents(count, page_counts, seed=0):
+    """
+    Generates the texts of synthetic documents.
+
+    :param count: Number of documents.
+    :param page_counts: Page counts to cycle through.
+    :param seed: Seed of the random generator.
+    :return: A list of document texts.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for index in range(count):
+        _, pages = document_lines(rng, page_counts[index % len(page_counts)])
+        texts.append("\n".join("\n".join(lines) for lines in pages))
+    return texts
+
+
+def run(layout, texts):
+    """
+    Analyzes documents in a prompt layout.
+
+    :param layout: One of document_analyzer.prompt_layouts.
+    :param texts: The document texts.
+    :return: The measurements, per document.
+    """
+    document_analyzer.prompt_layout = layout
+    metrics.event_totals.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        analyzed = sum(1 for text in texts if document_analyzer.analyze_document(text))
+    elapsed = time.perf_counter() - start
+
+    llm = metrics.summary().get("llm", {})
+    count = len(texts)
+    return {
+        "documents": count,
+        "analyzed": analyzed,
+        "llm_calls": llm.get("count", 0),
+        "seconds_per_document": round(elapsed / count, 4),
+        "prompt_tokens_per_document": round(llm.get("prompt_tokens", 0) / count, 1),
+        "prompt_eval_seconds_per_document": round(llm.get("prompt_eval_seconds", 0.0) / count, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the prompt-evaluation cost of the prompt layouts.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--count', type=int, default=10, help='Number of documents.')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 3], help='Page counts of the documents.')
+    parser.add_argument('--layouts', nargs='+', choices=document_analyzer.prompt_layouts,
+                        default=document_analyzer.prompt_layouts, help='Prompt layouts to compare.')
+    parser.add_argument('--host', type=str, default=None,
+                        help='Ollama server to benchmark. A stand-in server is used if omitted.')
+    parser.add_argument('--keep-alive', type=str, default='30m',
+                        help='How long the server keeps the model loaded after a request.')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Stand-in server: seconds spent on each request besides the prompt evaluation.')
+    parser.add_argument('--token-latency', type=float, default=0.0005,
+                        help='Stand-in server: seconds spent per evaluated prompt token.')
+    parser.add_argument('--output', type=str, default=None, help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    document_analyzer.keep_alive = args.keep_alive
+    texts = documents(args.count, args.pages)
+    report = {"config": vars(args), "layouts": {}}
+    with contextlib.ExitStack() as stack:
+        host = args.host
+        if host is None:
+            server = stack.enter_context(FakeOllamaServer(latency=args.latency, parallel=1,
+                                                          token_latency=args.token_latency))
+            host = server.url
+        document_analyzer.enable_llm_pool([host])
+        for layout in args.layouts:
+            report["layouts"][layout] = run(layout, texts)
+
+    if {"classic", "shared-prefix"} <= set(report["layouts"]):
+        classic, shared = report["layouts"]["classic"], report["layouts"]["shared-prefix"]
+        if classic["prompt_eval_seconds_per_document"]:
+            report["prompt_eval_reduction"] = round(
+                1 - shared["prompt_eval_seconds_per_document"] / classic["prompt_eval_seconds_per_document"], 3)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
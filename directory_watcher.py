@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify event masks, from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_event_header = struct.Struct("iIII")
+
+
+def _is_pdf(name):
+    return name.lower().endswith('.pdf')
+
+
+def scan_pdf_files(directory, recursive=False):
+    """
+    Lists the PDF files of a directory with os.scandir.
+
+    :param directory: The directory to scan.
+    :param recursive: If True, scan subdirectories recursively.
+    :return: A generator of PDF file paths.
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_file() and _is_pdf(entry.name):
+            yield entry.path
+        elif recursive and entry.is_dir(follow_symlinks=False):
+            yield from scan_pdf_files(entry.path, recursive)
+
+
+class InotifyWatcher:
+    """
+    Reports the PDF files written or moved into a directory, using the Linux
+    inotify API through ctypes. Waiting costs no CPU.
+    """
+
+    def __init__(self, directory, recursive=False):
+        """
+        :param directory: The directory to watch.
+        :param recursive: If True, also watch subdirectories, including new ones.
+        :raises OSError: If inotify is not available.
+        """
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directory = directory
+        self.recursive = recursive
+        self._directories = {}
+        self._watch(directory)
+        if recursive:
+            for root, subdirectories, _ in os.walk(directory):
+                for subdirectory in subdirectories:
+                    self._watch(os.path.join(root, subdirectory))
+
+    def _watch(self, directory):
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {directory}")
+        self._directories[wd] = directory
+
+    def wait(self, timeout=None):
+        """
+        Waits for files to be written to or moved into the directory.
+
+        :param timeout: Maximum number of seconds to wait, or None to wait forever.
+        :return: A list of the PDF file paths that changed (possibly empty).
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _event_header.unpack_from(data, offset)
+            offset += _event_header.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: fall back to a full scan.
+                paths.extend(scan_pdf_files(self.directory, self.recursive))
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if self.recursive:
+                    try:
+                        self._watch(path)
+                    except OSError:
+                        continue
+                    # Files may have landed before the watch was added.
+                    paths.extend(scan_pdf_files(path, recursive=True))
+            elif _is_pdf(name):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        """Stops watching."""
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Reports the PDF files added to or modified in a directory by scanning
+    it at a fixed interval. Used where inotify is not available.
+    """
+
+    def __init__(self, directory, recursive=False, interval=5.0):
+        """
+        :param directory: The directory to watch.
+        :param recursive: If True, also watch subdirectories.
+        :param interval: Number of seconds between two scans.
+        """
+        self.directory = directory
+        self.recursive = recursive
+        self.interval = interval
+        self._seen = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        seen = {}
+        for path in scan_pdf_files(self.directory, self.recursive):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def wait(self, timeout=None):
+        """
+        Waits for the next scan and reports the files that changed since the previous one.
+
+        :param timeout: Maximum number of seconds to wait, or None to wait for the next scan.
+        :return: A list of the PDF file paths that changed (possibly empty).
+        """
+        delay = self._next_scan - time.monotonic()
+        if timeout is not None and timeout < delay:
+            time.sleep(max(0, timeout))
+            return []
+        time.sleep(max(0, delay))
+        self._next_scan = time.monotonic() + self.interval
+        seen = self._scan()
+        changed = [path for path, fingerprint in seen.items() if self._seen.get(path) != fingerprint]
+        self._seen = seen
+        return changed
+
+    def close(self):
+        """Stops watching."""
+
+
+class Debouncer:
+    """
+    Holds back files until they have stopped changing, so files still being
+    written or copied are not processed half-way.
+    """
+
+    def __init__(self, settle=2.0):
+        """
+        :param settle: Number of seconds a file's size and modification time
+                       must stay unchanged before it is ready.
+        """
+        self.settle = settle
+        self._pending = {}
+
+    def add(self, path):
+        """Starts or restarts tracking a file."""
+        self._pending[path] = self._fingerprint(path)
+
+    @staticmethod
+    def _fingerprint(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def ready(self):
+        """
+        Returns the tracked files that are complete and stops tracking them.
+
+        :return: A list of file paths.
+        """
+        now = time.time_ns()
+        ready = []
+        for path, previous in list(self._pending.items()):
+            fingerprint = self._fingerprint(path)
+            if fingerprint is None:
+                # Deleted or moved away before settling.
+                del self._pending[path]
+            elif fingerprint != previous:
+                self._pending[path] = fingerprint
+            elif now - fingerprint[1] >= self.settle * 1e9:
+                del self._pending[path]
+                ready.append(path)
+        return ready
+
+    def next_check(self):
+        """
+        Returns the number of seconds until a tracked file may be ready, or
+        None if no file is tracked.
+        """
+        if not self._pending:
+            return None
+        now = time.time_ns()
+        delays = [(fingerprint[1] + self.settle * 1e9 - now) / 1e9
+                  for fingerprint in self._pending.values() if fingerprint]
+        return min(self.settle, max(0.05, min(delays, default=0.05)))
+
+
+def watch_pdf_files(input_directory, recursive=False, settle=2.0, poll_interval=5.0, on_idle=None,
+                    exclude=()):
+    """
+    Lists the PDF files of a directory, then the PDF files landing in it,
+    forever. Files are reported once their size and modification time have
+    been stable for settle seconds.
+
+    inotify is used when available; otherwise the directory is scanned
+    every poll_interval seconds.
+
+    :param input_directory: The directory to watch.
+    :param recursive: If True, watch subdirectories recursively.
+    :param settle: Number of seconds a file must stay unchanged before it is reported.
+    :param poll_interval: Number of seconds between two scans when polling.
+    :param on_idle: Optional function called before waiting for new files.
+    :param exclude: Directories whose files are ignored, such as an output
+                    directory inside the watched one.
+    :return: A generator of PDF file paths.
+    """
+    excluded = tuple(os.path.join(os.path.abspath(directory), '') for directory in exclude)
+
+    def track(path):
+        if not any(os.path.abspath(path).startswith(directory) for directory in excluded):
+            debouncer.add(path)
+
+    try:
+        watcher = InotifyWatcher(input_directory, recursive)
+    except (OSError, AttributeError) as e:
+        print(f"inotify unavailable ({str(e)}), polling {input_directory} every {poll_interval}s")
+        watcher = PollingWatcher(input_directory, recursive, poll_interval)
+
+    debouncer = Debouncer(settle)
+    for path in scan_pdf_files(input_directory, recursive):
+        track(path)
+    try:
+        while True:
+            yield from debouncer.ready()
+            timeout = debouncer.next_check()
+            if timeout is None and on_idle is not None:
+                on_idle()
+            for path in watcher.wait(timeout):
+                track(path)
+    finally:
+        watcher.close()
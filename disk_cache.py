@@ -0,0 +1,138 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    """
+    A persistent key/value cache stored in a SQLite database.
+
+    Values must be JSON serializable. When the total size of the stored
+    values exceeds max_bytes, the least recently used entries are evicted.
+    The total size is kept up to date by triggers, in the database itself, so
+    it needs no scan of the entries and stays right when several threads or
+    processes share the same cache file, which WAL mode allows.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        """
+        :param path: Path to the SQLite database file.
+        :param max_bytes: Maximum total size of the cached values, in bytes.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)"
+            )
+            self._connection.execute("INSERT OR IGNORE INTO totals (id, size) VALUES (0, 0)")
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                    UPDATE totals SET size = size + new.size WHERE id = 0;
+                END"""
+            )
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                    UPDATE totals SET size = size - old.size WHERE id = 0;
+                END"""
+            )
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+                    UPDATE totals SET size = size + new.size - old.size WHERE id = 0;
+                END"""
+            )
+
+    def get(self, key):
+        """
+        Returns the cached value for a key and marks it as recently used.
+
+        :param key: The cache key.
+        :return: The cached value or None if the key is not cached.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key, value, namespace=""):
+        """
+        Stores a value, evicting the least recently used entries if needed.
+
+        :param key: The cache key.
+        :param value: The JSON serializable value to store.
+        :param namespace: Label grouping related entries (e.g. the extracted field).
+        """
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete
+            # would not fire the delete trigger.
+            self._connection.execute(
+                """INSERT INTO entries (key, namespace, value, size, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET namespace = excluded.namespace, value = excluded.value,
+                    size = excluded.size, last_used = excluded.last_used""",
+                (key, namespace, data, len(data.encode("utf-8")), time.time()),
+            )
+            self._evict()
+
+    def size(self):
+        """
+        Returns the total size of the cached values.
+
+        :return: The size, in bytes.
+        """
+        with self._lock:
+            return self._size()
+
+    def _size(self):
+        return self._connection.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+
+    def _evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes."""
+        total = self._size()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        keys = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._connection.executemany("DELETE FROM entries WHERE key = ?", keys)
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._connection.close()
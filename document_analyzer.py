@@ -1,8 +1,17 @@
-import ollama
+import asyncio
+import hashlib
+import random
+import threading
 from datetime import datetime
 import time
 import json
 from colorama import Fore, Style
+import metrics
+from disk_cache import DiskCache
+from llm_pool import CircuitOpenError, LLMPool
+from prompt_compactor import compact_for_field
+from response_repair import repair_response
+from rule_extractor import pre_extract, rule_stats
 
 valid_types = {
     "facture": "A bill or invoice for goods or services",
@@ -14,29 +23,317 @@ valid_types = {
     "autres": "Any other type of document not fitting the above categories",
 }
 
+valid_recipients = ["Jérôme", "Pauline", "Grégoire", "OLTMANNS", "WAX"]
+
 ollamaModel = "Llama3.2"
 
+# Fields extracted for every document, in extraction order. Analysis is
+# aborted when one of the critical fields cannot be extracted.
+document_fields = ["subject", "date", "type", "emitter", "recipient"]
+critical_fields = ["subject", "date", "type"]
+
+# Running totals of LLM usage, updated by every call made through _chat().
+# Documents are analyzed by several threads, which update it under _stats_lock.
+llm_stats = {
+    "calls": 0,
+    "prompt_tokens": 0,
+    "calls_saved": 0,
+    "prompt_tokens_saved": 0,
+    "cache_hits": 0,
+    "type_model_hits": 0,
+}
+_stats_lock = threading.Lock()
+
+# Persistent cache of extraction results, see enable_llm_cache().
+llm_cache = None
+
+# Pool of Ollama hosts every request goes through, see enable_llm_pool().
+# Created on first use from the OLLAMA_HOSTS/OLLAMA_HOST environment when
+# not enabled explicitly.
+llm_pool = None
+
+# Local document type classifier, see load_type_model(). Its prediction
+# replaces the LLM call when its confidence reaches type_model_threshold.
+type_model = None
+type_model_threshold = 0.9
+
+# Maximum number of (estimated) tokens of document content put in each
+# prompt. None sends the whole document.
+prompt_token_budget = None
+
+# Delay before retrying a failed extraction: a random duration up to
+# backoff_base * 2 ** attempt seconds, capped at backoff_max, so retries
+# from concurrent extractions don't hit the server at the same time.
+retry_settings = {
+    "backoff_base": 0.5,
+    "backoff_max": 8.0,
+}
+
+# Layout of the extraction prompts, one of prompt_layouts:
+# - "classic": each field's prompt puts the document in the middle of its
+#   own system message and instructions;
+# - "shared-prefix": every prompt of a document starts with the same system
+#   message and the document, followed by the field's instructions, so the
+#   Ollama server reuses the evaluated prefix (its KV cache) across the calls
+#   for a document instead of evaluating the document again for each field.
+prompt_layouts = ["classic", "shared-prefix"]
+prompt_layout = "classic"
+
+SHARED_SYSTEM_PROMPT = (
+    "You are an expert document analyzer. You will be asked to extract pieces of information "
+    "from the document below, one at a time, using the provided functions."
+)
+
+# Where the classic prompts embed the document.
+_DOCUMENT_SLOT = "Now, analyze this document content:\n\n{}\n\n"
+
+# How long the Ollama server keeps the model loaded after a request (e.g.
+# "30m", or -1 to keep it loaded). None uses the server default.
+keep_alive = None
+
+
+def _chat(messages, tools, field=None, usage=None):
+    """
+    Sends a chat request to the Ollama model and records its usage.
+
+    :param messages: The chat messages to send.
+    :param tools: The tool definitions the model may call.
+    :param field: The extracted field, to label the recorded metrics.
+    :param usage: Optional dictionary of "calls" and "prompt_tokens" the
+                  usage of the call is also added to.
+    :return: The raw Ollama response.
+    """
+    start = time.perf_counter()
+    response = _pool().chat(model=ollamaModel, messages=messages, tools=tools, keep_alive=keep_alive)
+    calls, prompt_tokens = _record_usage(response, field, time.perf_counter() - start)
+    if usage is not None:
+        usage["calls"] += calls
+        usage["prompt_tokens"] += prompt_tokens
+    return response
+
+
+async def _achat(client, messages, tools, field=None):
+    """
+    Sends a chat request asynchronously and records its usage.
+
+    :param client: An ollama.AsyncClient to send the request with, or None
+                   to send it through the pool, on its event loop.
+    :param messages: The chat messages to send.
+    :param tools: The tool definitions the model may call.
+    :param field: The extracted field, to label the recorded metrics.
+    :return: The raw Ollama response.
+    """
+    start = time.perf_counter()
+    chat = client.chat if client is not None else _pool().achat
+    response = await chat(model=ollamaModel, messages=messages, tools=tools, keep_alive=keep_alive)
+    _record_usage(response, field, time.perf_counter() - start)
+    return response
+
+
+def _pool():
+    """Returns the pool of Ollama hosts, creating the default one on first use."""
+    global llm_pool
+    if llm_pool is None:
+        llm_pool = LLMPool()
+    return llm_pool
+
+
+def _compact(field, content):
+    """Compacts the document content to the prompt token budget, for a field."""
+    return compact_for_field(content, prompt_token_budget, field)
+
+
+def _record_usage(response, field=None, seconds=0.0):
+    """
+    Adds the usage reported by an Ollama response to llm_stats and records
+    it as an "llm" metrics event. Ollama reports its durations in nanoseconds.
+
+    :return: The number of calls and prompt tokens used, (1, prompt_tokens).
+    """
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    with _stats_lock:
+        llm_stats["calls"] += 1
+        llm_stats["prompt_tokens"] += prompt_tokens
+    metrics.record(
+        "llm",
+        field=field,
+        seconds=round(seconds, 6),
+        prompt_tokens=prompt_tokens,
+        eval_tokens=response.get("eval_count") or 0,
+        load_seconds=(response.get("load_duration") or 0) / 1e9,
+        prompt_eval_seconds=(response.get("prompt_eval_duration") or 0) / 1e9,
+        eval_seconds=(response.get("eval_duration") or 0) / 1e9,
+    )
+    return 1, prompt_tokens
+
+
+def _tool_arguments(response):
+    """Returns the arguments of the first tool call in an Ollama response."""
+    return response["message"]["tool_calls"][0]["function"]["arguments"]
+
+
+def _cache_key(field, request):
+    """
+    Builds the LLM cache key for a request.
+
+    The key covers the model, the field, the tool schema and the rendered
+    prompt, so editing one extractor's prompt only invalidates its entries.
+    """
+    prompt = json.dumps(request["messages"], ensure_ascii=False, sort_keys=True)
+    tools = json.dumps(request["tools"], ensure_ascii=False, sort_keys=True)
+    return "|".join([
+        ollamaModel,
+        field,
+        hashlib.sha256(tools.encode("utf-8")).hexdigest(),
+        hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+    ])
+
+
+def _extract(field, request, parse=_tool_arguments, usage=None):
+    """
+    Sends an extraction request, answering it from the LLM cache when possible.
+
+    :param field: The extracted field, or "all" for the combined extraction.
+    :param request: The chat request (messages and tools) to send.
+    :param parse: Function extracting the tool arguments from the response.
+    :param usage: Optional dictionary the usage of the call is added to, see _chat().
+    :return: The parsed tool arguments.
+    """
+    key = _cache_key(field, request) if llm_cache else None
+    if key:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            with _stats_lock:
+                llm_stats["cache_hits"] += 1
+            metrics.record("llm_cache_hit", field=field)
+            return cached
+
+    response = _chat(field=field, usage=usage, **request)
+    info = parse(repair_response(response, request["tools"][0], field))
+    if key:
+        llm_cache.put(key, info, namespace=field)
+    return info
+
+
+async def _extract_async(client, field, request, parse=_tool_arguments):
+    """Asynchronous counterpart of _extract, sending the request through client."""
+    key = _cache_key(field, request) if llm_cache else None
+    if key:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            with _stats_lock:
+                llm_stats["cache_hits"] += 1
+            metrics.record("llm_cache_hit", field=field)
+            return cached
+
+    response = await _achat(client, field=field, **request)
+    info = parse(repair_response(response, request["tools"][0], field))
+    if key:
+        llm_cache.put(key, info, namespace=field)
+    return info
+
+
+def enable_llm_cache(path, max_bytes=256 * 1024 * 1024):
+    """
+    Enables the persistent LLM response cache.
+
+    :param path: Path to the SQLite cache file.
+    :param max_bytes: Maximum size of the cached responses, in bytes.
+    """
+    global llm_cache
+    llm_cache = DiskCache(path, max_bytes)
+
 
-def retry_extraction(extraction_func, content, max_retries=3):
+def enable_llm_pool(hosts=None, connections=8):
     """
-    Generic retry function for extractions.
+    Sends the LLM requests to a pool of Ollama hosts, balanced by number of
+    outstanding requests.
+
+    :param hosts: List of Ollama host URLs, defaults to the OLLAMA_HOSTS or
+                  OLLAMA_HOST environment variable.
+    :param connections: Maximum number of pooled connections per host.
+    :return: The LLMPool.
+    """
+    global llm_pool
+    llm_pool = LLMPool(hosts, connections)
+    return llm_pool
+
+
+def load_type_model(path, threshold=0.9):
+    """
+    Loads the local document type classifier trained with type_classifier.py.
+
+    :param path: Path to the model file.
+    :param threshold: Minimum confidence for a prediction to replace the LLM call.
+    """
+    global type_model, type_model_threshold
+    from type_classifier import TypeClassifier
+
+    type_model = TypeClassifier.load(path)
+    type_model_threshold = threshold
+
+
+def validate_field(field, value):
+    """
+    Checks that an extracted value is usable for the given field.
+
+    :param field: The field name (one of document_fields).
+    :param value: The extracted value.
+    :return: True if the value is valid, False otherwise.
+    """
+    if not isinstance(value, str) or not value.strip():
+        return False
+    if field == "date":
+        try:
+            datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            return False
+    elif field == "type":
+        return value in valid_types
+    elif field == "recipient":
+        return value in valid_recipients
+    return True
+
+
+def _backoff(attempt):
+    """Returns the jittered delay before the retry following a failed attempt, in seconds."""
+    ceiling = min(retry_settings["backoff_max"], retry_settings["backoff_base"] * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def retry_extraction(extraction_func, content, max_retries=3, usage=None):
+    """
+    Generic retry function for extractions, waiting a jittered, exponentially
+    growing delay between attempts. Malformed responses are repaired before
+    they count as failures (see response_repair.py), and attempts stop as
+    soon as the circuit breaker reports Ollama unreachable.
 
     :param extraction_func: The extraction function to retry.
     :param content: The document content to extract from.
     :param max_retries: Maximum number of retry attempts (default is 3).
+    :param usage: Optional dictionary the usage of every attempt is added to,
+                  passed on to the extraction function.
     :return: Extracted information or None if all attempts fail.
     """
     for attempt in range(max_retries):
         try:
-            result = extraction_func(content)
+            if usage is None:
+                result = extraction_func(content)
+            else:
+                result = extraction_func(content, usage=usage)
             return result
         except Exception as e:
+            field = extraction_func.__name__.removeprefix("extract_")
+            metrics.record("retry", field=field, error=type(e).__name__)
             print(
                 f"{Fore.YELLOW}Error in {extraction_func.__name__} (Attempt {
                     attempt + 1}/{max_retries}): {str(e)}{Style.RESET_ALL}"
             )
+            if isinstance(e, CircuitOpenError):
+                break
             if attempt < max_retries - 1:
                 print(f"{Fore.YELLOW}Retrying ...{Style.RESET_ALL}")
+                time.sleep(_backoff(attempt))
 
     print(
         f"{Fore.RED}All retry attempts failed for {
@@ -45,10 +342,9 @@ def retry_extraction(extraction_func, content, max_retries=3):
     return None
 
 
-def extract_subject(content):
-    """Extracts the subject from the document content."""
-    response = ollama.chat(
-        model=ollamaModel,
+def subject_request(content):
+    """Builds the chat request used to extract the subject."""
+    return dict(
         messages=[
             {
                 "role": "system",
@@ -104,14 +400,15 @@ Provide your extraction using the push_extracted_date function.""",
         ],
     )
 
-    # return json.loads(response['message']['tool_calls'][0]['function']['arguments'])
-    return response["message"]["tool_calls"][0]["function"]["arguments"]
+
+def extract_subject(content, usage=None):
+    """Extracts the subject from the document content."""
+    return _extract("subject", build_request("subject", content), usage=usage)
 
 
-def extract_date(content):
-    """Extracts the date from the document content."""
-    response = ollama.chat(
-        model=ollamaModel,
+def date_request(content):
+    """Builds the chat request used to extract the date."""
+    return dict(
         messages=[
             {
                 "role": "system",
@@ -172,18 +469,19 @@ Provide your extraction using the push_extracted_date function.""",
         ],
     )
 
-    # return json.loads(response['message']['tool_calls'][0]['function']['arguments'])
-    return response["message"]["tool_calls"][0]["function"]["arguments"]
 
+def extract_date(content, usage=None):
+    """Extracts the date from the document content."""
+    return _extract("date", build_request("date", content), usage=usage)
 
-def extract_type(content):
-    """Extracts the document type from the content."""
+
+def type_request(content):
+    """Builds the chat request used to extract the document type."""
     type_descriptions = "\n".join(
         [f"- {type}: {description}" for type, description in valid_types.items()]
     )
 
-    response = ollama.chat(
-        model=ollamaModel,
+    return dict(
         messages=[
             {
                 "role": "system",
@@ -249,25 +547,23 @@ Provide your classification using the push_extracted_type function.""",
         ],
     )
 
-    # extracted_info = json.loads(
-    #     response['message']['tool_calls'][0]['function']['arguments'])
-    extracted_info = response["message"]["tool_calls"][0]["function"]["arguments"]
 
-    print(
-        f"{Fore.CYAN}Extracted type:{Style.RESET_ALL} {
-            extracted_info['type']} ({valid_types[extracted_info['type']]})"
-    )
-    print(
-        f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {
-            extracted_info['reasoning']}"
-    )
+def _type_arguments(response):
+    """Returns the extracted type from a response, rejecting unknown types."""
+    extracted_info = _tool_arguments(response)
+    if extracted_info["type"] not in valid_types:
+        raise ValueError(f"Invalid document type: {extracted_info['type']}")
     return extracted_info
 
 
-def extract_emitter(content):
-    """Extracts the emitter from the document content."""
-    response = ollama.chat(
-        model=ollamaModel,
+def extract_type(content, usage=None):
+    """Extracts the document type from the content."""
+    return _extract("type", build_request("type", content), _type_arguments, usage=usage)
+
+
+def emitter_request(content):
+    """Builds the chat request used to extract the emitter."""
+    return dict(
         messages=[
             {
                 "role": "system",
@@ -330,14 +626,15 @@ Provide your extraction using the push_extracted_emitter function.""",
         ],
     )
 
-    # return json.loads(response['message']['tool_calls'][0]['function']['arguments'])
-    return response["message"]["tool_calls"][0]["function"]["arguments"]
 
+def extract_emitter(content, usage=None):
+    """Extracts the emitter from the document content."""
+    return _extract("emitter", build_request("emitter", content), usage=usage)
 
-def extract_recipient(content):
-    """Extracts the recipient from the document content."""
-    response = ollama.chat(
-        model=ollamaModel,
+
+def recipient_request(content):
+    """Builds the chat request used to extract the recipient."""
+    return dict(
         messages=[
             {
                 "role": "system",
@@ -383,13 +680,7 @@ Provide your extraction using the push_extracted_recipient function.""",
                             "recipient": {
                                 "type": "string",
                                 "description": "The name of the person or organization who received the document.",
-                                "enum": [
-                                    "Jérôme",
-                                    "Pauline",
-                                    "Grégoire",
-                                    "OLTMANNS",
-                                    "WAX",
-                                ],
+                                "enum": valid_recipients,
                             },
                             "confidence": {
                                 "type": "string",
@@ -408,113 +699,428 @@ Provide your extraction using the push_extracted_recipient function.""",
         ],
     )
 
-    # return json.loads(response['message']['tool_calls'][0]['function']['arguments'])
-    return response["message"]["tool_calls"][0]["function"]["arguments"]
 
+def extract_recipient(content, usage=None):
+    """Extracts the recipient from the document content."""
+    return _extract("recipient", build_request("recipient", content), usage=usage)
+
+
+def combined_request(content):
+    """Builds the chat request used to extract every document field at once."""
+    type_descriptions = "\n".join(
+        [f"- {type}: {description}" for type, description in valid_types.items()]
+    )
+
+    return dict(
+        messages=[
+            {
+                "role": "system",
+                "content": "You are an expert document analyzer. Your task is to accurately extract the subject, production date, type, emitter and recipient of a document from the given content.",
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze the following document content and extract all of the information below.
+
+Instructions:
+1. Carefully read through the entire document.
+2. subject: the title or subject of the document. If there's no clear title, make one that summarizes in short terms the nature of the document.
+3. date: the date of document production, formatted as YYYY-MM-DD. If the day is uncertain, use the first day of the month (01). If the month is uncertain, use January (01).
+4. type: the most appropriate document type from the list below. If no type fits well, use 'autres'.
+5. emitter: the person or organization who sent or created the document, typically found in letterheads, signatures or contact information.
+6. recipient: the person who received the document. It must be one of the following: {", ".join(valid_recipients)}.
+7. Provide your reasoning for the extracted information.
+
+Document Types:
+{type_descriptions}
 
-def analyze_document(content, max_retries=3):
+Example:
+Input: "Facture n 2329 - 01/02/2024 - Loyer mensuel fèvr - Studio - SCI Les Lilas - M. OLTMANNS"
+Output: {{"subject": "Loyer Mensuel Studio", "date": "2024-02-01", "type": "facture",
+    "emitter": "SCI Les Lilas", "recipient": "OLTMANNS",
+    "reasoning": "Rent invoice issued by SCI Les Lilas to Mr. OLTMANNS on 01/02/2024."}}
+
+Now, analyze this document content:
+
+{content}
+
+Provide your extraction using the push_extracted_document function.""",
+            },
+        ],
+        tools=[
+            {
+                "type": "function",
+                "function": {
+                    "name": "push_extracted_document",
+                    "description": "Push all extracted document information and reasoning",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "subject": {
+                                "type": "string",
+                                "description": "The title or subject of the document.",
+                            },
+                            "date": {
+                                "type": "string",
+                                "description": "The date of the document in YYYY-MM-DD format.",
+                            },
+                            "type": {
+                                "type": "string",
+                                "description": "The type of document.",
+                                "enum": list(valid_types.keys()),
+                            },
+                            "emitter": {
+                                "type": "string",
+                                "description": "The name of the person or organization who sent or created the document.",
+                            },
+                            "recipient": {
+                                "type": "string",
+                                "description": "The name of the person or organization who received the document.",
+                                "enum": valid_recipients,
+                            },
+                            "reasoning": {
+                                "type": "string",
+                                "description": "Explanation for the extracted information.",
+                            },
+                        },
+                        "required": document_fields + ["reasoning"],
+                    },
+                },
+            }
+        ],
+    )
+
+
+def extract_all(content, usage=None):
+    """Extracts every document field from the content with a single call."""
+    return _extract("all", build_request("all", content), usage=usage)
+
+
+field_extractors = {
+    "subject": extract_subject,
+    "date": extract_date,
+    "type": extract_type,
+    "emitter": extract_emitter,
+    "recipient": extract_recipient,
+}
+
+field_requests = {
+    "subject": subject_request,
+    "date": date_request,
+    "type": type_request,
+    "emitter": emitter_request,
+    "recipient": recipient_request,
+    "all": combined_request,
+}
+
+
+def build_request(field, content):
     """
-    Analyzes the document content to extract required information using the Llama model.
+    Builds the chat request extracting a field, or every field for "all",
+    in the configured prompt layout.
+
+    In the shared-prefix layout, the field's system message and instructions
+    move after the document, in a second user message: the Llama 3.2 chat
+    template renders the tools in the last user message, so the rendered
+    prompts of a document share everything up to the end of the document.
 
+    :param field: The field to extract (one of document_fields), or "all".
     :param content: The text content of the document.
-    :param max_retries: Maximum number of retry attempts for each extraction (default is 3).
-    :return: A dictionary containing extracted information or None if critical extractions fail.
+    :return: The chat request (messages and tools).
     """
-    extracted_info = {}
+    if prompt_layout != "shared-prefix":
+        return field_requests[field](_compact(field, content))
+
+    placeholder = "\0document\0"
+    request = field_requests[field](placeholder)
+    system, user = request["messages"]
+    instructions, closing = user["content"].split(_DOCUMENT_SLOT.format(placeholder))
+    instructions = instructions.replace("the following document content", "the document content above")
+    # The document is compacted the same way for every field, so it stays identical.
+    return dict(request, messages=[
+        {"role": "system", "content": SHARED_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Document content:\n\n{_compact('all', content)}"},
+        {"role": "user", "content": f"{system['content']}\n\n{instructions}{closing}"},
+    ])
+
+
+field_labels = {
+    "subject": "subject",
+    "date": "date",
+    "type": "document type",
+    "emitter": "emitter",
+    "recipient": "recipient",
+}
 
-    # Extract subject with retry
-    subject_info = retry_extraction(extract_subject, content, max_retries)
-    if subject_info:
-        extracted_info["subject"] = subject_info["subject"]
-        print(
-            f"{Fore.GREEN}Subject extracted:{
-                Style.RESET_ALL} {subject_info['subject']}"
-        )
-        print(
-            f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {
-                subject_info['reasoning']}"
-        )
-    else:
-        print(
-            f"{Fore.RED}Failed to extract subject after all retries. Aborting analysis.{
-                Style.RESET_ALL}"
-        )
-        return None
 
-    # Extract date with retry
-    date_info = retry_extraction(extract_date, content, max_retries)
-    if date_info:
-        extracted_info["date"] = date_info["date"]
+def _print_field(field, info):
+    """Prints an extracted field along with its confidence and reasoning."""
+    if field == "type":
         print(
-            f"{Fore.GREEN}Date extracted:{
-                Style.RESET_ALL} {date_info['date']}"
+            f"{Fore.CYAN}Extracted type:{Style.RESET_ALL} {
+                info['type']} ({valid_types[info['type']]})"
         )
         print(
             f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {
-                date_info['reasoning']}"
+                info['reasoning']}"
         )
-    else:
-        print(
-            f"{Fore.RED}Failed to extract date after all retries. Aborting analysis.{
-                Style.RESET_ALL}"
-        )
-        return None
+        return
+    print(
+        f"{Fore.GREEN}{field.capitalize()} extracted:{Style.RESET_ALL} {info[field]}"
+    )
+    if "confidence" in info:
+        print(f"{Fore.CYAN}Confidence:{Style.RESET_ALL} {info['confidence']}")
+    print(f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {info['reasoning']}")
 
-    # Extract type with retry
-    type_info = retry_extraction(extract_type, content, max_retries)
-    if type_info:
-        extracted_info["type"] = type_info["type"]
-    else:
-        print(
-            f"{Fore.RED}Failed to extract document type after all retries. Aborting analysis.{
-                Style.RESET_ALL}"
-        )
-        return None
 
-    # Extract emitter with retry
-    emitter_info = retry_extraction(extract_emitter, content, max_retries)
-    if emitter_info:
-        extracted_info["emitter"] = emitter_info["emitter"]
-        print(
-            f"{Fore.GREEN}Emitter extracted:{
-                Style.RESET_ALL} {emitter_info['emitter']}"
-        )
-        print(
-            f"{Fore.CYAN}Confidence:{Style.RESET_ALL} {
-                emitter_info['confidence']}"
-        )
+def _print_field_failure(field):
+    """Prints the failure message for a field that could not be extracted."""
+    if field in critical_fields:
         print(
-            f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {
-                emitter_info['reasoning']}"
+            f"{Fore.RED}Failed to extract {field_labels[field]} after all retries. Aborting analysis.{Style.RESET_ALL}"
         )
     else:
         print(
-            f"{Fore.YELLOW}Failed to extract emitter after all retries. Continuing with partial information.{
-                Style.RESET_ALL}"
+            f"{Fore.YELLOW}Failed to extract {field_labels[field]} after all retries. Continuing with partial information.{Style.RESET_ALL}"
         )
 
-    # Extract recipient with retry
-    recipient_info = retry_extraction(extract_recipient, content, max_retries)
-    if recipient_info:
-        extracted_info["recipient"] = recipient_info["recipient"]
-        print(
-            f"{Fore.GREEN}Recipient extracted:{
-                Style.RESET_ALL} {recipient_info['recipient']}"
-        )
-        print(
-            f"{Fore.CYAN}Confidence:{Style.RESET_ALL} {
-                recipient_info['confidence']}"
-        )
+
+def extract_field(field, content, max_retries=3, usage=None):
+    """
+    Extracts a single field with its dedicated extractor.
+
+    :param field: The field to extract (one of document_fields).
+    :param content: The text content of the document.
+    :param max_retries: Maximum number of retry attempts (default is 3).
+    :param usage: Optional dictionary the usage of the calls is added to, see _chat().
+    :return: The extracted value or None if the extraction failed.
+    """
+    info = retry_extraction(field_extractors[field], content, max_retries, usage)
+    if info:
+        _print_field(field, info)
+        return info[field]
+    _print_field_failure(field)
+    return None
+
+
+async def extract_field_async(client, semaphore, field, content, max_retries=3):
+    """
+    Extracts a single field asynchronously, with retries.
+
+    :param client: An ollama.AsyncClient to send requests with, or None to use the pool.
+    :param semaphore: Semaphore bounding the number of in-flight requests.
+    :param field: The field to extract (one of document_fields).
+    :param content: The text content of the document.
+    :param max_retries: Maximum number of retry attempts (default is 3).
+    :return: A (field, value) tuple, value being None if the extraction failed.
+    """
+    request = build_request(field, content)
+    parse = _type_arguments if field == "type" else _tool_arguments
+    name = field_extractors[field].__name__
+
+    for attempt in range(max_retries):
+        try:
+            async with semaphore:
+                info = await _extract_async(client, field, request, parse)
+            _print_field(field, info)
+            return field, info[field]
+        except Exception as e:
+            metrics.record("retry", field=field, error=type(e).__name__)
+            print(
+                f"{Fore.YELLOW}Error in {name} (Attempt {attempt + 1}/{max_retries}): {str(e)}{Style.RESET_ALL}"
+            )
+            if isinstance(e, CircuitOpenError):
+                break
+            if attempt < max_retries - 1:
+                print(f"{Fore.YELLOW}Retrying ...{Style.RESET_ALL}")
+                await asyncio.sleep(_backoff(attempt))
+
+    print(f"{Fore.RED}All retry attempts failed for {name}.{Style.RESET_ALL}")
+    _print_field_failure(field)
+    return field, None
+
+
+def _analyze_combined(content, max_retries=3, known=None):
+    """
+    Extracts all fields with a single LLM call, then re-asks only for the
+    fields that came back missing or invalid.
+
+    :param content: The text content of the document.
+    :param max_retries: Maximum number of retry attempts for each extraction.
+    :param known: Fields already resolved, which take precedence over the LLM.
+    :return: A dictionary containing extracted information or None if critical extractions fail.
+    """
+    # Usage of this document's calls only, as other documents are analyzed
+    # concurrently.
+    usage = {"calls": 0, "prompt_tokens": 0}
+    combined_info = retry_extraction(extract_all, content, max_retries, usage) or {}
+    # The document dominates the prompt, so the combined prompt size is used
+    # as the estimated cost of each per-field call it replaces.
+    combined_calls = usage["calls"]
+    tokens_per_call = usage["prompt_tokens"] // combined_calls if combined_calls else 0
+
+    known = known or {}
+    extracted_info = {}
+    for field in document_fields:
+        value = combined_info.get(field)
+        if field in known:
+            extracted_info[field] = known[field]
+        elif validate_field(field, value):
+            extracted_info[field] = value
+            print(f"{Fore.GREEN}{field.capitalize()} extracted:{Style.RESET_ALL} {value}")
+        elif value:
+            print(
+                f"{Fore.YELLOW}Invalid {field_labels[field]} in combined extraction: {value}{Style.RESET_ALL}"
+            )
+    if "reasoning" in combined_info:
+        print(f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {combined_info['reasoning']}")
+
+    for field in document_fields:
+        if field in extracted_info:
+            continue
+        value = extract_field(field, content, max_retries, usage)
+        if value is not None:
+            extracted_info[field] = value
+        elif field in critical_fields:
+            return None
+
+    # Nothing is saved when the combined extraction was answered from the
+    # LLM cache, and re-asks and retries can cost more than they saved.
+    if combined_calls:
+        calls_saved = max(0, len(document_fields) - usage["calls"])
+        tokens_saved = max(0, tokens_per_call * len(document_fields) - usage["prompt_tokens"])
+        with _stats_lock:
+            llm_stats["calls_saved"] += calls_saved
+            llm_stats["prompt_tokens_saved"] += tokens_saved
         print(
-            f"{Fore.CYAN}Reasoning:{Style.RESET_ALL} {
-                recipient_info['reasoning']}"
+            f"{Fore.CYAN}Combined extraction saved {calls_saved} LLM calls and ~{tokens_saved} prompt tokens.{Style.RESET_ALL}"
         )
+    return extracted_info
+
+
+def _resolve_with_rules(content):
+    """
+    Resolves the obvious fields of a document with deterministic rules.
+
+    :param content: The text content of the document.
+    :return: A dictionary of the fields resolved with high confidence.
+    """
+    known = {
+        field: value
+        for field, value in pre_extract(content, valid_recipients).items()
+        if validate_field(field, value)
+    }
+    for field, value in known.items():
+        print(f"{Fore.GREEN}{field.capitalize()} resolved by rules:{Style.RESET_ALL} {value}")
+    return known
+
+
+def analyze_document(content, max_retries=3, combined=False, max_in_flight=1, rules=False):
+    """
+    Analyzes the document content to extract required information using the Llama model.
+
+    :param content: The text content of the document.
+    :param max_retries: Maximum number of retry attempts for each extraction (default is 3).
+    :param combined: If True, extract all fields with a single LLM call and
+                     re-ask only for missing or invalid fields.
+    :param max_in_flight: If greater than 1, run the per-field extractions
+                          concurrently with at most this many in-flight requests.
+    :param rules: If True, resolve the obvious date, type and recipient with
+                  deterministic rules and only ask the LLM for the rest.
+    :return: A dictionary containing extracted information or None if critical extractions fail.
+    """
+    known = _resolve_with_rules(content) if rules else {}
+    # Types from the local model are counted in llm_stats["type_model_hits"].
+    resolved_by_rules = len(known)
+    if type_model is not None and "type" not in known:
+        predicted, confidence = type_model.predict(content)
+        if predicted in valid_types and confidence >= type_model_threshold:
+            known["type"] = predicted
+            with _stats_lock:
+                llm_stats["type_model_hits"] += 1
+            print(
+                f"{Fore.GREEN}Type classified locally:{Style.RESET_ALL} {predicted} ({confidence:.0%})"
+            )
+
+    if combined:
+        extracted_info = _analyze_combined(content, max_retries, known)
+        if extracted_info is None:
+            return None
+        return _validate_extracted_info(extracted_info)
+
+    # The per-field extractions skip the fields already resolved.
+    rule_stats["calls_avoided"] += resolved_by_rules
+    if max_in_flight > 1:
+        # On the pool's event loop, so cancelling the outstanding calls aborts their requests.
+        return _pool().run(analyze_document_async(content, max_retries, max_in_flight, known=known))
     else:
-        print(
-            f"{Fore.YELLOW}Failed to extract recipient after all retries. Continuing with partial information.{
-                Style.RESET_ALL}"
+        extracted_info = {}
+        for field in document_fields:
+            if field in known:
+                extracted_info[field] = known[field]
+                continue
+            value = extract_field(field, content, max_retries)
+            if value is not None:
+                extracted_info[field] = value
+            elif field in critical_fields:
+                return None
+
+    return _validate_extracted_info(extracted_info)
+
+
+async def analyze_document_async(content, max_retries=3, max_in_flight=5, client=None, known=None):
+    """
+    Analyzes the document content like analyze_document, but issues the
+    per-field extractions concurrently.
+
+    Outstanding extractions are cancelled as soon as a critical field fails
+    after all its retries.
+
+    :param content: The text content of the document.
+    :param max_retries: Maximum number of retry attempts for each extraction (default is 3).
+    :param max_in_flight: Maximum number of concurrent requests to the Ollama server (default is 5).
+    :param client: An ollama.AsyncClient to use instead of the pool of Ollama hosts.
+    :param known: Fields already resolved, which are not asked to the LLM.
+    :return: A dictionary containing extracted information or None if critical extractions fail.
+    """
+    known = known or {}
+    semaphore = asyncio.Semaphore(max_in_flight)
+    pending = {
+        asyncio.create_task(
+            extract_field_async(client, semaphore, field, content, max_retries)
         )
+        for field in document_fields
+        if field not in known
+    }
+
+    values = dict(known)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                field, value = task.result()
+                if value is None and field in critical_fields:
+                    return None
+                values[field] = value
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    extracted_info = {
+        field: values[field] for field in document_fields if values[field] is not None
+    }
+    return _validate_extracted_info(extracted_info)
+
+
+def _validate_extracted_info(extracted_info):
+    """
+    Validates the extracted information and prints the final result.
 
+    :param extracted_info: The dictionary of extracted fields.
+    :return: The extracted information, or None if validation fails.
+    """
     try:
         # Validate date format
         datetime.strptime(extracted_info["date"], "%Y-%m-%d")
@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+
+# File name of the index in the output directory.
+INDEX_FILE_NAME = ".pdf_sorter_duplicates.sqlite"
+
+# MinHash signature length, split into LSH bands of rows_per_band values.
+# With 16 bands of 8 rows, documents sharing ~70% of their shingles are
+# very likely to share a bucket; candidates are then checked against the
+# similarity threshold.
+num_permutations = 128
+rows_per_band = 8
+
+# Number of words per shingle.
+shingle_size = 5
+
+# Running totals of the duplicates found.
+duplicate_stats = {
+    "exact": 0,
+    "near": 0,
+}
+
+_prime = (1 << 31) - 1
+_word = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=None)
+def _permutations():
+    """Returns the (a, b) coefficients of the hash permutations, NumPy being loaded on first use."""
+    import numpy as np
+
+    generator = np.random.default_rng(20240501)
+    return (generator.integers(1, _prime, num_permutations, dtype=np.uint64),
+            generator.integers(0, _prime, num_permutations, dtype=np.uint64))
+
+
+def minhash_signature(text):
+    """
+    Computes the MinHash signature of the word shingles of a text.
+
+    :param text: The document text.
+    :return: A NumPy array of num_permutations values, or None for a text without words.
+    """
+    import numpy as np
+
+    words = _word.findall(text.lower())
+    if not words:
+        return None
+    size = min(shingle_size, len(words))
+    shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles)) % _prime
+    # (a * x + b) mod p for every permutation and shingle, minimum per
+    # permutation, by chunks of shingles to bound memory on long documents.
+    a, b = _permutations()
+    signature = np.full(num_permutations, _prime, dtype=np.uint64)
+    for start in range(0, len(hashes), 4096):
+        chunk = hashes[start:start + 4096]
+        np.minimum(signature, ((np.outer(a, chunk) + b[:, None]) % _prime).min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def similarity(signature, other):
+    """
+    Estimates the Jaccard similarity of two documents from their signatures.
+
+    :return: The share of equal signature values, between 0 and 1.
+    """
+    return float((signature == other).mean())
+
+
+class DuplicateIndex:
+    """
+    A persistent index of the analyzed documents, stored in a SQLite
+    database, finding byte-identical files by content hash and
+    near-duplicate texts by MinHash locality-sensitive hashing.
+    """
+
+    def __init__(self, path, threshold=0.9):
+        """
+        :param path: Path to the SQLite database file, or ":memory:".
+        :param threshold: Minimum estimated similarity of near-duplicate texts.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                doc_info TEXT NOT NULL,
+                signature BLOB,
+                destination TEXT
+            )"""
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS bands (band INTEGER, bucket BLOB, hash TEXT)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket)"
+        )
+
+    @staticmethod
+    def _bands(signature):
+        for band in range(num_permutations // rows_per_band):
+            yield band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes()
+
+    @staticmethod
+    def _entry(row):
+        content_hash, path, doc_info, destination = row
+        return {"hash": content_hash, "path": path, "doc_info": json.loads(doc_info),
+                "destination": destination}
+
+    def find_exact(self, content_hash):
+        """
+        Finds an analyzed document with the same content hash.
+
+        :param content_hash: The SHA-256 hash of the file.
+        :return: A dictionary with the hash, path, doc_info and destination of the original, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hash, path, doc_info, destination FROM documents WHERE hash = ?",
+                (content_hash,)).fetchone()
+        return self._entry(row) if row else None
+
+    def find_similar(self, signature):
+        """
+        Finds the analyzed document most similar to a signature, above the threshold.
+
+        :param signature: The MinHash signature of the document text.
+        :return: A (original, similarity) tuple, original being a dictionary
+                 like find_exact returns, or (None, 0).
+        """
+        if signature is None:
+            return None, 0.0
+        import numpy as np
+
+        with self._lock:
+            candidates = set()
+            for band, bucket in self._bands(signature):
+                candidates.update(row[0] for row in self._connection.execute(
+                    "SELECT hash FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+            best, best_similarity = None, 0.0
+            for content_hash in candidates:
+                row = self._connection.execute(
+                    "SELECT hash, path, doc_info, destination, signature FROM documents WHERE hash = ?",
+                    (content_hash,)).fetchone()
+                if row is None:
+                    continue
+                score = similarity(signature, np.frombuffer(row[4], dtype=np.uint32))
+                if score >= self.threshold and score > best_similarity:
+                    best, best_similarity = self._entry(row[:4]), score
+        return best, best_similarity
+
+    def add(self, content_hash, file_path, doc_info, signature=None, destination=None):
+        """
+        Adds an analyzed document to the index.
+
+        :param content_hash: The SHA-256 hash of the file.
+        :param file_path: Path to the file.
+        :param doc_info: The extracted document information.
+        :param signature: The MinHash signature of the document text, if any.
+        :param destination: The path the file was organized to, if any.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO documents (hash, path, doc_info, signature, destination) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, file_path, json.dumps(doc_info, ensure_ascii=False),
+                 signature.tobytes() if signature is not None else None, destination))
+            self._connection.execute("DELETE FROM bands WHERE hash = ?", (content_hash,))
+            if signature is not None:
+                self._connection.executemany(
+                    "INSERT INTO bands (band, bucket, hash) VALUES (?, ?, ?)",
+                    [(band, bucket, content_hash) for band, bucket in self._bands(signature)])
+            self._connection.execute("COMMIT")
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._connection.close()
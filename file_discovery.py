@@ -0,0 +1,197 @@
+import os
+import time
+import heapq
+import fnmatch
+import metrics
+
+# How the input files are discovered. Globs are matched case-insensitively
+# against the file name and against the path relative to the input
+# directory; exclude globs also prune directories. Sizes are in bytes, None
+# meaning no limit. Files modified less than min_age seconds ago are
+# skipped as they may still be written.
+discovery_settings = {
+    "include": ["*.pdf"],
+    "exclude": [],
+    "min_size": None,
+    "max_size": None,
+    "symlinks": "files",
+    "min_age": 0.0,
+    "order": "filesystem",
+    "order_window": 256,
+}
+
+# "files" follows symbolic links to files but not to directories, "follow"
+# follows both (each directory is walked once), "skip" ignores every link.
+symlink_policies = ["files", "follow", "skip"]
+
+# "filesystem" hands the files over as the directories list them. The sized
+# orders sort the files by chunks of order_window files, so the work starts
+# before a large tree has been fully walked; an order_window of 0 sorts the
+# whole tree first. Largest-first shortens parallel runs, as the long files
+# don't end up alone at the tail; smallest-first gives the first results sooner.
+order_policies = ["filesystem", "largest-first", "smallest-first"]
+
+# Running totals of the discovered files.
+discovery_stats = {
+    "files": 0,
+    "bytes": 0,
+    "skipped": 0,
+}
+
+
+def _matches(relative_path, patterns):
+    """Tells whether a relative path, or its last component, matches one of the glob patterns."""
+    relative_path = relative_path.replace(os.sep, "/").lower()
+    name = relative_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(name, pattern.lower()) or fnmatch.fnmatchcase(relative_path, pattern.lower())
+               for pattern in patterns)
+
+
+def accepts(relative_path, stat, now=None):
+    """
+    Tells whether a file passes the globs, size limits and minimum age of
+    discovery_settings.
+
+    :param relative_path: Path of the file relative to the input directory.
+    :param stat: The os.stat_result of the file.
+    :param now: The current time, as returned by time.time().
+    :return: True if the file is to be processed.
+    """
+    if not _matches(relative_path, discovery_settings["include"]):
+        return False
+    if _matches(relative_path, discovery_settings["exclude"]):
+        return False
+    if discovery_settings["min_size"] is not None and stat.st_size < discovery_settings["min_size"]:
+        return False
+    if discovery_settings["max_size"] is not None and stat.st_size > discovery_settings["max_size"]:
+        return False
+    if discovery_settings["min_age"]:
+        now = time.time() if now is None else now
+        if now - stat.st_mtime < discovery_settings["min_age"]:
+            return False
+    return True
+
+
+def accepts_path(path, directory):
+    """
+    Tells whether a file found by other means, such as the directory
+    watcher, passes the discovery settings.
+
+    :param path: Path to the file.
+    :param directory: The input directory the file was found in.
+    :return: True if the file is to be processed.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return accepts(os.path.relpath(path, directory), stat)
+
+
+def walk_files(directory, recursive=False, skip_directories=(), record=True):
+    """
+    Walks a directory with os.scandir and yields the files accepted by the
+    discovery settings as soon as they are found, reusing the stat results
+    scandir caches on its entries.
+
+    :param directory: The directory to walk.
+    :param recursive: If True, walk subdirectories too.
+    :param skip_directories: Directories not to walk, such as an output
+                             directory inside the input one.
+    :param record: If False, the walk is not counted in discovery_stats
+                   and the metrics, e.g. when only checking for files.
+    :return: A generator of (path, size) tuples.
+    """
+    symlinks = discovery_settings["symlinks"]
+    skipped = {os.path.abspath(path) for path in skip_directories}
+    visited = set()
+    now = time.time()
+    start = time.perf_counter()
+    files = size = rejected = 0
+    pending = [(directory, "")]
+    try:
+        while pending:
+            path, relative = pending.pop()
+            try:
+                entries = os.scandir(path)
+                identity = os.stat(path)
+            except OSError as e:
+                print(f"Could not scan {path}: {str(e)}")
+                continue
+            if (identity.st_dev, identity.st_ino) in visited:
+                entries.close()
+                continue
+            visited.add((identity.st_dev, identity.st_ino))
+            subdirectories = []
+            with entries:
+                for entry in entries:
+                    entry_relative = os.path.join(relative, entry.name)
+                    try:
+                        if symlinks == "skip" and entry.is_symlink():
+                            continue
+                        if entry.is_dir(follow_symlinks=symlinks == "follow"):
+                            if (recursive and os.path.abspath(entry.path) not in skipped
+                                    and not _matches(entry_relative, discovery_settings["exclude"])):
+                                subdirectories.append((entry.path, entry_relative))
+                            continue
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        # Broken link, or the file went away.
+                        continue
+                    if not accepts(entry_relative, stat, now):
+                        if _matches(entry_relative, discovery_settings["include"]):
+                            rejected += 1
+                        continue
+                    files += 1
+                    size += stat.st_size
+                    yield entry.path, stat.st_size
+            # Depth-first, in the order the directory listed its subdirectories.
+            pending.extend(reversed(subdirectories))
+    finally:
+        if record:
+            discovery_stats["files"] += files
+            discovery_stats["bytes"] += size
+            discovery_stats["skipped"] += rejected
+            metrics.record("discover", files=files, bytes=size, skipped=rejected,
+                           seconds=round(time.perf_counter() - start, 6))
+
+
+def order_files(files, order="filesystem", window=256):
+    """
+    Orders discovered files by size, by chunks of window files.
+
+    :param files: An iterable of (path, size) tuples.
+    :param order: One of order_policies.
+    :param window: Number of files held back to pick the next one from, 0
+                   to sort all the files.
+    :return: A generator of file paths.
+    """
+    if order == "filesystem":
+        for path, _ in files:
+            yield path
+        return
+    if order not in order_policies:
+        raise ValueError(f"Unknown file order: {order}")
+    sign = -1 if order == "largest-first" else 1
+    heap = []
+    for index, (path, size) in enumerate(files):
+        heapq.heappush(heap, (sign * size, index, path))
+        if window and len(heap) > window:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def discover_files(directory, recursive=False, skip_directories=()):
+    """
+    Lists the files to process in a directory, as configured by discovery_settings.
+
+    :param directory: The input directory.
+    :param recursive: If True, walk subdirectories too.
+    :param skip_directories: Directories not to walk, such as the output directory.
+    :return: A generator of file paths.
+    """
+    return order_files(walk_files(directory, recursive, skip_directories),
+                       discovery_settings["order"], discovery_settings["order_window"])
@@ -1,37 +1,259 @@
 import os
+import time
+import errno
 import shutil
+import threading
 from datetime import datetime
+import metrics
+
+# How files are placed in the output directory:
+# - "move" renames the file, or copies it and deletes the original when the
+#   output directory is on another file system;
+# - "rename" only renames, failing across file systems;
+# - "hardlink" links the file into the output directory, keeping the original;
+# - "copy" copies the file, with a reflink where the file system supports it;
+# - "symlink" leaves the file in place and links to it from the output directory.
+placement_modes = ["move", "rename", "hardlink", "copy", "symlink"]
+placement_mode = "move"
+
+# Running totals of the placed files. Collisions are the files renamed
+# because their name was already taken.
+placement_stats = {
+    "renamed": 0,
+    "linked": 0,
+    "copied": 0,
+    "bytes_copied": 0,
+    "collisions": 0,
+}
+
+# Directories created during the run, so each one is only created once.
+_directories = set()
+_directories_lock = threading.Lock()
+
+# The FICLONE ioctl, from <linux/fs.h>.
+FICLONE = 0x40049409
+
+# Errors telling that a copy method is not supported for these files.
+_unsupported = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                errno.EPERM}
+
+
+def _ensure_directory(directory):
+    """Creates a directory, unless it was already created during the run."""
+    with _directories_lock:
+        if directory in _directories:
+            return
+    os.makedirs(directory, exist_ok=True)
+    with _directories_lock:
+        _directories.add(directory)
+
+
+def _candidates(path):
+    """Yields a path, then the same path numbered " (2)", " (3)"... to resolve name collisions."""
+    yield path
+    stem, extension = os.path.splitext(path)
+    number = 2
+    while True:
+        yield f"{stem} ({number}){extension}"
+        number += 1
+
+
+def _publish(create, path):
+    """
+    Creates a file at a path with a function failing when it exists, such
+    as os.link or os.symlink, numbering the name until it is free. Nothing
+    is ever overwritten, and no stat call is needed to find a free name.
+
+    :param create: Function creating the file at the path it is given.
+    :param path: The wanted path.
+    :return: The path the file was created at.
+    """
+    for attempt, candidate in enumerate(_candidates(path)):
+        try:
+            create(candidate)
+        except FileExistsError:
+            continue
+        except FileNotFoundError:
+            # The directory was removed since it was created: create it again.
+            with _directories_lock:
+                _directories.discard(os.path.dirname(path))
+            _ensure_directory(os.path.dirname(path))
+            create(candidate)
+        if attempt:
+            placement_stats["collisions"] += 1
+        return candidate
+
+
+def _copy_range(source, destination, size):
+    """Copies a file within the kernel, with copy_file_range or else sendfile."""
+    for copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+        if copy is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if copy is os.sendfile:
+                    copied = copy(destination, source, offset, min(size - offset, 1 << 30))
+                else:
+                    copied = copy(source, destination, min(size - offset, 1 << 30), offset, offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError as e:
+            if e.errno not in _unsupported or offset:
+                raise
+            continue
+        if offset == size:
+            return True
+    return False
+
+
+def copy_data(source_path, destination_path):
+    """
+    Copies the content of a file to a new file at disk speed: as a reflink
+    sharing the blocks where the file system supports it (Btrfs, XFS), else
+    within the kernel with copy_file_range or sendfile, else through Python.
+
+    :param source_path: Path to the file to copy.
+    :param destination_path: Path to the new file, which must not exist.
+    :return: The number of bytes copied, 0 for a reflink.
+    """
+    with open(source_path, 'rb') as source, open(destination_path, 'xb') as destination:
+        try:
+            import fcntl
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+            return 0
+        except (ImportError, OSError):
+            pass
+        size = os.fstat(source.fileno()).st_size
+        if not _copy_range(source.fileno(), destination.fileno(), size):
+            source.seek(0)
+            destination.seek(0)
+            destination.truncate()
+            shutil.copyfileobj(source, destination, 1024 * 1024)
+        return size
+
+
+def _rename(file_path, new_file_path):
+    """Renames a file where hard links are not supported, checking for a collision first."""
+    new_file_path = next(path for path in _candidates(new_file_path) if not os.path.lexists(path))
+    os.rename(file_path, new_file_path)
+    return new_file_path
+
+
+def _copy(source_path, new_file_path, durable=False):
+    """
+    Copies a file to a temporary name next to its destination, then links it
+    to its final name, so the destination never holds a partial file.
+
+    :param durable: If True, the data is flushed to disk before the link,
+                    as the original is deleted afterwards.
+    :return: The path the file was copied to.
+    """
+    directory, name = os.path.split(new_file_path)
+    temporary = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        copied = copy_data(source_path, temporary)
+        shutil.copystat(source_path, temporary)
+        if durable:
+            with open(temporary, 'rb+') as file:
+                os.fsync(file.fileno())
+        try:
+            new_file_path = _publish(lambda path: os.link(temporary, path), new_file_path)
+        except OSError as e:
+            if e.errno not in _unsupported:
+                raise
+            new_file_path = _rename(temporary, new_file_path)
+    finally:
+        if os.path.lexists(temporary):
+            os.unlink(temporary)
+    placement_stats["copied"] += 1
+    placement_stats["bytes_copied"] += copied
+    return new_file_path
+
+
+def place(file_path, new_file_path, mode=None):
+    """
+    Places a file at a new path, numbering the name if it is taken.
+
+    :param file_path: Path to the file.
+    :param new_file_path: The wanted path.
+    :param mode: One of placement_modes, defaults to placement_mode.
+    :return: The path the file was placed at.
+    """
+    mode = mode or placement_mode
+    _ensure_directory(os.path.dirname(new_file_path))
+    if mode == "symlink":
+        source = os.path.abspath(file_path)
+        new_file_path = _publish(lambda path: os.symlink(source, path), new_file_path)
+        placement_stats["linked"] += 1
+    elif mode == "copy":
+        new_file_path = _copy(file_path, new_file_path)
+    else:
+        # Hard-link to the final name, which fails rather than overwriting an
+        # existing file; moves and renames then remove the original.
+        try:
+            new_file_path = _publish(lambda path: os.link(file_path, path), new_file_path)
+        except OSError as e:
+            if mode == "hardlink" or e.errno not in _unsupported:
+                raise
+            if e.errno != errno.EXDEV:
+                # No hard links on this file system, e.g. FAT or some network shares.
+                placement_stats["renamed"] += 1
+                return _rename(file_path, new_file_path)
+            if mode == "rename":
+                raise
+            new_file_path = _copy(file_path, new_file_path, durable=True)
+        else:
+            placement_stats["linked" if mode == "hardlink" else "renamed"] += 1
+        if mode != "hardlink":
+            os.unlink(file_path)
+    return new_file_path
+
+
+def target_path(file_path, output_directory, doc_info):
+    """
+    Builds the path a file is organized to from its extracted information.
+
+    :param file_path: Path to the original file.
+    :param output_directory: Base directory for organized files.
+    :param doc_info: Dictionary containing extracted document information.
+    :return: The target path, before any collision numbering.
+    """
+    # Extract information
+    subject = doc_info['subject']
+    date = datetime.strptime(doc_info['date'], "%Y-%m-%d")
+    doc_type = doc_info['type']
+    emitter = doc_info['emitter']
+    recipient = doc_info['recipient']
+
+    # Directory structure
+    new_dir = os.path.join(output_directory, doc_type, date.strftime("%Y-%m"))
+
+    # Create new filename
+    file_name = os.path.basename(file_path)
+    new_file_name = f"{subject} - {emitter} - {recipient} - {file_name}"
+    return os.path.join(new_dir, new_file_name)
+
 
 def organize_file(file_path, output_directory, doc_info):
     """
     Organizes the file based on extracted information.
-    
+
     :param file_path: Path to the original file.
     :param output_directory: Base directory for organized files.
     :param doc_info: Dictionary containing extracted document information.
     :return: Path to the new file location.
     """
+    start = time.perf_counter()
+    errors = 0
+    copied = placement_stats["bytes_copied"]
     try:
-        # Extract information
-        subject = doc_info['subject']
-        date = datetime.strptime(doc_info['date'], "%Y-%m-%d")
-        doc_type = doc_info['type']
-        emitter = doc_info['emitter']
-        recipient = doc_info['recipient']
-
-        # Create directory structure
-        new_dir = os.path.join(output_directory, doc_type, date.strftime("%Y-%m"))
-        os.makedirs(new_dir, exist_ok=True)
-
-        # Create new filename
-        file_name = os.path.basename(file_path)
-        new_file_name = f"{subject} - {emitter} - {recipient} - {file_name}"
-        new_file_path = os.path.join(new_dir, new_file_name)
-
-        # Move the file
-        shutil.move(file_path, new_file_path)
-
-        return new_file_path
+        return place(file_path, target_path(file_path, output_directory, doc_info))
     except Exception as e:
+        errors = 1
         print(f"Error organizing file {file_path}: {str(e)}")
         return None
+    finally:
+        metrics.record("organize", file=file_path, seconds=round(time.perf_counter() - start, 6), errors=errors,
+                       bytes_copied=placement_stats["bytes_copied"] - copied)
@@ -0,0 +1,148 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+# States of a file in the journal, in processing order. "skipped" marks
+# duplicates left in place; "failed" can follow any state and records the reason.
+STATES = ["discovered", "extracted", "analyzed", "moved", "skipped", "failed"]
+
+# File name of the journal in the output directory.
+JOURNAL_FILE_NAME = ".pdf_sorter_journal.sqlite"
+
+
+def file_fingerprint(file_path):
+    """
+    Identifies a version of a file by its size and modification time, so a
+    new file dropped under the name of a processed one is not skipped.
+
+    :param file_path: Path to the file.
+    :return: The fingerprint string, or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class JobJournal:
+    """
+    A persistent journal of the state of each file of a run, stored in a
+    SQLite database, so an interrupted run can be resumed.
+
+    The states are kept in memory and written to the database in batches,
+    so recording a state never waits on the disk.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=2.0):
+        """
+        :param path: Path to the SQLite database file.
+        :param batch_size: Number of pending state changes triggering a write.
+        :param flush_interval: Maximum number of seconds a state change stays pending.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                path TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                state TEXT NOT NULL,
+                reason TEXT,
+                doc_info TEXT,
+                updated REAL NOT NULL
+            )"""
+        )
+        self._entries = {
+            path: {"fingerprint": fingerprint, "state": state, "reason": reason,
+                   "doc_info": json.loads(doc_info) if doc_info else None}
+            for path, fingerprint, state, reason, doc_info in self._connection.execute(
+                "SELECT path, fingerprint, state, reason, doc_info FROM jobs")
+        }
+
+    def entry(self, file_path):
+        """
+        Returns the journal entry of a file, if it is about the file as it is
+        now on disk.
+
+        :param file_path: Path to the file.
+        :return: A dictionary with the fingerprint, state, reason and doc_info, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(file_path)
+        if entry is None or entry["fingerprint"] != file_fingerprint(file_path):
+            return None
+        return entry
+
+    def record(self, file_path, state, reason=None, doc_info=None):
+        """
+        Records the state of a file.
+
+        :param file_path: Path to the file.
+        :param state: One of STATES.
+        :param reason: Why the file failed or was skipped.
+        :param doc_info: The extracted document information, for the "analyzed" state.
+        """
+        if state not in STATES:
+            raise ValueError(f"Unknown job state: {state}")
+        with self._lock:
+            previous = self._entries.get(file_path)
+            if state == "discovered" or previous is None:
+                fingerprint = file_fingerprint(file_path)
+            else:
+                # Moved files no longer exist: keep the fingerprint of discovery.
+                fingerprint = previous["fingerprint"]
+            entry = {"fingerprint": fingerprint, "state": state, "reason": reason, "doc_info": doc_info}
+            self._entries[file_path] = entry
+            self._pending[file_path] = (entry, time.time())
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def _flush(self):
+        """Writes the pending state changes in a single transaction."""
+        rows = [
+            (path, entry["fingerprint"], entry["state"], entry["reason"],
+             json.dumps(entry["doc_info"], ensure_ascii=False) if entry["doc_info"] else None, updated)
+            for path, (entry, updated) in self._pending.items()
+        ]
+        if rows:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO jobs (path, fingerprint, state, reason, doc_info, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Writes the pending state changes to the database."""
+        with self._lock:
+            self._flush()
+
+    def counts(self):
+        """
+        Counts the files of the journal per state.
+
+        :return: A dictionary of file counts per state.
+        """
+        with self._lock:
+            counts = dict.fromkeys(STATES, 0)
+            for entry in self._entries.values():
+                counts[entry["state"]] += 1
+        return counts
+
+    def close(self):
+        """Writes the pending state changes and closes the database."""
+        with self._lock:
+            self._flush()
+            self._connection.close()
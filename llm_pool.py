@@ -0,0 +1,454 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# Running totals of the pool's routing work.
+pool_stats = {
+    "failovers": 0,
+    "ejections": 0,
+    "readmissions": 0,
+    "breaker_trips": 0,
+}
+
+
+def default_hosts():
+    """
+    Returns the Ollama hosts configured in the environment: the
+    comma-separated OLLAMA_HOSTS, else OLLAMA_HOST, else the ollama default.
+
+    :return: A list of host URLs, None standing for the ollama default.
+    """
+    hosts = [host.strip() for host in os.environ.get("OLLAMA_HOSTS", "").split(",") if host.strip()]
+    return hosts or [os.environ.get("OLLAMA_HOST")]
+
+
+def is_host_failure(error):
+    """
+    Tells whether a failed request points at a problem with the host rather
+    than with the request: the host is unreachable, timed out or answered
+    with a server error. Such requests are failed over to another host.
+
+    :param error: The exception raised by the request.
+    :return: True for host failures.
+    """
+    import httpx
+    import ollama
+
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a dead server.
+
+    After threshold requests in a row failed on every host, the breaker
+    opens and requests fail immediately for cooldown seconds. A single
+    trial request then goes through: it closes the breaker if it succeeds
+    and opens it again otherwise.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        """
+        :param threshold: Consecutive failed requests opening the breaker.
+        :param cooldown: Seconds before a trial request is let through.
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Tells whether a request may be sent.
+
+        :return: True when the breaker is closed, or for the trial request.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.cooldown:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        """Records a request the server answered, closing the breaker."""
+        with self._lock:
+            if self.opened_at is not None:
+                print("Ollama is answering again, circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        """Records a request that failed on every host."""
+        with self._lock:
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.threshold):
+                if not self.trial:
+                    pool_stats["breaker_trips"] += 1
+                    print(f"Ollama unreachable, circuit breaker open for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+class Endpoint:
+    """An Ollama host of the pool, with its pooled HTTP clients and routing state."""
+
+    def __init__(self, host, client, async_client=None, transport=None, async_transport=None):
+        self.host = host
+        self.client = client
+        self.async_client = async_client
+        # The HTTP transports of the clients, created and closed by the pool.
+        self.transport = transport
+        self.async_transport = async_transport
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0  # Consecutive host failures.
+        self.ejected = False
+        self.retry_at = 0.0
+        self.probing = False
+
+    def stats(self):
+        """Returns the request counts and state of the host."""
+        return {"host": self.host or "default", "requests": self.requests, "errors": self.errors,
+                "ejected": self.ejected}
+
+
+class LLMPool:
+    """
+    Sends the chat requests to a set of Ollama hosts.
+
+    Each host gets an ollama.Client and an ollama.AsyncClient whose HTTP
+    connections are kept alive and reused. The asynchronous requests run on
+    an event loop of the pool, see run(). Every request goes to the healthy host with the fewest
+    outstanding requests. A host failing max_failures requests in a row is
+    ejected for eject_seconds, after which a health check (listing its
+    models) readmits it. A request failing on a host is retried once on
+    each other healthy host before giving up. The last healthy host is never
+    ejected, as there is nowhere left to send the requests: when it is down
+    too, the circuit breaker stops sending them for a while.
+    """
+
+    def __init__(self, hosts=None, connections=8, timeout=300.0, max_failures=3, eject_seconds=30.0,
+                 breaker_threshold=5, breaker_cooldown=30.0):
+        """
+        :param hosts: List of Ollama host URLs, defaults to default_hosts().
+        :param connections: Maximum number of pooled connections per host.
+        :param timeout: Timeout of each request, in seconds.
+        :param max_failures: Consecutive failures after which a host is ejected.
+        :param eject_seconds: Seconds before an ejected host is checked again.
+        :param breaker_threshold: Consecutive requests failing on every host
+                                  after which the circuit breaker opens.
+        :param breaker_cooldown: Seconds the circuit breaker stays open.
+        """
+        # The ollama client and its HTTP stack take a good share of the
+        # startup time, they are only loaded with the first pool.
+        import httpx
+        import ollama
+
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread = None
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections,
+                              keepalive_expiry=60.0)
+        self.endpoints = []
+        for host in hosts or default_hosts():
+            transport = httpx.HTTPTransport(limits=limits)
+            async_transport = httpx.AsyncHTTPTransport(limits=limits)
+            self.endpoints.append(Endpoint(
+                host,
+                ollama.Client(host=host, timeout=timeout, transport=transport),
+                ollama.AsyncClient(host=host, timeout=timeout, transport=async_transport),
+                transport,
+                async_transport,
+            ))
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the pool's event loop and waits for its result.
+
+        The asynchronous clients are bound to this loop, which runs in a
+        thread of its own until close(), so their connections are reused
+        across documents, and coroutines submitted from several threads run
+        concurrently.
+
+        :param coroutine: The coroutine to run.
+        :return: The result of the coroutine.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="llm-pool-loop",
+                                                     daemon=True)
+                self._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self):
+        """Closes the HTTP connections of every host and stops the event loop."""
+        with self._lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        # The asynchronous connections are only opened on the loop, and must
+        # be closed there.
+        if loop is not None:
+            async def close_async_transports():
+                for endpoint in self.endpoints:
+                    await endpoint.async_transport.aclose()
+
+            asyncio.run_coroutine_threadsafe(close_async_transports(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        for endpoint in self.endpoints:
+            endpoint.transport.close()
+
+    def check(self, endpoint):
+        """
+        Health-checks a host by listing its models, readmitting it on success.
+
+        :param endpoint: The Endpoint to check.
+        :return: True if the host is healthy.
+        """
+        try:
+            endpoint.client.list()
+            healthy = True
+        except Exception:
+            healthy = False
+        return self._checked(endpoint, healthy)
+
+    async def acheck(self, endpoint):
+        """Asynchronous counterpart of check."""
+        try:
+            await endpoint.async_client.list()
+            healthy = True
+        except Exception:
+            healthy = False
+        return self._checked(endpoint, healthy)
+
+    def _checked(self, endpoint, healthy):
+        """Records the outcome of a health check."""
+        with self._lock:
+            endpoint.probing = False
+            if healthy:
+                if endpoint.ejected:
+                    pool_stats["readmissions"] += 1
+                endpoint.ejected = False
+                endpoint.failures = 0
+            else:
+                endpoint.retry_at = time.monotonic() + self.eject_seconds
+        return healthy
+
+    def check_all(self):
+        """
+        Health-checks every host, ejecting the unreachable ones but the last.
+
+        :return: The list of healthy hosts.
+        """
+        for endpoint in self.endpoints:
+            if not self.check(endpoint):
+                with self._lock:
+                    self._eject(endpoint)
+        return [endpoint.host for endpoint in self.endpoints if not endpoint.ejected]
+
+    def _healthy(self):
+        with self._lock:
+            return [endpoint for endpoint in self.endpoints if not endpoint.ejected]
+
+    def check_model(self, model):
+        """
+        Checks that every healthy host has a model and that the model supports
+        tool calls, which every extraction relies on.
+
+        :param model: The model name.
+        :return: A list of problems, empty when the model is usable everywhere.
+        """
+        import ollama
+
+        problems = []
+        for endpoint in self._healthy():
+            host = endpoint.host or "default"
+            try:
+                info = endpoint.client.show(model)
+            except ollama.ResponseError as e:
+                if e.status_code == 404:
+                    problems.append(f"{host}: model {model} not found, run `ollama pull {model}` there.")
+                else:
+                    problems.append(f"{host}: {e.error}")
+                continue
+            except Exception as e:
+                problems.append(f"{host}: {str(e)}")
+                continue
+            # Servers without the capabilities list tell tool support by
+            # whether the chat template renders tools.
+            capabilities = getattr(info, "capabilities", None)
+            tools = "tools" in capabilities if capabilities else ".Tools" in (info.template or "")
+            if not tools:
+                problems.append(f"{host}: model {model} does not support tool calls.")
+        return problems
+
+    def load_model(self, model, keep_alive=None):
+        """
+        Loads a model on every healthy host, with an empty generate request,
+        and sets how long they keep it loaded.
+
+        :param model: The model name.
+        :param keep_alive: How long the hosts keep the model loaded, as for chat requests.
+        """
+        def load(endpoint):
+            with metrics.timed("warm_up", host=endpoint.host):
+                endpoint.client.generate(model=model, prompt="", keep_alive=keep_alive)
+
+        healthy = self._healthy()
+        with ThreadPoolExecutor(max_workers=len(healthy) or 1) as executor:
+            futures = [executor.submit(load, endpoint) for endpoint in healthy]
+        for endpoint, future in zip(healthy, futures):
+            if future.exception() is not None:
+                print(f"Could not load {model} on Ollama host {endpoint.host or 'default'}: "
+                      f"{str(future.exception())}")
+
+    def _eject(self, endpoint):
+        """Ejects a host, unless it is the last healthy one. Called with the lock held."""
+        healthy = [other for other in self.endpoints if not other.ejected and other is not endpoint]
+        if endpoint.ejected or not healthy:
+            return
+        endpoint.ejected = True
+        endpoint.retry_at = time.monotonic() + self.eject_seconds
+        pool_stats["ejections"] += 1
+        print(f"Ejected Ollama host {endpoint.host or 'default'} for {self.eject_seconds:.0f}s")
+
+    def _due(self, tried):
+        """Returns the untried ejected hosts due for a health check, marked as being checked."""
+        now = time.monotonic()
+        with self._lock:
+            due = [endpoint for endpoint in self.endpoints
+                   if endpoint.ejected and not endpoint.probing and endpoint.retry_at <= now
+                   and endpoint not in tried]
+            for endpoint in due:
+                endpoint.probing = True
+        return due
+
+    def _pick(self, tried):
+        """Picks the healthy host with the fewest outstanding requests among the untried ones."""
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints
+                          if not endpoint.ejected and endpoint not in tried]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda candidate: (candidate.outstanding, candidate.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint, error=None):
+        """Records the outcome of a request sent to a host."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.failures = 0
+                return
+            endpoint.errors += 1
+            if is_host_failure(error):
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    self._eject(endpoint)
+
+    def _failed(self, endpoint, error, tried):
+        """
+        Records a request that failed on a host.
+
+        :return: True for a host failure, to be failed over to the untried hosts.
+        """
+        self._release(endpoint, error)
+        if not is_host_failure(error):
+            self.breaker.success()
+            return False
+        tried.add(endpoint)
+        if len(tried) < len(self.endpoints):
+            pool_stats["failovers"] += 1
+            metrics.record("failover", host=endpoint.host, error=type(error).__name__)
+        return True
+
+    def chat(self, **request):
+        """
+        Sends a chat request to the least loaded healthy host, failing over to
+        the other hosts when it fails there.
+
+        :param request: The ollama.Client.chat arguments.
+        :return: The Ollama response.
+        :raises CircuitOpenError: While the circuit breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Ollama is unreachable, circuit breaker open.")
+        tried = set()
+        last_error = None
+        while True:
+            for endpoint in self._due(tried):
+                self.check(endpoint)
+            endpoint = self._pick(tried)
+            if endpoint is None:
+                break
+            try:
+                response = endpoint.client.chat(**request)
+            except Exception as e:
+                if not self._failed(endpoint, e, tried):
+                    raise
+                last_error = e
+                continue
+            self._release(endpoint)
+            self.breaker.success()
+            return response
+        self.breaker.failure()
+        raise last_error or ConnectionError("No healthy Ollama host left in the pool.")
+
+    async def achat(self, **request):
+        """
+        Asynchronous counterpart of chat, sent with the hosts' asynchronous
+        clients: cancelling it aborts the HTTP request. It must run on the
+        pool's event loop, see run().
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Ollama is unreachable, circuit breaker open.")
+        tried = set()
+        last_error = None
+        while True:
+            for endpoint in self._due(tried):
+                await self.acheck(endpoint)
+            endpoint = self._pick(tried)
+            if endpoint is None:
+                break
+            try:
+                response = await endpoint.async_client.chat(**request)
+            except asyncio.CancelledError:
+                self._release(endpoint)
+                raise
+            except Exception as e:
+                if not self._failed(endpoint, e, tried):
+                    raise
+                last_error = e
+                continue
+            self._release(endpoint)
+            self.breaker.success()
+            return response
+        self.breaker.failure()
+        raise last_error or ConnectionError("No healthy Ollama host left in the pool.")
+
+    def stats(self):
+        """Returns the request counts and state of each host."""
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
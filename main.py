@@ -1,11 +1,80 @@
 import os
+import sys
 import argparse
-import shutil
+import time
+import threading
+import concurrent.futures
 from datetime import datetime
 import colorama
-from pdf_processor import extract_text_from_pdf
-from document_analyzer import analyze_document
-from file_organizer import organize_file
+import document_analyzer
+import metrics
+import pdf_processor
+from pdf_processor import (enable_text_cache, extract_text_from_pdf, extraction_stats, file_hash, ocr_settings,
+                           raster_settings)
+from document_analyzer import analyze_document, enable_llm_cache, enable_llm_pool, llm_stats, load_type_model
+import file_organizer
+from file_organizer import organize_file, place, placement_stats, target_path
+from file_discovery import accepts_path, discover_files, discovery_settings, discovery_stats, walk_files
+import file_discovery
+from directory_watcher import watch_pdf_files
+from duplicate_index import INDEX_FILE_NAME, DuplicateIndex, duplicate_stats, minhash_signature
+from job_journal import JOURNAL_FILE_NAME, JobJournal
+from move_plan import MovePlan, apply_plan
+from llm_pool import default_hosts, pool_stats
+from pipeline import Stage, run_pipeline
+from prompt_compactor import compaction_stats
+from response_repair import repair_stats
+import rule_extractor
+
+# Journal of the state of each file of the run, see enable_journal().
+journal = None
+
+# Files skipped on resume because an interrupted run already moved them,
+# and files whose analysis was taken over from the journal.
+resume_stats = {
+    "skipped": 0,
+    "reused": 0,
+}
+
+# Moves decided by a plan run, written for review instead of moving the
+# files, see enable_plan().
+move_plan = None
+
+# Index of the analyzed documents, finding duplicates, see enable_duplicate_index().
+duplicate_index = None
+
+# What happens to duplicates: "skip" leaves them in the input directory,
+# "move" puts them next to the original and "flag" organizes them with the
+# original's analysis and a DUPLICATE subject prefix.
+duplicate_policy = "skip"
+
+# Startup latency of the run: when main() started, the seconds until the
+# first file was placed and the seconds the model took to load.
+startup_stats = {
+    "started": None,
+    "first_result": None,
+    "warm_up": None,
+}
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(
+    os.path.expanduser('~'), '.cache', 'ai-powered-pdf-sorter')
+
+
+def _keep_alive(value):
+    """Parses a keep-alive duration: a number of seconds or an Ollama duration string such as 30m."""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _size(value):
+    """Parses a file size: a number of bytes, optionally with a K, M or G suffix."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().removesuffix("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
 
 
 def setup_argparse():
@@ -19,60 +88,582 @@ def setup_argparse():
                         help='The base directory to organize the files into.')
     parser.add_argument('--dry-run', action='store_true',
                         help='Simulate the process without moving files.')
+    parser.add_argument('--placement', choices=file_organizer.placement_modes, default=file_organizer.placement_mode,
+                        help='How files are placed in the output directory: move them (copying across file '
+                             'systems), only rename them, hard-link, copy (with a reflink where supported) '
+                             'or symlink them, the last three leaving the originals in place.')
     parser.add_argument('--recursive', '-r', action='store_true',
                         help='Scan subdirectories recursively.')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Enable verbose output.')
+    parser.add_argument('--plan', type=str, default=None, metavar='PLAN_FILE',
+                        help='Analyze the files and write the moves to this JSON plan file for review, '
+                             'without moving anything. Apply it with: main.py apply PLAN_FILE.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted run from the journal of the output directory: '
+                             'skip the files already moved and reuse the analyses of the files '
+                             'analyzed but not moved. Failed and unfinished files are retried.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and process the PDF files as they land in the input directory.')
+    parser.add_argument('--watch-settle', type=float, default=2.0,
+                        help='In watch mode, seconds a new file must stay unchanged before it is processed.')
+    parser.add_argument('--watch-interval', type=float, default=5.0,
+                        help='In watch mode, seconds between two scans of the input directory '
+                             'where inotify is not available.')
+    parser.add_argument('--include', nargs='+', default=discovery_settings['include'], metavar='GLOB',
+                        help='Process the files whose name or path relative to the input directory matches '
+                             'one of these globs, case-insensitively.')
+    parser.add_argument('--exclude', nargs='+', default=discovery_settings['exclude'], metavar='GLOB',
+                        help='Skip the files and directories whose name or relative path matches one of '
+                             'these globs, e.g. archive "*draft*".')
+    parser.add_argument('--min-size', type=_size, default=None,
+                        help='Skip the files smaller than this size, e.g. 1K.')
+    parser.add_argument('--max-size', type=_size, default=None,
+                        help='Skip the files larger than this size, e.g. 50M.')
+    parser.add_argument('--symlinks', choices=file_discovery.symlink_policies,
+                        default=discovery_settings['symlinks'],
+                        help='files follows symbolic links to files but not to directories, follow follows '
+                             'both, skip ignores them.')
+    parser.add_argument('--min-age', type=float, default=discovery_settings['min_age'],
+                        help='Skip the files modified less than this many seconds ago, which may still be '
+                             'written. Watch mode waits for files to settle instead.')
+    parser.add_argument('--order', choices=file_discovery.order_policies, default=discovery_settings['order'],
+                        help='Order of the files: as listed by the file system, largest-first to shorten '
+                             'parallel runs, or smallest-first for the first results sooner.')
+    parser.add_argument('--order-window', type=int, default=discovery_settings['order_window'],
+                        help='Number of discovered files the sized orders pick the next file from, so '
+                             'processing starts before the whole tree is walked. 0 sorts all the files.')
+    parser.add_argument('--ollama-hosts', nargs='+', default=None, metavar='HOST',
+                        help='Ollama hosts to spread the LLM requests over, e.g. http://gpu1:11434 '
+                             'http://gpu2:11434. Defaults to the comma-separated OLLAMA_HOSTS environment '
+                             'variable, else OLLAMA_HOST.')
+    parser.add_argument('--ollama-connections', type=int, default=8,
+                        help='Maximum number of kept-alive connections to each Ollama host.')
+    parser.add_argument('--keep-alive', type=_keep_alive, default=None,
+                        help='How long the Ollama server keeps the model loaded after a request, '
+                             'e.g. 30m, or -1 to keep it loaded. By default the model is released after '
+                             '30 idle minutes, or after an idle hour in watch mode.')
+    parser.add_argument('--skip-model-check', action='store_true',
+                        help='Do not check that the Ollama hosts have the model, with tool support, before '
+                             'processing the files.')
+    parser.add_argument('--duplicates', choices=['skip', 'move', 'flag'], default=None,
+                        help='Detect byte-identical and near-duplicate files, reuse the analysis of the first '
+                             'copy and skip them, move them next to the original, or flag them with a '
+                             'DUPLICATE subject prefix. Disabled by default.')
+    parser.add_argument('--duplicate-threshold', type=float, default=0.9,
+                        help='Minimum estimated similarity of the texts of near-duplicate files.')
+    parser.add_argument('--combined', action='store_true',
+                        help='Extract all fields with a single LLM call, re-asking only for missing or invalid fields.')
+    parser.add_argument('--max-in-flight', type=int, default=1,
+                        help='Run the per-field LLM extractions concurrently with at most this many in-flight requests. '
+                             'Set it to the Ollama server OLLAMA_NUM_PARALLEL value.')
+    parser.add_argument('--prompt-layout', choices=document_analyzer.prompt_layouts,
+                        default=document_analyzer.prompt_layout,
+                        help='Layout of the per-field prompts. shared-prefix starts every prompt of a document '
+                             'with the same system message and document, so Ollama evaluates the document once '
+                             'and reuses it from its cache for the other fields.')
+    parser.add_argument('--prompt-token-budget', type=int, default=None,
+                        help='Compact the document content to at most this many (estimated) tokens per prompt, '
+                             'keeping the parts most useful to each field.')
+    parser.add_argument('--rules', action='store_true',
+                        help='Resolve obvious dates, types and recipients with deterministic rules, '
+                             'asking the LLM only for the remaining fields.')
+    parser.add_argument('--rule-threshold', type=float, default=rule_extractor.confidence_threshold,
+                        help='Minimum confidence for a rule match to replace the LLM call.')
+    parser.add_argument('--type-model', type=str, default=None,
+                        help='Path to a local document type classifier trained with type_classifier.py. '
+                             'Its confident predictions replace the LLM type extraction.')
+    parser.add_argument('--type-threshold', type=float, default=0.9,
+                        help='Minimum confidence for a local type classifier prediction to replace the LLM call.')
+    parser.add_argument('--no-llm-cache', action='store_true',
+                        help='Disable the persistent LLM response cache.')
+    parser.add_argument('--llm-cache-path', type=str,
+                        default=os.path.join(DEFAULT_CACHE_DIRECTORY, 'llm_cache.sqlite'),
+                        help='Path to the persistent LLM response cache.')
+    parser.add_argument('--llm-cache-size', type=int, default=256,
+                        help='Maximum size of the LLM response cache, in MB.')
+    parser.add_argument('--no-text-cache', action='store_true',
+                        help='Disable the persistent per-page text/OCR cache.')
+    parser.add_argument('--text-cache-path', type=str,
+                        default=os.path.join(DEFAULT_CACHE_DIRECTORY, 'text_cache.sqlite'),
+                        help='Path to the persistent per-page text/OCR cache.')
+    parser.add_argument('--text-cache-size', type=int, default=1024,
+                        help='Maximum size of the text/OCR cache, in MB.')
+    parser.add_argument('--ocr-min-chars', type=int, default=ocr_settings['min_page_chars'],
+                        help='OCR the pages whose text layer has fewer alphanumeric characters than this.')
+    parser.add_argument('--ocr-dpi', type=int, default=ocr_settings['dpi'],
+                        help='Resolution of the first OCR pass.')
+    parser.add_argument('--ocr-escalation-dpi', type=int, nargs='*', default=ocr_settings['escalation_dpi'],
+                        help='Resolutions the pages below --ocr-min-confidence are OCR\'d again at, in turn.')
+    parser.add_argument('--ocr-min-confidence', type=float, default=ocr_settings['min_confidence'],
+                        help='Mean word confidence (0 to 100) below which a page is OCR\'d again at a higher '
+                             'resolution, then binarized.')
+    parser.add_argument('--no-ocr-binarize', action='store_true',
+                        help='Do not binarize the pages still below --ocr-min-confidence at the highest resolution.')
+    parser.add_argument('--ocr-window', type=int, default=raster_settings['window'],
+                        help='Maximum number of pages rasterized at once for OCR.')
+    parser.add_argument('--ocr-in-memory', action='store_true',
+                        help='Rasterize pages for OCR in memory instead of through a temporary directory.')
+    parser.add_argument('--ocr-max-memory', type=int, default=raster_settings['max_memory_mb'],
+                        help='Memory budget for the pages rasterized in memory at once, per worker, in MB. '
+                             'The OCR window shrinks to fit it.')
+    parser.add_argument('--ocr-workers', type=int, default=raster_settings['ocr_workers'],
+                        help='Number of processes OCR\'ing the pages of a document in parallel. '
+                             'Limited so that extract-workers x ocr-workers stays within the number of cores.')
+    parser.add_argument('--extract-workers', type=int, default=1,
+                        help='Number of text extraction (PDF parsing and OCR) processes. '
+                             'Above 1, files go through a staged extract/analyze/organize pipeline.')
+    parser.add_argument('--llm-workers', type=int, default=1,
+                        help='Number of documents analyzed by the LLM concurrently. '
+                             'Above 1, files go through a staged extract/analyze/organize pipeline.')
+    parser.add_argument('--queue-size', type=int, default=8,
+                        help='Maximum number of files waiting in front of each pipeline stage.')
+    parser.add_argument('--metrics-events', type=str, default=None,
+                        help='Append a JSON line per extraction, OCR window, LLM call, retry and move '
+                             'to this file, and a run summary at the end.')
+    parser.add_argument('--metrics-prometheus', type=str, default=None,
+                        help='Write the metrics totals to this Prometheus textfile (for the node_exporter '
+                             'textfile collector) at the end of the run, and while idle in watch mode.')
     return parser
 
 
-def process_file(file_path, output_directory, dry_run=False, verbose=False):
+def enable_journal(output_directory):
     """
-    Processes a single PDF file and organizes it based on extracted information.
+    Enables the job journal of the output directory.
+
+    :param output_directory: The base directory the files are organized into.
+    """
+    global journal
+    journal = JobJournal(os.path.join(output_directory, JOURNAL_FILE_NAME))
+
+
+def enable_plan(path, input_directory, output_directory):
+    """
+    Enables a plan run: the moves are recorded in a plan instead of being done.
+
+    :param path: Path to the JSON plan file to write.
+    :param input_directory: The directory scanned for PDF files.
+    :param output_directory: The base directory the files are organized into.
+    """
+    global move_plan
+    move_plan = MovePlan(path, input_directory, output_directory)
+
+
+def _journal(file_path, state, reason=None, doc_info=None):
+    """Records the state of a file in the journal, if enabled."""
+    if journal is not None:
+        journal.record(file_path, state, reason, doc_info)
+
+
+def _resumed_info(file_path):
+    """Returns the document information of a file analyzed, but not moved, by an interrupted run."""
+    entry = journal.entry(file_path) if journal is not None else None
+    if entry and entry["state"] == "analyzed":
+        return entry["doc_info"]
+    return None
+
+
+def journal_files(file_paths, resume=False):
+    """
+    Records discovered files in the journal. When resuming, files already
+    moved are skipped and files already analyzed keep their analysis.
+
+    :param file_paths: Iterable of PDF file paths.
+    :param resume: If True, resume from the states of the journal.
+    :return: A generator of the PDF file paths to process.
+    """
+    for file_path in file_paths:
+        if journal is not None:
+            entry = journal.entry(file_path) if resume else None
+            if entry and entry["state"] in ("moved", "skipped"):
+                resume_stats["skipped"] += 1
+                continue
+            if entry and entry["state"] == "analyzed" and entry["doc_info"]:
+                resume_stats["reused"] += 1
+            else:
+                journal.record(file_path, "discovered")
+        yield file_path
+
+
+def enable_duplicate_index(output_directory, policy="skip", threshold=0.9, dry_run=False):
+    """
+    Enables duplicate detection against the index of the output directory.
+
+    :param output_directory: The base directory the files are organized into.
+    :param policy: What happens to duplicates: "skip", "move" or "flag".
+    :param threshold: Minimum estimated similarity of near-duplicate texts.
+    :param dry_run: If True, keep the index in memory, to report the
+                    duplicates within the run without writing anything.
+    """
+    global duplicate_index, duplicate_policy
+    path = ":memory:" if dry_run else os.path.join(output_directory, INDEX_FILE_NAME)
+    duplicate_index = DuplicateIndex(path, threshold)
+    duplicate_policy = policy
+
+
+def find_exact_duplicate(file_path, content_hash=None):
+    """
+    Looks up a file in the duplicate index by content hash.
 
     :param file_path: Path to the PDF file.
+    :param content_hash: The SHA-256 hash of the file, if already computed.
+    :return: A (content_hash, original) tuple, original being the index
+             entry of the first copy or None. (None, None) if detection is disabled.
+    """
+    if duplicate_index is None:
+        return None, None
+    content_hash = content_hash or file_hash(file_path)
+    original = duplicate_index.find_exact(content_hash)
+    if original:
+        duplicate_stats["exact"] += 1
+    return content_hash, original
+
+
+def find_near_duplicate(pdf_content):
+    """
+    Looks up a document text in the duplicate index by MinHash similarity.
+
+    :param pdf_content: The text extracted from the file.
+    :return: A (signature, original) tuple, original being the index entry
+             of the most similar document or None. (None, None) if detection is disabled.
+    """
+    if duplicate_index is None:
+        return None, None
+    signature = minhash_signature(pdf_content)
+    original, _ = duplicate_index.find_similar(signature)
+    if original:
+        duplicate_stats["near"] += 1
+    return signature, original
+
+
+def _duplicate_path(directory, file_path):
+    """Returns the path of a duplicate next to its original, numbered by place() if it is taken."""
+    stem, extension = os.path.splitext(os.path.basename(file_path))
+    return os.path.join(directory, f"{stem} (duplicate){extension}")
+
+
+def place_duplicate(file_path, original, output_directory, dry_run=False, verbose=False):
+    """
+    Handles a duplicate file according to the duplicate policy, reusing the
+    analysis of the original.
+
+    :param file_path: Path to the duplicate PDF file.
+    :param original: The index entry of the original.
     :param output_directory: The base directory to organize the file into.
     :param dry_run: If True, simulate the process without moving files.
     :param verbose: If True, print detailed information.
     """
+    print(colorama.Fore.YELLOW +
+          f"{file_path} is a duplicate of {original['path']}" + colorama.Fore.RESET)
+    if duplicate_policy == "skip":
+        _journal(file_path, "skipped", f"duplicate of {original['path']}")
+    elif duplicate_policy == "move" and original["destination"]:
+        new_file_path = _duplicate_path(os.path.dirname(original["destination"]), file_path)
+        if move_plan is not None:
+            move_plan.add(file_path, original["doc_info"], new_file_path)
+            return
+        if dry_run:
+            print(colorama.Fore.YELLOW + f"[DRY RUN] Would move {file_path} to {new_file_path}" +
+                  colorama.Fore.RESET)
+            return
+        new_file_path = place(file_path, new_file_path)
+        _journal(file_path, "moved")
+        if verbose:
+            print(colorama.Fore.GREEN + f"File moved to: {new_file_path}" + colorama.Fore.RESET)
+    else:
+        doc_info = original["doc_info"]
+        if duplicate_policy == "flag":
+            doc_info = dict(doc_info, subject=f"DUPLICATE {doc_info['subject']}")
+        place_file(file_path, output_directory, doc_info, dry_run, verbose)
+
+
+def remember_document(content_hash, file_path, doc_info, signature=None, destination=None):
+    """Adds an analyzed document to the duplicate index, if enabled."""
+    if duplicate_index is not None and content_hash:
+        duplicate_index.add(content_hash, file_path, doc_info, signature, destination)
+
+
+def extract_file(file_path, verbose=False):
+    """
+    Extracts the text of a PDF file, reporting files without text.
+
+    :param file_path: Path to the PDF file.
+    :param verbose: If True, print detailed information.
+    :return: The extracted text, or None if no text could be extracted.
+    """
     if verbose:
         print(colorama.Fore.CYAN +
               f"Processing: {file_path}" + colorama.Fore.RESET)
 
-    try:
-        # Extract text from PDF
-        pdf_content = extract_text_from_pdf(file_path)
-
-        if pdf_content:
-            # Analyze document to extract required information
-            doc_info = analyze_document(pdf_content)
-
-            if doc_info:
-                if dry_run:
-                    print(colorama.Fore.YELLOW + f"[DRY RUN] Would move {
-                          file_path} based on:" + colorama.Fore.RESET)
-                    for key, value in doc_info.items():
-                        print(f"  {key}: {value}")
-                else:
-                    # Organize file based on extracted information
-                    new_file_path = organize_file(
-                        file_path, output_directory, doc_info)
-                    if verbose:
-                        print(
-                            colorama.Fore.GREEN + f"File moved to: {new_file_path}" + colorama.Fore.RESET)
-            else:
-                print(colorama.Fore.RED + f"Could not extract required information from: {
-                      file_path}" + colorama.Fore.RESET)
+    pdf_content = extract_text_from_pdf(file_path)
+    if not pdf_content:
+        print(colorama.Fore.RED +
+              f"Could not extract text from: {file_path}" + colorama.Fore.RESET)
+        return None
+    return pdf_content
+
+
+def analyze_file(file_path, pdf_content, combined=False, max_in_flight=1, rules=False):
+    """
+    Analyzes the text of a PDF file, reporting files that could not be analyzed.
+
+    :param file_path: Path to the PDF file.
+    :param pdf_content: The text extracted from the file.
+    :param combined: If True, extract all fields with a single LLM call.
+    :param max_in_flight: Maximum number of concurrent per-field LLM requests.
+    :param rules: If True, resolve obvious fields with rules before asking the LLM.
+    :return: The extracted document information, or None if the analysis failed.
+    """
+    with metrics.timed("analyze", file=file_path) as event:
+        doc_info = analyze_document(
+            pdf_content, combined=combined, max_in_flight=max_in_flight, rules=rules)
+        event["errors"] = 0 if doc_info else 1
+    if not doc_info:
+        print(colorama.Fore.RED + f"Could not extract required information from: {
+              file_path}" + colorama.Fore.RESET)
+        return None
+    return doc_info
+
+
+def _first_result():
+    """Records the time from startup to the first placed file, once per run."""
+    if startup_stats["started"] is None or startup_stats["first_result"] is not None:
+        return
+    startup_stats["first_result"] = time.perf_counter() - startup_stats["started"]
+    metrics.record("first_result", seconds=startup_stats["first_result"])
+
+
+def place_file(file_path, output_directory, doc_info, dry_run=False, verbose=False, content_hash=None):
+    """
+    Moves a PDF file to its place in the output directory, records the move
+    in a plan run, or reports it in dry-run mode.
+
+    :param file_path: Path to the PDF file.
+    :param output_directory: The base directory to organize the file into.
+    :param doc_info: The extracted document information.
+    :param dry_run: If True, simulate the process without moving files.
+    :param verbose: If True, print detailed information.
+    :param content_hash: The SHA-256 hash of the file, if already computed.
+    :return: The new path of the file, or None if it was not moved.
+    """
+    if move_plan is not None:
+        target = target_path(file_path, output_directory, doc_info)
+        move_plan.add(file_path, doc_info, target, content_hash)
+        _first_result()
+        if verbose:
+            print(colorama.Fore.YELLOW + f"Planned: {file_path} -> {target}" + colorama.Fore.RESET)
+        return None
+    if dry_run:
+        print(colorama.Fore.YELLOW + f"[DRY RUN] Would move {
+              file_path} based on:" + colorama.Fore.RESET)
+        for key, value in doc_info.items():
+            print(f"  {key}: {value}")
+        _first_result()
+        return None
+    else:
+        # Organize file based on extracted information
+        new_file_path = organize_file(
+            file_path, output_directory, doc_info)
+        if new_file_path:
+            _journal(file_path, "moved")
+            _first_result()
         else:
-            print(colorama.Fore.RED +
-                  f"Could not extract text from: {file_path}" + colorama.Fore.RESET)
+            _journal(file_path, "failed", "move failed")
+        if verbose:
+            print(
+                colorama.Fore.GREEN + f"File moved to: {new_file_path}" + colorama.Fore.RESET)
+        return new_file_path
+
+
+def process_file(file_path, output_directory, dry_run=False, verbose=False, combined=False, max_in_flight=1,
+                 rules=False):
+    """
+    Processes a single PDF file and organizes it based on extracted information.
+
+    :param file_path: Path to the PDF file.
+    :param output_directory: The base directory to organize the file into.
+    :param dry_run: If True, simulate the process without moving files.
+    :param verbose: If True, print detailed information.
+    :param combined: If True, extract all fields with a single LLM call.
+    :param max_in_flight: Maximum number of concurrent per-field LLM requests.
+    :param rules: If True, resolve obvious fields with rules before asking the LLM.
+    """
+    try:
+        content_hash = signature = None
+        doc_info = _resumed_info(file_path)
+        if doc_info is None:
+            content_hash, original = find_exact_duplicate(file_path)
+            if original:
+                place_duplicate(file_path, original, output_directory, dry_run, verbose)
+                return
+            pdf_content = extract_file(file_path, verbose)
+            if not pdf_content:
+                _journal(file_path, "failed", "no text extracted")
+                return
+            _journal(file_path, "extracted")
+            signature, original = find_near_duplicate(pdf_content)
+            if original:
+                place_duplicate(file_path, original, output_directory, dry_run, verbose)
+                return
+            doc_info = analyze_file(file_path, pdf_content, combined, max_in_flight, rules)
+            if not doc_info:
+                _journal(file_path, "failed", "analysis failed")
+                return
+            _journal(file_path, "analyzed", doc_info=doc_info)
+        new_file_path = place_file(file_path, output_directory, doc_info, dry_run, verbose, content_hash)
+        remember_document(content_hash, file_path, doc_info, signature, new_file_path)
 
     except Exception as e:
+        _journal(file_path, "failed", str(e))
         print(colorama.Fore.RED +
               f"Error processing {file_path}: {str(e)}" + colorama.Fore.RESET)
 
 
-def process_directory(input_directory, output_directory, dry_run=False, recursive=False, verbose=False):
+def find_pdf_files(input_directory, recursive=False, output_directory=None):
+    """
+    Lists the PDF files of a directory, filtered and ordered as configured
+    by file_discovery.discovery_settings.
+
+    :param input_directory: The directory to scan for PDF files.
+    :param recursive: If True, scan subdirectories recursively.
+    :param output_directory: The output directory, skipped when it is inside the input one.
+    :return: A generator of PDF file paths.
+    """
+    return discover_files(input_directory, recursive, [output_directory] if output_directory else [])
+
+
+def _extract_in_worker(file_path):
+    """
+    Extracts a file's text in an extraction worker process, along with the
+    work it took and the metrics events it recorded.
+    """
+    stats_before = dict(extraction_stats)
+    pdf_content = extract_text_from_pdf(file_path)
+    stats = {key: extraction_stats[key] - stats_before[key] for key in extraction_stats}
+    return pdf_content, stats, metrics.drain()
+
+
+def _init_extract_worker(text_cache_path, text_cache_size, settings, rasterization):
+    """Initializes an extraction worker process with the parent's cache and OCR settings."""
+    # The events are handed over to the parent, which writes the exports.
+    metrics.buffer_events()
+    # Several extraction workers OCR at once, each with a single-threaded
+    # tesseract, so they don't oversubscribe the CPU with OpenMP threads.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    ocr_settings.update(settings)
+    raster_settings.update(rasterization)
+    if text_cache_path:
+        enable_text_cache(text_cache_path, text_cache_size)
+
+
+def process_directory_pipelined(file_paths, output_directory, dry_run=False, verbose=False, combined=False,
+                                max_in_flight=1, extract_workers=1, llm_workers=1, queue_size=8, rules=False):
+    """
+    Processes PDF files through a staged pipeline: duplicate detection by
+    content hash, text extraction in a process pool, LLM analysis in a
+    thread pool and file organization in a single thread. The stages run
+    concurrently and are connected by bounded queues, so throughput is
+    limited by the slowest stage.
+
+    :param file_paths: Iterable of PDF file paths.
+    :param output_directory: The base directory to organize the files into.
+    :param dry_run: If True, simulate the process without moving files.
+    :param verbose: If True, print detailed information.
+    :param combined: If True, extract all fields with a single LLM call.
+    :param max_in_flight: Maximum number of concurrent per-field LLM requests.
+    :param extract_workers: Number of text extraction processes.
+    :param llm_workers: Number of documents analyzed concurrently.
+    :param queue_size: Maximum number of files waiting in front of each stage.
+    :param rules: If True, resolve obvious fields with rules before asking the LLM.
+    :return: A dictionary of per-stage statistics.
+    """
+    text_cache = pdf_processor.text_cache
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=extract_workers,
+        initializer=_init_extract_worker,
+        initargs=(text_cache.path if text_cache else None,
+                  text_cache.max_bytes if text_cache else 0,
+                  dict(ocr_settings), dict(raster_settings)),
+    ) as executor:
+
+        def dedup(file_path):
+            if _resumed_info(file_path) is not None:
+                return file_path, None
+            content_hash, original = find_exact_duplicate(file_path)
+            if original:
+                place_duplicate(file_path, original, output_directory, dry_run, verbose)
+                return None
+            return file_path, content_hash
+
+        def extract(item):
+            file_path, content_hash = item
+            doc_info = _resumed_info(file_path)
+            if doc_info is not None:
+                return file_path, content_hash, None, doc_info
+            if verbose:
+                print(colorama.Fore.CYAN +
+                      f"Processing: {file_path}" + colorama.Fore.RESET)
+            pdf_content, stats, events = executor.submit(_extract_in_worker, file_path).result()
+            for key, value in stats.items():
+                extraction_stats[key] += value
+            metrics.replay(events)
+            if not pdf_content:
+                print(colorama.Fore.RED +
+                      f"Could not extract text from: {file_path}" + colorama.Fore.RESET)
+                _journal(file_path, "failed", "no text extracted")
+                return None
+            _journal(file_path, "extracted")
+            return file_path, content_hash, pdf_content, None
+
+        def analyze(item):
+            file_path, content_hash, pdf_content, doc_info = item
+            if doc_info is not None:
+                return file_path, content_hash, None, doc_info
+            signature, original = find_near_duplicate(pdf_content)
+            if original:
+                place_duplicate(file_path, original, output_directory, dry_run, verbose)
+                return None
+            doc_info = analyze_file(file_path, pdf_content, combined, max_in_flight, rules)
+            if not doc_info:
+                _journal(file_path, "failed", "analysis failed")
+                return None
+            _journal(file_path, "analyzed", doc_info=doc_info)
+            return file_path, content_hash, signature, doc_info
+
+        def place(item):
+            file_path, content_hash, signature, doc_info = item
+            if content_hash:
+                # Identical files analyzed concurrently all pass the dedup
+                # stage: the first one organized is the original.
+                _, original = find_exact_duplicate(file_path, content_hash)
+                if original:
+                    place_duplicate(file_path, original, output_directory, dry_run, verbose)
+                    return
+            new_file_path = place_file(file_path, output_directory, doc_info, dry_run, verbose, content_hash)
+            remember_document(content_hash, file_path, doc_info, signature, new_file_path)
+
+        def failed(item, error):
+            file_path = item if isinstance(item, str) else item[0]
+            _journal(file_path, "failed", str(error))
+
+        return run_pipeline(file_paths, [
+            Stage('dedup', dedup, on_error=failed),
+            Stage('extract', extract, extract_workers, failed),
+            Stage('analyze', analyze, llm_workers, failed),
+            Stage('organize', place, on_error=failed),
+        ], queue_size)
+
+
+def _on_idle():
+    """Persists the journal and the metrics while watch mode waits for new files."""
+    if journal is not None:
+        journal.flush()
+    metrics.flush()
+
+
+def process_directory(input_directory, output_directory, dry_run=False, recursive=False, verbose=False,
+                      combined=False, max_in_flight=1, extract_workers=1, llm_workers=1, queue_size=8,
+                      rules=False, resume=False, watch=False, watch_settle=2.0, watch_interval=5.0):
     """
     Processes a directory and organizes PDF files based on extracted information.
 
@@ -81,21 +672,147 @@ def process_directory(input_directory, output_directory, dry_run=False, recursiv
     :param dry_run: If True, simulate the process without moving files.
     :param recursive: If True, scan subdirectories recursively.
     :param verbose: If True, print detailed information.
+    :param combined: If True, extract all fields with a single LLM call.
+    :param max_in_flight: Maximum number of concurrent per-field LLM requests.
+    :param extract_workers: Number of text extraction processes. The staged
+                            pipeline is used when this or llm_workers is above 1.
+    :param llm_workers: Number of documents analyzed concurrently.
+    :param queue_size: Maximum number of files waiting in front of each pipeline stage.
+    :param rules: If True, resolve obvious fields with rules before asking the LLM.
+    :param resume: If True, resume an interrupted run from the journal.
+    :param watch: If True, keep running and process the PDF files as they land.
+    :param watch_settle: Seconds a new file must stay unchanged before it is processed.
+    :param watch_interval: Seconds between two scans where inotify is not available.
+    :return: A dictionary of per-stage statistics, with a single "process"
+             stage when the files are processed one at a time.
     """
-    if recursive:
-        for root, _, files in os.walk(input_directory):
-            for file in files:
-                if file.lower().endswith('.pdf'):
-                    file_path = os.path.join(root, file)
-                    process_file(file_path, output_directory, dry_run, verbose)
+    if watch:
+        file_paths = watch_pdf_files(
+            input_directory, recursive, watch_settle, watch_interval,
+            on_idle=_on_idle,
+            exclude=[output_directory])
+        file_paths = (path for path in file_paths if accepts_path(path, input_directory))
     else:
-        for file in os.listdir(input_directory):
-            if file.lower().endswith('.pdf'):
-                file_path = os.path.join(input_directory, file)
-                process_file(file_path, output_directory, dry_run, verbose)
+        file_paths = find_pdf_files(input_directory, recursive, output_directory)
+    file_paths = journal_files(file_paths, resume)
+    if extract_workers > 1 or llm_workers > 1:
+        stage_stats = process_directory_pipelined(
+            file_paths, output_directory, dry_run, verbose, combined, max_in_flight,
+            extract_workers, llm_workers, queue_size, rules)
+        if verbose:
+            for name, stats in stage_stats.items():
+                print(colorama.Fore.CYAN +
+                      f"Stage {name}: {stats['items']} files, {stats['workers']} workers, "
+                      f"busy {stats['busy_time']:.1f}s over {stats['elapsed']:.1f}s." + colorama.Fore.RESET)
+    else:
+        stage = Stage('process', lambda file_path: process_file(
+            file_path, output_directory, dry_run, verbose, combined, max_in_flight, rules))
+        start = time.perf_counter()
+        for file_path in file_paths:
+            stage.process(file_path)
+        stage_stats = {stage.name: stage.stats(time.perf_counter() - start)}
+    return stage_stats
+
+
+def print_time_per_stage(totals):
+    """
+    Prints where the time of the run went, from the metrics totals.
+
+    :param totals: The totals per event, as returned by metrics.summary().
+    """
+    stages = [("discover", "Discovery"), ("extract", "Text extraction"), ("ocr", "OCR"), ("analyze", "Analysis"),
+              ("llm", "LLM requests"), ("organize", "Moves")]
+    parts = [f"{label} {totals[event]['seconds']:.1f}s" for event, label in stages
+             if totals.get(event, {}).get("seconds")]
+    if not parts:
+        return
+    print(colorama.Fore.CYAN + "Time per stage: " + ", ".join(parts) + "." + colorama.Fore.RESET)
+    llm = totals.get("llm")
+    if llm:
+        print(colorama.Fore.CYAN +
+              f"Ollama: {llm['prompt_tokens']} prompt tokens evaluated in {llm['prompt_eval_seconds']:.1f}s, "
+              f"{llm['eval_tokens']} tokens generated in {llm['eval_seconds']:.1f}s, "
+              f"model loads {llm['load_seconds']:.1f}s, "
+              f"{totals.get('retry', {}).get('count', 0)} failed attempts." + colorama.Fore.RESET)
+
+
+def warm_up_model(pool, keep_alive):
+    """
+    Loads the model on the Ollama hosts, recording how long it took.
+
+    :param pool: The LLMPool of the run.
+    :param keep_alive: How long the hosts keep the model loaded.
+    """
+    start = time.perf_counter()
+    pool.load_model(document_analyzer.ollamaModel, keep_alive)
+    startup_stats["warm_up"] = time.perf_counter() - start
+
+
+def setup_apply_argparse():
+    parser = argparse.ArgumentParser(
+        prog='main.py apply',
+        description='Apply a move plan written by a --plan run, without extracting or analyzing the files again.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('plan', type=str,
+                        help='The JSON plan file.')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of files hashed and moved at once.')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Number of planned moves applied per batch.')
+    parser.add_argument('--placement', choices=file_organizer.placement_modes, default=file_organizer.placement_mode,
+                        help='How files are placed in the output directory, as for a normal run.')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Enable verbose output.')
+    return parser
+
+
+def apply_main(argv=None):
+    """
+    Applies a reviewed move plan: each file is moved to its planned target
+    once its content hash is checked against the plan.
+
+    :param argv: The command-line arguments after "apply".
+    """
+    colorama.init()
+    args = setup_apply_argparse().parse_args(argv)
+    try:
+        plan = MovePlan.load(args.plan)
+    except Exception as e:
+        print(colorama.Fore.RED + f"Error: could not read the plan {args.plan}: {str(e)}" + colorama.Fore.RESET)
+        return
+    file_organizer.placement_mode = args.placement
+    if plan.output_directory:
+        enable_journal(plan.output_directory)
+        for entry in plan.entries:
+            _journal(entry["source"], "analyzed", doc_info=entry["doc_info"])
+
+    def report(entry, state, detail):
+        if state == "moved":
+            _journal(entry["source"], "moved")
+            if args.verbose:
+                print(colorama.Fore.GREEN + f"File moved to: {detail}" + colorama.Fore.RESET)
+        else:
+            _journal(entry["source"], "failed", detail)
+            print(colorama.Fore.YELLOW + f"Not moved {entry['source']}: {detail}" + colorama.Fore.RESET)
+
+    start = time.perf_counter()
+    try:
+        counts = apply_plan(plan, args.workers, args.batch_size, report)
+    finally:
+        if journal is not None:
+            journal.close()
+    print(colorama.Fore.GREEN +
+          f"Plan applied in {time.perf_counter() - start:.1f}s: {counts['moved']} files moved, "
+          f"{counts['changed']} changed since the plan, {counts['missing']} missing, "
+          f"{counts['failed']} failed." + colorama.Fore.RESET)
 
 
 def main():
+    startup_stats["started"] = time.perf_counter()
+    if sys.argv[1:2] == ["apply"]:
+        apply_main(sys.argv[2:])
+        return
     colorama.init()
     parser = setup_argparse()
     args = parser.parse_args()
@@ -104,16 +821,164 @@ def main():
         print(colorama.Fore.RED +
               f"Error: {args.input_directory} is not a valid directory." + colorama.Fore.RESET)
         return
+    if args.plan:
+        if args.watch:
+            print(colorama.Fore.RED + "Error: --plan cannot be used with --watch." + colorama.Fore.RESET)
+            return
+        # Nothing is moved, the moves go to the plan.
+        args.dry_run = True
+    discovery_settings.update(include=args.include, exclude=args.exclude, min_size=args.min_size,
+                              max_size=args.max_size, symlinks=args.symlinks, min_age=args.min_age,
+                              order=args.order, order_window=args.order_window)
+    if not args.watch and next(walk_files(args.input_directory, args.recursive, record=False), None) is None:
+        # Nothing to do: skip connecting to Ollama and loading the model.
+        print(colorama.Fore.YELLOW +
+              f"No PDF files found in {args.input_directory}." + colorama.Fore.RESET)
+        return
 
+    file_organizer.placement_mode = args.placement
+    ocr_settings.update(min_page_chars=args.ocr_min_chars, dpi=args.ocr_dpi,
+                        escalation_dpi=sorted(args.ocr_escalation_dpi), min_confidence=args.ocr_min_confidence,
+                        binarize=not args.no_ocr_binarize)
+    # Every extraction worker can run its own pool of OCR workers.
+    ocr_workers = min(args.ocr_workers, max(1, (os.cpu_count() or 1) // max(1, args.extract_workers)))
+    if ocr_workers < args.ocr_workers:
+        print(colorama.Fore.YELLOW +
+              f"Using {ocr_workers} OCR workers per extraction worker to stay within the CPU cores."
+              + colorama.Fore.RESET)
+    raster_settings.update(window=args.ocr_window, to_disk=not args.ocr_in_memory,
+                           max_memory_mb=args.ocr_max_memory, ocr_workers=ocr_workers)
+    document_analyzer.prompt_token_budget = args.prompt_token_budget
+    document_analyzer.prompt_layout = args.prompt_layout
+    document_analyzer.keep_alive = args.keep_alive
+    if args.keep_alive is None:
+        # Keep the model loaded through the run, and between files landing
+        # minutes apart in watch mode. The server still releases it if the
+        # run dies before the end.
+        document_analyzer.keep_alive = "1h" if args.watch else "30m"
+    rule_extractor.confidence_threshold = args.rule_threshold
+    pool = enable_llm_pool(args.ollama_hosts or default_hosts(), args.ollama_connections)
+    if len(pool.endpoints) > 1:
+        healthy = pool.check_all()
+        print(colorama.Fore.CYAN +
+              f"Ollama hosts: {len(healthy)}/{len(pool.endpoints)} healthy." + colorama.Fore.RESET)
+    if not args.skip_model_check:
+        problems = pool.check_model(document_analyzer.ollamaModel)
+        if problems:
+            for problem in problems:
+                print(colorama.Fore.RED + f"Error: {problem}" + colorama.Fore.RESET)
+            return
     if not args.dry_run and not os.path.isdir(args.output_directory):
         print(colorama.Fore.YELLOW +
               f"Creating output directory: {args.output_directory}" + colorama.Fore.RESET)
         os.makedirs(args.output_directory, exist_ok=True)
+    if args.type_model:
+        load_type_model(args.type_model, args.type_threshold)
+    if not args.no_llm_cache:
+        enable_llm_cache(args.llm_cache_path, args.llm_cache_size * 1024 * 1024)
+    if not args.no_text_cache:
+        enable_text_cache(args.text_cache_path, args.text_cache_size * 1024 * 1024)
 
+    metrics.enable_metrics(args.metrics_events, args.metrics_prometheus)
+    if not args.dry_run:
+        enable_journal(args.output_directory)
+    if args.duplicates:
+        enable_duplicate_index(args.output_directory, args.duplicates, args.duplicate_threshold, args.dry_run)
+    if args.plan:
+        enable_plan(args.plan, args.input_directory, args.output_directory)
+
+    # Load the model while the first files are scanned and their text extracted.
+    threading.Thread(target=warm_up_model, args=(pool, document_analyzer.keep_alive), daemon=True).start()
     print(colorama.Fore.CYAN + "Starting PDF processing..." + colorama.Fore.RESET)
-    process_directory(args.input_directory, args.output_directory,
-                      args.dry_run, args.recursive, args.verbose)
+    if args.watch:
+        print(colorama.Fore.CYAN +
+              f"Watching {args.input_directory} for new PDF files, press Ctrl+C to stop." + colorama.Fore.RESET)
+    try:
+        process_directory(args.input_directory, args.output_directory,
+                          args.dry_run, args.recursive, args.verbose, args.combined,
+                          args.max_in_flight, args.extract_workers, args.llm_workers,
+                          args.queue_size, args.rules, args.resume,
+                          args.watch, args.watch_settle, args.watch_interval)
+    except KeyboardInterrupt:
+        if not args.watch:
+            raise
+    finally:
+        if journal is not None:
+            journal.close()
+        if duplicate_index is not None:
+            duplicate_index.close()
+        if move_plan is not None:
+            move_plan.write()
+        pool.close()
+        metrics.close()
     print(colorama.Fore.GREEN + "PDF processing completed." + colorama.Fore.RESET)
+    if move_plan is not None:
+        print(colorama.Fore.CYAN +
+              f"Plan: {len(move_plan.entries)} moves written to {args.plan}. Review it, then apply it with: "
+              f"python main.py apply {args.plan}" + colorama.Fore.RESET)
+    if journal is not None:
+        counts = journal.counts()
+        print(colorama.Fore.CYAN +
+              f"Journal: {counts['moved']} files moved, {counts['failed']} failed "
+              f"({journal.path})." + colorama.Fore.RESET)
+    if args.duplicates:
+        print(colorama.Fore.CYAN +
+              f"Duplicates: {duplicate_stats['exact']} byte-identical, "
+              f"{duplicate_stats['near']} near-duplicate files." + colorama.Fore.RESET)
+    if args.resume:
+        print(colorama.Fore.CYAN +
+              f"Resumed: {resume_stats['skipped']} files already moved, "
+              f"{resume_stats['reused']} analyses reused." + colorama.Fore.RESET)
+    if discovery_stats['skipped']:
+        print(colorama.Fore.CYAN +
+              f"Discovery: {discovery_stats['files']} files ({discovery_stats['bytes'] / 1024 ** 2:.1f} MB), "
+              f"{discovery_stats['skipped']} skipped by the filters." + colorama.Fore.RESET)
+    if args.placement != "move" or placement_stats['copied'] or placement_stats['collisions']:
+        print(colorama.Fore.CYAN +
+              f"Placement: {placement_stats['renamed']} renamed, {placement_stats['linked']} linked, "
+              f"{placement_stats['copied']} copied ({placement_stats['bytes_copied'] / 1024 ** 2:.1f} MB), "
+              f"{placement_stats['collisions']} renamed to avoid overwriting a file." + colorama.Fore.RESET)
+    print(colorama.Fore.CYAN +
+          f"Text extraction: {extraction_stats['files']} files, "
+          f"cache hits: {extraction_stats['cache_hits']}, "
+          f"pages OCR'd: {extraction_stats['pages_ocr']}/{extraction_stats['pages']}, "
+          f"escalated: {extraction_stats['pages_escalated']}." + colorama.Fore.RESET)
+    print(colorama.Fore.CYAN +
+          f"LLM calls: {llm_stats['calls']} ({llm_stats['prompt_tokens']} prompt tokens), "
+          f"cache hits: {llm_stats['cache_hits']}." + colorama.Fore.RESET)
+    if repair_stats['calls_saved'] or pool_stats['breaker_trips']:
+        print(colorama.Fore.CYAN +
+              f"Repaired responses: {repair_stats['calls_saved']} LLM calls saved "
+              f"({repair_stats['salvaged']} tool calls salvaged, {repair_stats['enum_fixes']} values normalized), "
+              f"circuit breaker trips: {pool_stats['breaker_trips']}." + colorama.Fore.RESET)
+    print_time_per_stage(metrics.summary())
+    if startup_stats["first_result"] is not None:
+        warm_up = "" if startup_stats["warm_up"] is None else f" (model loaded in {startup_stats['warm_up']:.1f}s)"
+        print(colorama.Fore.CYAN +
+              f"Startup to first result: {startup_stats['first_result']:.1f}s{warm_up}." + colorama.Fore.RESET)
+    if len(pool.endpoints) > 1:
+        hosts = ", ".join(f"{host['host']} {host['requests']}" for host in pool.stats())
+        print(colorama.Fore.CYAN +
+              f"Requests per Ollama host: {hosts}; {pool_stats['failovers']} failovers, "
+              f"{pool_stats['ejections']} ejections." + colorama.Fore.RESET)
+    if args.type_model:
+        print(colorama.Fore.CYAN +
+              f"Types classified locally: {llm_stats['type_model_hits']}." + colorama.Fore.RESET)
+    if args.prompt_token_budget:
+        print(colorama.Fore.CYAN +
+              f"Prompt compaction: ~{compaction_stats['tokens_before']} document tokens reduced to "
+              f"~{compaction_stats['tokens_after']}." + colorama.Fore.RESET)
+    if args.rules:
+        documents = rule_extractor.rule_stats['documents'] or 1
+        hit_rates = ", ".join(f"{field} {hits / documents:.0%}"
+                              for field, hits in rule_extractor.rule_stats['hits'].items())
+        print(colorama.Fore.CYAN +
+              f"Rules: hit rates {hit_rates}, "
+              f"{rule_extractor.rule_stats['calls_avoided']} LLM calls avoided." + colorama.Fore.RESET)
+    if args.combined:
+        print(colorama.Fore.CYAN +
+              f"Saved by combined extraction: {llm_stats['calls_saved']} calls, "
+              f"~{llm_stats['prompt_tokens_saved']} prompt tokens." + colorama.Fore.RESET)
 
 
 if __name__ == "__main__":
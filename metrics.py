@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Totals of the recorded events, keyed by (event, field): the number of
+# events and the sum of each of their numeric values.
+event_totals = {}
+
+# Open JSON-lines event stream and Prometheus textfile path, see enable_metrics().
+_events_file = None
+prometheus_path = None
+
+# Events recorded in a worker process, handed over to the parent with drain().
+_buffer = None
+
+_lock = threading.Lock()
+_started = time.time()
+
+
+def enable_metrics(events_path=None, prometheus=None):
+    """
+    Enables the metrics exports.
+
+    :param events_path: Path to the file the events are appended to, as JSON lines.
+    :param prometheus: Path to the Prometheus textfile written by flush() and close().
+    """
+    global _events_file, prometheus_path
+    prometheus_path = prometheus
+    if events_path:
+        directory = os.path.dirname(os.path.abspath(events_path))
+        os.makedirs(directory, exist_ok=True)
+        _events_file = open(events_path, 'a', encoding='utf-8', buffering=1)
+
+
+def buffer_events():
+    """Keeps the events of this (worker) process in memory, until drain() hands them over."""
+    global _buffer
+    _buffer = []
+
+
+def drain():
+    """
+    Returns and forgets the events buffered in this process.
+
+    :return: A list of events, to be passed to replay() in the parent process.
+    """
+    global _buffer
+    events, _buffer = _buffer or [], []
+    return events
+
+
+def replay(events):
+    """Records events drained from a worker process."""
+    for entry in events:
+        _store(entry)
+
+
+def record(event, **fields):
+    """
+    Records an event: adds it to the totals and writes it to the event stream.
+
+    :param event: The event name, such as "extract" or "llm".
+    :param fields: The event values. Numbers (but not booleans) are summed in
+                   the totals; the "field" value, if any, splits the totals.
+                   Other values, such as strings or a dictionary of details,
+                   only go to the event stream.
+    """
+    _store({"time": round(time.time(), 3), "event": event, **fields})
+
+
+def _store(entry):
+    with _lock:
+        totals = event_totals.setdefault((entry["event"], entry.get("field")), {"count": 0})
+        totals["count"] += 1
+        for key, value in entry.items():
+            if key != "time" and isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+        if _buffer is not None:
+            _buffer.append(entry)
+        elif _events_file is not None:
+            _events_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def timed(event, **fields):
+    """
+    Records an event with the wall time of the enclosed block, in seconds,
+    and whether it raised.
+
+    :param event: The event name.
+    :param fields: Other event values. The block can add values to the
+                   yielded dictionary.
+    """
+    values = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield values
+    except Exception:
+        values["errors"] = 1
+        raise
+    finally:
+        record(event, seconds=round(time.perf_counter() - start, 6), **values)
+
+
+def summary():
+    """
+    Sums the totals of each event over its fields.
+
+    :return: A dictionary of totals per event.
+    """
+    with _lock:
+        result = {}
+        for (event, _), totals in sorted(event_totals.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            merged = result.setdefault(event, {})
+            for key, value in totals.items():
+                merged[key] = merged.get(key, 0) + value
+    for merged in result.values():
+        for key, value in merged.items():
+            if isinstance(value, float):
+                merged[key] = round(value, 6)
+    return result
+
+
+def _metric_name(*parts):
+    return "_".join(["pdf_sorter", *parts]).replace("-", "_")
+
+
+def write_prometheus(path):
+    """
+    Writes the totals in the Prometheus text format, atomically, for the
+    node_exporter textfile collector.
+
+    :param path: Path to the .prom file.
+    """
+    lines = []
+    with _lock:
+        series = {}
+        for (event, field), totals in event_totals.items():
+            labels = f'{{field="{field}"}}' if field is not None else ""
+            for key, value in totals.items():
+                name = _metric_name(event, "events_total" if key == "count" else f"{key}_total")
+                series.setdefault(name, []).append(f"{name}{labels} {value}")
+    for name in sorted(series):
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(sorted(series[name]))
+    lines.append("# TYPE pdf_sorter_run_start_timestamp_seconds gauge")
+    lines.append(f"pdf_sorter_run_start_timestamp_seconds {_started:.3f}")
+    lines.append("# TYPE pdf_sorter_run_duration_seconds gauge")
+    lines.append(f"pdf_sorter_run_duration_seconds {time.time() - _started:.3f}")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        file.write("\n".join(lines) + "\n")
+    os.replace(temporary_path, path)
+
+
+def flush():
+    """Writes the Prometheus textfile, if enabled."""
+    if prometheus_path:
+        write_prometheus(prometheus_path)
+
+
+def close():
+    """Records the run summary in the event stream, closes it and writes the Prometheus textfile."""
+    global _events_file
+    if _events_file is not None:
+        record("run", seconds=round(time.time() - _started, 3), totals=summary())
+        _events_file.close()
+        _events_file = None
+    flush()
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from file_organizer import place
+from pdf_processor import file_hash
+
+# Version of the plan file format.
+PLAN_VERSION = 1
+
+# Running totals of the planned and applied moves. Changed files no longer
+# have the content hash they were analyzed with, missing files are gone.
+plan_stats = {
+    "planned": 0,
+    "applied": 0,
+    "changed": 0,
+    "missing": 0,
+    "failed": 0,
+}
+
+
+class MovePlan:
+    """
+    The moves decided by a plan run: for each file, its content hash, the
+    extracted information and its target path. The plan is written as JSON
+    for review, then applied without extracting or analyzing anything again.
+    """
+
+    def __init__(self, path, input_directory=None, output_directory=None, entries=None):
+        """
+        :param path: Path to the JSON plan file.
+        :param input_directory: The directory the files were found in.
+        :param output_directory: The base directory the files are organized into.
+        :param entries: The planned moves, for a loaded plan.
+        """
+        self.path = path
+        self.input_directory = os.path.abspath(input_directory) if input_directory else None
+        self.output_directory = os.path.abspath(output_directory) if output_directory else None
+        self.entries = entries or []
+        self._lock = threading.Lock()
+
+    def add(self, file_path, doc_info, target, content_hash=None):
+        """
+        Adds a move to the plan.
+
+        :param file_path: Path to the file.
+        :param doc_info: The extracted document information.
+        :param target: The path the file is to be moved to.
+        :param content_hash: The SHA-256 hash of the file, computed if not given.
+        """
+        entry = {
+            "source": os.path.abspath(file_path),
+            "hash": content_hash or file_hash(file_path),
+            "size": os.path.getsize(file_path),
+            "doc_info": doc_info,
+            "target": os.path.abspath(target),
+        }
+        with self._lock:
+            self.entries.append(entry)
+            plan_stats["planned"] += 1
+
+    def write(self):
+        """Writes the plan to its file, atomically."""
+        with self._lock:
+            data = {
+                "version": PLAN_VERSION,
+                "created": datetime.now(timezone.utc).isoformat(),
+                "input_directory": self.input_directory,
+                "output_directory": self.output_directory,
+                "entries": sorted(self.entries, key=lambda entry: entry["source"]),
+            }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+        os.replace(temporary, self.path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a plan file.
+
+        :param path: Path to the JSON plan file.
+        :return: The MovePlan.
+        :raises ValueError: If the file is not a plan of a supported version.
+        """
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+        if not isinstance(data, dict) or data.get("version") != PLAN_VERSION:
+            raise ValueError(f"{path} is not a version {PLAN_VERSION} move plan.")
+        return cls(path, data.get("input_directory"), data.get("output_directory"), data["entries"])
+
+
+def apply_entry(entry):
+    """
+    Moves a file as planned, after checking it still has the content it was
+    analyzed with.
+
+    :param entry: The planned move.
+    :return: A (state, detail) tuple: ("moved", new path), or ("changed",
+             "missing" or "failed", reason).
+    """
+    try:
+        if file_hash(entry["source"]) != entry["hash"]:
+            return "changed", "content changed since the plan"
+    except FileNotFoundError:
+        return "missing", "file no longer exists"
+    except Exception as e:
+        return "failed", str(e)
+    try:
+        return "moved", place(entry["source"], entry["target"])
+    except Exception as e:
+        return "failed", str(e)
+
+
+def apply_plan(plan, workers=8, batch_size=64, on_result=None):
+    """
+    Applies a plan: the files are hashed and moved by parallel workers, a
+    batch of entries at a time.
+
+    :param plan: The MovePlan.
+    :param workers: Number of files hashed and moved at once.
+    :param batch_size: Number of entries per batch; on_result is called for
+                       each entry of a batch once the whole batch is done.
+    :param on_result: Optional function called with each entry, its state and detail.
+    :return: A dictionary of the number of entries per state.
+    """
+    counts = {"moved": 0, "changed": 0, "missing": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(plan.entries), batch_size):
+            batch = plan.entries[start:start + batch_size]
+            batch_start = time.perf_counter()
+            results = list(executor.map(apply_entry, batch))
+            metrics.record("apply", files=len(batch), bytes=sum(entry.get("size", 0) for entry in batch),
+                           seconds=round(time.perf_counter() - batch_start, 6))
+            for entry, (state, detail) in zip(batch, results):
+                counts[state] += 1
+                plan_stats["applied" if state == "moved" else state] += 1
+                if on_result is not None:
+                    on_result(entry, state, detail)
+    return counts
@@ -1,27 +1,452 @@
-import PyPDF2
-from pdf2image import convert_from_path
-import pytesseract
+import os
+import hashlib
+import json
+import time
+import tempfile
+import concurrent.futures
+import metrics
+from disk_cache import DiskCache
+
+# Bump whenever the extraction logic changes, to invalidate cached texts.
+EXTRACTOR_VERSION = 3
+
+# Settings affecting the OCR output. They are part of the text cache key.
+# Pages whose text layer has fewer than min_page_chars alphanumeric
+# characters are OCR'd. They are first rendered at dpi; the pages whose mean
+# word confidence (0 to 100) is below min_confidence are rendered again at
+# each of the escalation_dpi resolutions, then binarized if binarize is set,
+# until a pass reaches min_confidence.
+ocr_settings = {
+    "dpi": 150,
+    "escalation_dpi": [300],
+    "min_confidence": 70.0,
+    "binarize": True,
+    "lang": "eng",
+    "min_page_chars": 10,
+    "grayscale": True,
+}
+
+# Settings of the page rasterization for OCR. They bound the memory used by
+# rendered pages and don't affect the OCR output.
+# - window: maximum number of pages rendered per pdftoppm call.
+# - to_disk: render pages to a temporary directory and load them one at a
+#   time, instead of holding the whole window in memory.
+# - max_memory_mb: memory budget for the rendered pages held in memory at
+#   once; the window shrinks to fit it when rendering in memory.
+# - ocr_workers: number of processes OCR'ing the windows of a document in
+#   parallel, each with a single-threaded rasterizer and tesseract.
+raster_settings = {
+    "window": 4,
+    "to_disk": True,
+    "max_memory_mb": 512,
+    "ocr_workers": 1,
+}
+
+# Running totals of text extraction work.
+extraction_stats = {
+    "files": 0,
+    "cache_hits": 0,
+    "pages": 0,
+    "pages_ocr": 0,
+    "pages_escalated": 0,
+}
+
+# Persistent cache of extracted page texts, see enable_text_cache().
+text_cache = None
+
+
+def enable_text_cache(path, max_bytes=1024 * 1024 * 1024):
+    """
+    Enables the persistent per-page text cache.
+
+    :param path: Path to the SQLite cache file.
+    :param max_bytes: Maximum size of the cached texts, in bytes.
+    """
+    global text_cache
+    text_cache = DiskCache(path, max_bytes)
+
+
+def file_hash(file_path):
+    """
+    Computes the SHA-256 hash of a file's content.
+
+    :param file_path: Path to the file.
+    :return: The hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _text_cache_key(content_hash):
+    """Builds the text cache key from a file hash, the extractor version and the OCR settings."""
+    settings = json.dumps(ocr_settings, sort_keys=True)
+    return f"{content_hash}|v{EXTRACTOR_VERSION}|{settings}"
+
+
+def page_text_quality(text):
+    """
+    Scores the text extracted from a page's text layer.
+
+    :param text: The extracted text.
+    :return: The number of alphanumeric characters in the text.
+    """
+    return sum(1 for char in text if char.isalnum())
+
+
+def rendered_page_bytes(width, height):
+    """
+    Estimates the memory taken by a page once rendered for OCR.
+
+    :param width: Page width in PDF points.
+    :param height: Page height in PDF points.
+    :return: The size of the decoded image, in bytes.
+    """
+    scale = ocr_settings["dpi"] / 72
+    channels = 1 if ocr_settings["grayscale"] else 3
+    return int(width * scale) * int(height * scale) * channels
+
+
+def ocr_windows(page_numbers, page_bytes, max_window=None):
+    """
+    Groups the pages to OCR into windows of consecutive pages rendered
+    together, within the configured window size and memory budget.
+
+    :param page_numbers: Sorted 1-based numbers of the pages to OCR.
+    :param page_bytes: Dictionary of estimated rendered size per page number.
+    :param max_window: Maximum window size, defaults to raster_settings["window"].
+    :return: A list of (first_page, last_page) tuples.
+    """
+    max_window = max_window or raster_settings["window"]
+    budget = raster_settings["max_memory_mb"] * 1024 * 1024
+    windows = []
+    for number in page_numbers:
+        if windows:
+            first, last = windows[-1]
+            size = last - first + 1
+            window_bytes = sum(page_bytes.get(page, 0) for page in range(first, number + 1))
+            fits_memory = raster_settings["to_disk"] or not budget or window_bytes <= budget
+            if number == last + 1 and size < max_window and fits_memory:
+                windows[-1] = (first, number)
+                continue
+        windows.append((number, number))
+    return windows
+
+
+def _render(file_path, first, last, dpi):
+    """
+    Renders a window of consecutive pages of a PDF file.
+
+    :param file_path: Path to the PDF file.
+    :param first: 1-based number of the first page of the window.
+    :param last: 1-based number of the last page of the window.
+    :param dpi: The resolution to render at.
+    :return: A generator of (page_number, image) tuples, in page order.
+    """
+    # Rasterization libraries are only loaded once a page needs OCR.
+    from pdf2image import convert_from_path
+    from PIL import Image
+
+    # A single rasterizer thread: parallelism comes from the OCR workers.
+    options = dict(dpi=dpi, grayscale=ocr_settings["grayscale"],
+                   first_page=first, last_page=last, thread_count=1)
+    if raster_settings["to_disk"]:
+        with tempfile.TemporaryDirectory(prefix="pdf-ocr-") as output_folder:
+            paths = convert_from_path(file_path, output_folder=output_folder,
+                                      paths_only=True, fmt="png", **options)
+            for number, path in zip(range(first, last + 1), sorted(paths)):
+                image = Image.open(path)
+                # Loaded now, so the image outlives the temporary directory.
+                image.load()
+                yield number, image
+    else:
+        images = convert_from_path(file_path, **options)
+        images.reverse()
+        for number in range(first, last + 1):
+            yield number, images.pop()
+
+
+def _binarize(image):
+    """
+    Thresholds a rendered page to black and white at Otsu's level, which
+    restores faint, low-contrast or unevenly lit text.
+
+    :param image: The rendered page.
+    :return: A new black and white image.
+    """
+    gray = image.convert("L")
+    histogram = gray.histogram()
+    total = sum(histogram)
+    total_sum = sum(level * count for level, count in enumerate(histogram))
+    below = below_sum = 0
+    threshold, best_variance = 127, 0.0
+    for level, count in enumerate(histogram):
+        below += count
+        if not below:
+            continue
+        if below == total:
+            break
+        below_sum += level * count
+        mean_below = below_sum / below
+        mean_above = (total_sum - below_sum) / (total - below)
+        variance = below * (total - below) * (mean_below - mean_above) ** 2
+        if variance > best_variance:
+            threshold, best_variance = level, variance
+    binarized = gray.point(lambda value: 255 if value > threshold else 0)
+    if gray is not image:
+        gray.close()
+    return binarized
+
+
+def _ocr_image(image):
+    """
+    Runs OCR on a rendered page.
+
+    :param image: The rendered page.
+    :return: A (text, confidence) tuple: the text, one line per OCR'd line
+             and a blank line between paragraphs, and the mean confidence
+             of its words, from 0 to 100 (0 when no word was found, the
+             text then being empty).
+    """
+    import pytesseract
+
+    data = pytesseract.image_to_data(image, lang=ocr_settings["lang"],
+                                     output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for index, word in enumerate(data["text"]):
+        confidence = float(data["conf"][index])
+        # Pages, blocks, paragraphs and lines have a confidence of -1.
+        if confidence < 0 or not word.strip():
+            continue
+        key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+
+    text = ""
+    paragraph = None
+    for (block, par, _), words in lines.items():
+        if paragraph is not None and paragraph != (block, par):
+            text += "\n"
+        paragraph = (block, par)
+        text += " ".join(words) + "\n"
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
+def _escalate(file_path, number, image, result):
+    """
+    Runs further OCR passes on a page whose first pass is below
+    ocr_settings["min_confidence"]: the page is rendered again at each
+    higher escalation DPI, then binarized, stopping at the first pass that
+    reaches the threshold.
+
+    :param file_path: Path to the PDF file.
+    :param number: 1-based number of the page.
+    :param image: The page rendered for the first pass, closed here.
+    :param result: The result of the first pass.
+    :return: The result of the most confident pass, with the number of passes.
+    """
+    best = result
+    passes = 1
+    dpi = result["dpi"]
+    try:
+        for dpi in sorted(level for level in ocr_settings["escalation_dpi"] if level > result["dpi"]):
+            for _, rendered in _render(file_path, number, number, dpi):
+                image.close()
+                image = rendered
+            text, confidence = _ocr_image(image)
+            passes += 1
+            if confidence > best["confidence"]:
+                best = {"text": text, "dpi": dpi, "confidence": confidence, "binarized": False}
+            if confidence >= ocr_settings["min_confidence"]:
+                break
+        else:
+            if ocr_settings["binarize"]:
+                binarized = _binarize(image)
+                try:
+                    text, confidence = _ocr_image(binarized)
+                finally:
+                    binarized.close()
+                passes += 1
+                if confidence > best["confidence"]:
+                    best = {"text": text, "dpi": dpi, "confidence": confidence, "binarized": True}
+    finally:
+        image.close()
+    return dict(best, passes=passes)
+
+
+def ocr_window(file_path, first, last):
+    """
+    Renders a window of consecutive pages of a PDF file at the first-pass
+    DPI and runs OCR on them. Only the pages below the confidence threshold
+    go through further passes, see _escalate(). Pages without any word, such
+    as the blank backs of scanned sheets, are final after the first pass.
+
+    :param file_path: Path to the PDF file.
+    :param first: 1-based number of the first page of the window.
+    :param last: 1-based number of the last page of the window.
+    :return: A generator of (page_number, result) tuples, in page order. The
+             result is a dictionary of the text, the DPI and confidence of
+             the kept pass, whether it was binarized, and the number of passes.
+    """
+    for number, image in _render(file_path, first, last, ocr_settings["dpi"]):
+        try:
+            text, confidence = _ocr_image(image)
+        except Exception:
+            image.close()
+            raise
+        result = {"text": text, "dpi": ocr_settings["dpi"], "confidence": confidence, "binarized": False}
+        if text and confidence < ocr_settings["min_confidence"]:
+            yield number, _escalate(file_path, number, image, result)
+        else:
+            image.close()
+            yield number, dict(result, passes=1)
+
+
+def _ocr_window_in_worker(file_path, first, last):
+    """Runs ocr_window in an OCR worker process and also returns its wall time."""
+    start = time.perf_counter()
+    return list(ocr_window(file_path, first, last)), time.perf_counter() - start
+
+
+def _init_ocr_worker(settings, rasterization):
+    """Initializes an OCR worker process with the parent's settings."""
+    # Each worker runs a single-threaded tesseract, so the workers don't
+    # oversubscribe the CPU with OpenMP threads.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    ocr_settings.update(settings)
+    raster_settings.update(rasterization)
+
+
+def _record_pages(file_path, results):
+    """Records the DPI, confidence and number of passes of each OCR'd page."""
+    for number, result in results:
+        # The page number, DPI and confidence would make meaningless totals,
+        # they only go to the event stream.
+        details = {"page": number, "dpi": result["dpi"], "confidence": round(result["confidence"], 2)}
+        metrics.record("ocr_page", file=file_path, passes=result["passes"],
+                       escalated=int(result["passes"] > 1), details=details)
+
+
+def ocr_pages(file_path, page_numbers, page_bytes=None):
+    """
+    Renders pages of a PDF file and runs OCR on them, streaming through
+    small windows of pages so only a few rendered pages exist at a time.
+
+    With raster_settings["ocr_workers"] above 1, the windows are spread over
+    a pool of worker processes.
+
+    :param file_path: Path to the PDF file.
+    :param page_numbers: 1-based numbers of the pages to OCR.
+    :param page_bytes: Dictionary of estimated rendered size per page number,
+                       used to fit the windows in the memory budget.
+    :return: A generator of (page_number, result) tuples, in page order,
+             see ocr_window().
+    """
+    workers = min(raster_settings["ocr_workers"], len(page_numbers))
+    if workers <= 1:
+        for first, last in ocr_windows(sorted(page_numbers), page_bytes or {}):
+            with metrics.timed("ocr", pages=last - first + 1):
+                results = list(ocr_window(file_path, first, last))
+            _record_pages(file_path, results)
+            yield from results
+        return
+
+    # Shrink the windows so that every worker gets at least one.
+    max_window = max(1, min(raster_settings["window"], len(page_numbers) // workers))
+    windows = ocr_windows(sorted(page_numbers), page_bytes or {}, max_window)
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_ocr_worker,
+        initargs=(dict(ocr_settings), dict(raster_settings)),
+    ) as executor:
+        futures = [executor.submit(_ocr_window_in_worker, file_path, first, last)
+                   for first, last in windows]
+        for (first, last), future in zip(windows, futures):
+            results, seconds = future.result()
+            metrics.record("ocr", pages=last - first + 1, seconds=round(seconds, 6))
+            _record_pages(file_path, results)
+            yield from results
+
+
+def extract_pages(file_path):
+    """
+    Extracts the text of each page of a PDF file using PyPDF2, falling back
+    to OCR for the pages whose text layer is empty or too poor.
+
+    :param file_path: Path to the PDF file.
+    :return: A list of dictionaries with the page number, the text and the
+             method that produced it ("text" for the text layer, "ocr" for OCR).
+             OCR'd pages also have the DPI and mean word confidence of their
+             kept OCR pass.
+    """
+    import PyPDF2
+
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        pages = []
+        page_bytes = {}
+        for number, page in enumerate(reader.pages, start=1):
+            pages.append({"page": number, "method": "text", "text": page.extract_text() or ""})
+            page_bytes[number] = rendered_page_bytes(
+                float(page.mediabox.width), float(page.mediabox.height))
+
+    to_ocr = {
+        page["page"]: page for page in pages
+        if page_text_quality(page["text"]) < ocr_settings["min_page_chars"]
+    }
+    for number, result in ocr_pages(file_path, set(to_ocr), page_bytes):
+        page = to_ocr[number]
+        extraction_stats["pages_ocr"] += 1
+        if result["passes"] > 1:
+            extraction_stats["pages_escalated"] += 1
+        page["dpi"] = result["dpi"]
+        page["confidence"] = round(result["confidence"], 2)
+        if page_text_quality(result["text"]) > page_text_quality(page["text"]):
+            page["text"] = result["text"]
+            page["method"] = "ocr"
+    extraction_stats["pages"] += len(pages)
+
+    return pages
+
 
 def extract_text_from_pdf(file_path):
     """
     Extracts text from a PDF file using PyPDF2 and OCR if necessary.
-    
+
+    When the text cache is enabled, previously extracted files are answered
+    from the cache without parsing the PDF again.
+
     :param file_path: Path to the PDF file.
     :return: Extracted text from the PDF.
     """
+    event = {"file": file_path, "pages": 0, "pages_ocr": 0, "cache_hit": False}
+    start = time.perf_counter()
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-        
-        if not text.strip():  # If no text was extracted, use OCR
-            images = convert_from_path(file_path)
-            for image in images:
-                text += pytesseract.image_to_string(image)
-        
-        return text
+        extraction_stats["files"] += 1
+        key = _text_cache_key(file_hash(file_path)) if text_cache else None
+        pages = text_cache.get(key) if key else None
+        if pages is not None:
+            extraction_stats["cache_hits"] += 1
+            event["cache_hit"] = True
+        else:
+            ocr_before = extraction_stats["pages_ocr"]
+            pages = extract_pages(file_path)
+            event["pages_ocr"] = extraction_stats["pages_ocr"] - ocr_before
+            if key:
+                text_cache.put(key, pages, namespace="pages")
+            pages_ocr = sum(1 for page in pages if page["method"] == "ocr")
+            if pages_ocr:
+                print(f"OCR'd {pages_ocr}/{len(pages)} pages of {file_path}")
+        event["pages"] = len(pages)
+
+        return "".join(page["text"] for page in pages)
     except Exception as e:
+        event["errors"] = 1
         print(f"Error extracting text from {file_path}: {str(e)}")
-        return ""
\ No newline at end of file
+        return ""
+    finally:
+        metrics.record("extract", seconds=round(time.perf_counter() - start, 6), **event)
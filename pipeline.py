@@ -0,0 +1,143 @@
+import collections
+import queue
+import threading
+import time
+
+# Marks the end of the items flowing through a stage queue.
+_DONE = object()
+
+# Number of most recent latencies kept per stage for the percentiles, so a
+# long-running watch keeps a bounded memory.
+latency_window = 10000
+
+
+def percentile(values, q):
+    """
+    Returns a percentile of a list of values, by the nearest-rank method.
+
+    :param values: The values.
+    :param q: The percentile, between 0 and 100.
+    :return: The percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class Stage:
+    """
+    A pipeline stage: a pool of worker threads applying func to each item.
+
+    func returns the item handed to the next stage, or None to drop it.
+    """
+
+    def __init__(self, name, func, workers=1, on_error=None):
+        """
+        :param name: Name of the stage, used in the statistics.
+        :param func: Function applied to each item.
+        :param workers: Number of worker threads.
+        :param on_error: Optional function called with the item and the
+                         exception when func raises; the item is dropped.
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.on_error = on_error
+        self.items = 0
+        self.busy_time = 0.0
+        self.latencies = collections.deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+    def process(self, item):
+        """
+        Applies func to an item, recording the time it took.
+
+        :param item: The item.
+        :return: The result of func, or None if it raised.
+        """
+        start = time.perf_counter()
+        try:
+            result = self.func(item)
+        except Exception as e:
+            print(f"Error in {self.name} stage: {str(e)}")
+            if self.on_error is not None:
+                self.on_error(item, e)
+            result = None
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.items += 1
+            self.busy_time += latency
+            self.latencies.append(latency)
+        return result
+
+    def stats(self, elapsed):
+        """
+        Summarizes the work of the stage.
+
+        :param elapsed: Wall-clock time of the run, in seconds.
+        :return: A dictionary of the stage statistics.
+        """
+        with self._lock:
+            latencies = list(self.latencies)
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_time": self.busy_time,
+            "elapsed": elapsed,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+        }
+
+    def _work(self, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            result = self.process(item)
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+
+def run_pipeline(items, stages, queue_size=8):
+    """
+    Runs items through a sequence of stages running concurrently.
+
+    Stages are connected by bounded queues: when a stage falls behind, the
+    stages feeding it block, so the pipeline runs at the pace of its slowest
+    stage without buffering the whole input.
+
+    :param items: Iterable of items fed to the first stage.
+    :param stages: List of Stage instances, in order.
+    :param queue_size: Maximum number of items waiting in front of each stage.
+    :return: A dictionary of per-stage statistics (items, busy time,
+             median and 95th percentile time per item).
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    threads = []
+    for index, stage in enumerate(stages):
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+        threads.append([
+            threading.Thread(target=stage._work, args=(queues[index], outbox),
+                             name=f"{stage.name}-{worker}", daemon=True)
+            for worker in range(stage.workers)
+        ])
+    for stage_threads in threads:
+        for thread in stage_threads:
+            thread.start()
+
+    start = time.perf_counter()
+    for item in items:
+        queues[0].put(item)
+
+    # Drain the stages in order, so each stage sees its end marker only
+    # after the previous stage has handed over all of its results.
+    for index, stage in enumerate(stages):
+        for _ in range(stage.workers):
+            queues[index].put(_DONE)
+        for thread in threads[index]:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {stage.name: stage.stats(elapsed) for stage in stages}
@@ -0,0 +1,160 @@
+import re
+import textwrap
+
+# Share of the token budget given to the head and the tail of the document
+# for each field; the rest goes to an evenly spread sample of the middle.
+# Dates, emitters and recipients usually sit in the header or first page,
+# and emitters also in the footer (legal mentions, signature).
+field_slices = {
+    "subject": (0.8, 0.1),
+    "date": (0.6, 0.3),
+    "type": (0.5, 0.2),
+    "emitter": (0.5, 0.5),
+    "recipient": (0.9, 0.1),
+    "all": (0.6, 0.3),
+}
+
+# Lines carrying no information for the extractors.
+boilerplate_patterns = [
+    re.compile(r"^\W*$"),  # separators such as "-----" or "* * *"
+    re.compile(r"^(page|p\.)?\s*\d+\s*(/|sur|of)\s*\d+$", re.IGNORECASE),
+    re.compile(r"^page\s+\d+$", re.IGNORECASE),
+    re.compile(r"ne pas jeter sur la voie publique", re.IGNORECASE),
+    re.compile(r"^(imprimé|printed) le", re.IGNORECASE),
+]
+
+# Consecutive rows of the same shape kept before the rest are collapsed.
+max_similar_rows = 3
+
+# Running totals of the estimated prompt tokens before and after compaction.
+compaction_stats = {
+    "tokens_before": 0,
+    "tokens_after": 0,
+}
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of a text.
+
+    :param text: The text.
+    :return: The estimated token count (about four characters per token).
+    """
+    return (len(text) + 3) // 4
+
+
+def _row_shape(line):
+    """Returns the shape of a line: digits and letters replaced by class markers."""
+    return re.sub(r"[^\W\d_]+", "a", re.sub(r"\d+", "0", line))
+
+
+def clean_text(text):
+    """
+    Collapses whitespace, drops boilerplate and repeated lines, and
+    collapses runs of similar table rows.
+
+    :param text: The document text.
+    :return: A list of the remaining lines.
+    """
+    lines = []
+    seen = set()
+    for raw_line in text.splitlines():
+        line = " ".join(raw_line.split())
+        if any(pattern.search(line) for pattern in boilerplate_patterns):
+            continue
+        # Headers and footers repeated on every page are kept once.
+        if len(line) > 20 and line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+
+    collapsed = []
+    run = []
+    for line in lines + [None]:
+        if line is not None and run and _row_shape(line) == _row_shape(run[0]) and re.search(r"\d", line):
+            run.append(line)
+            continue
+        collapsed.extend(run[:max_similar_rows])
+        if len(run) > max_similar_rows:
+            collapsed.append(f"[... {len(run) - max_similar_rows} similar rows ...]")
+        run = [line] if line is not None else []
+    return collapsed
+
+
+def _split_long_lines(lines, max_tokens):
+    """Splits the lines longer than max_tokens into chunks, at word boundaries where possible."""
+    split = []
+    for line in lines:
+        if estimate_tokens(line) <= max_tokens:
+            split.append(line)
+        else:
+            split.extend(textwrap.wrap(line, max_tokens * 4))
+    return split
+
+
+def _take(lines, budget):
+    """Returns the leading lines of a list fitting in a token budget."""
+    taken = []
+    for line in lines:
+        budget -= estimate_tokens(line) + 1
+        if budget < 0:
+            break
+        taken.append(line)
+    return taken
+
+
+def compact(text, token_budget, field="all"):
+    """
+    Shrinks a document text to fit a token budget, keeping the slices of the
+    document most useful to the given field.
+
+    :param text: The document text.
+    :param token_budget: The maximum number of tokens of the compacted text.
+    :param field: The field the text is compacted for (a key of field_slices).
+    :return: The compacted text.
+    """
+    lines = clean_text(text)
+    cleaned = "\n".join(lines)
+    if estimate_tokens(cleaned) <= token_budget:
+        return cleaned
+
+    # Lines too long for the smallest slice are split into chunks, so a text
+    # layer made of a single long line keeps its header and footer.
+    smallest_share = min(min(shares) for shares in field_slices.values())
+    lines = _split_long_lines(lines, max(1, int(token_budget * smallest_share) - 1))
+    head_share, tail_share = field_slices.get(field, field_slices["all"])
+    head = _take(lines, int(token_budget * head_share))
+    tail = _take(reversed(lines[len(head):]), int(token_budget * tail_share))[::-1]
+    middle = lines[len(head):len(lines) - len(tail)]
+
+    middle_budget = token_budget - estimate_tokens("\n".join(head + tail)) - 20
+    sample = []
+    if middle and middle_budget > 0:
+        # Spread the middle budget over evenly spaced lines.
+        average = max(1, estimate_tokens("\n".join(middle)) // len(middle))
+        count = min(len(middle), middle_budget // (average + 1))
+        if count:
+            step = len(middle) / count
+            sample = _take([middle[int(i * step)] for i in range(count)], middle_budget)
+
+    parts = head + ["[...]"] + sample
+    if sample:
+        parts.append("[...]")
+    return "\n".join(parts + tail)
+
+
+def compact_for_field(text, token_budget, field="all"):
+    """
+    Compacts a document text for a field and records the token savings.
+
+    :param text: The document text.
+    :param token_budget: The maximum number of tokens, or None to send the text as is.
+    :param field: The field the text is compacted for.
+    :return: The text to put in the prompt.
+    """
+    if not token_budget:
+        return text
+    compacted = compact(text, token_budget, field)
+    compaction_stats["tokens_before"] += estimate_tokens(text)
+    compaction_stats["tokens_after"] += estimate_tokens(compacted)
+    return compacted
@@ -0,0 +1,153 @@
+import re
+import json
+import difflib
+import unicodedata
+import metrics
+
+# Running totals of the repaired responses. Each repaired response is an
+# LLM call saved, as the extraction would have been retried or re-asked
+# otherwise.
+repair_stats = {
+    "salvaged": 0,
+    "enum_fixes": 0,
+    "calls_saved": 0,
+}
+
+# Minimum similarity of a near-miss enum value to the allowed value it is
+# replaced with, once case, accents and spacing are ignored.
+enum_cutoff = 0.85
+
+_fenced_block = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def _fold(value):
+    """Lowercases a value and strips its accents and surrounding spaces and punctuation."""
+    decomposed = unicodedata.normalize("NFKD", value.casefold())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(folded.strip(" \t\n.,;:'\"").split())
+
+
+def normalize_enum(value, choices):
+    """
+    Maps a near-miss value to one of the allowed values, e.g. "Facture" to
+    "facture" or "Oltmanns" to "OLTMANNS".
+
+    :param value: The value returned by the model.
+    :param choices: The allowed values.
+    :return: The matching allowed value, or None if there is none.
+    """
+    if not isinstance(value, str):
+        return None
+    if value in choices:
+        return value
+    folded = {_fold(choice): choice for choice in choices}
+    if _fold(value) in folded:
+        return folded[_fold(value)]
+    close = difflib.get_close_matches(_fold(value), list(folded), n=1, cutoff=enum_cutoff)
+    return folded[close[0]] if close else None
+
+
+def _json_objects(text):
+    """Yields the JSON objects found in a text: fenced blocks first, then every balanced {...}."""
+    candidates = [block.strip() for block in _fenced_block.findall(text)]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            yield value
+    for start in (index for index, char in enumerate(text) if char == "{"):
+        try:
+            value, _ = decoder.raw_decode(text, start)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            yield value
+
+
+def _unwrap(candidate, tool_name):
+    """Returns the arguments of a tool call written as JSON, e.g. {"name": ..., "parameters": {...}}."""
+    if candidate.get("name") in (tool_name, None):
+        for key in ("arguments", "parameters"):
+            if isinstance(candidate.get(key), dict):
+                return candidate[key]
+            if isinstance(candidate.get(key), str):
+                try:
+                    return json.loads(candidate[key])
+                except ValueError:
+                    pass
+    return candidate
+
+
+def salvage_arguments(message, tool):
+    """
+    Finds the arguments of a tool call in a response message: in its tool
+    call, even when the arguments came back as a JSON string, or written as
+    JSON in its content.
+
+    :param message: The message of the Ollama response.
+    :param tool: The tool definition of the request.
+    :return: A (arguments, salvaged) tuple, salvaged telling whether the
+             arguments came from anywhere but a well-formed tool call.
+             arguments is None when no candidate has the required fields.
+    """
+    name = tool["function"]["name"]
+    required = tool["function"]["parameters"].get("required", [])
+    candidates = []
+    for tool_call in message.get("tool_calls") or []:
+        arguments = tool_call["function"]["arguments"]
+        if isinstance(arguments, dict):
+            candidates.append((arguments, False))
+        elif isinstance(arguments, str):
+            candidates.extend((_unwrap(value, name), True) for value in _json_objects(arguments))
+    content = message.get("content") or ""
+    candidates.extend((_unwrap(value, name), True) for value in _json_objects(content))
+
+    for arguments, salvaged in candidates:
+        if all(field in arguments for field in required if field != "reasoning"):
+            return arguments, salvaged
+    return None, False
+
+
+def repair_response(response, tool, field=None):
+    """
+    Repairs the tool call of an Ollama response: salvages its arguments
+    when the model wrote them into the message content or as a JSON string,
+    and maps near-miss enum values to the allowed ones.
+
+    :param response: The Ollama response.
+    :param tool: The tool definition of the request.
+    :param field: The extracted field, to label the recorded metrics.
+    :return: A response carrying a single well-formed tool call, or the
+             original response when no arguments can be salvaged.
+    """
+    arguments, salvaged = salvage_arguments(response["message"], tool)
+    if arguments is None:
+        return response
+
+    arguments = dict(arguments)
+    properties = tool["function"]["parameters"].get("properties", {})
+    if "reasoning" in properties:
+        arguments.setdefault("reasoning", "")
+    enum_fixes = 0
+    for name, schema in properties.items():
+        if "enum" in schema and name in arguments and arguments[name] not in schema["enum"]:
+            normalized = normalize_enum(arguments[name], schema["enum"])
+            if normalized is not None:
+                arguments[name] = normalized
+                enum_fixes += 1
+    if salvaged or enum_fixes:
+        repair_stats["salvaged"] += int(salvaged)
+        repair_stats["enum_fixes"] += enum_fixes
+        repair_stats["calls_saved"] += 1
+        metrics.record("repair", field=field, salvaged=int(salvaged), enum_fixes=enum_fixes, calls_saved=1)
+
+    return {
+        "message": {
+            "role": "assistant",
+            "content": response["message"].get("content") or "",
+            "tool_calls": [{"function": {"name": tool["function"]["name"], "arguments": arguments}}],
+        },
+    }
@@ -0,0 +1,158 @@
+import re
+from datetime import date
+
+# Fields the rules can resolve.
+rule_fields = ["date", "type", "recipient"]
+
+# Minimum confidence for a rule match to replace the LLM call.
+confidence_threshold = 0.9
+
+# Number of leading lines considered the document header.
+header_lines = 15
+
+# Keywords announcing each document type. Matches in the header are much
+# stronger evidence than matches in the body.
+type_keywords = {
+    "facture": [r"\bfacture\s*(n[°o]|num[ée]ro)", r"^\s*facture\b", r"^\s*invoice\b"],
+    "devis": [r"\bdevis\s*(n[°o]|num[ée]ro)", r"^\s*devis\b", r"^\s*quotation\b"],
+    "arrêt maladie": [r"\barr[êe]t de travail\b", r"\bavis d'arr[êe]t\b", r"\bcertificat m[ée]dical\b"],
+    "impots": [r"\bavis d'imp[ôo]t", r"\bimpots\.gouv\.fr\b", r"\bd[ée]claration des revenus\b"],
+    "relevé de comptes": [r"\brelev[ée] de comptes?\b", r"^\s*bank statement\b"],
+    "mail": [r"^\s*(from|de)\s*:.*@", r"^\s*(subject|objet)\s*:"],
+}
+
+months = {
+    "janvier": 1, "février": 2, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "août": 8, "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11,
+    "décembre": 12, "decembre": 12,
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+}
+
+_numeric_date = re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b")
+_iso_date = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_written_date = re.compile(
+    r"\b(\d{1,2})(?:er)?\s+(" + "|".join(months) + r")\s+(\d{4})\b", re.IGNORECASE)
+_date_label = re.compile(
+    r"\b(date|dat[ée] du|[ée]mis le|fait .{0,30}le|le)\s*(de (la )?(facture|document|[ée]mission))?\s*:?\s*$",
+    re.IGNORECASE)
+
+# Running totals of the fast path: documents seen, fields resolved and
+# LLM calls avoided.
+rule_stats = {
+    "documents": 0,
+    "hits": {field: 0 for field in rule_fields},
+    "calls_avoided": 0,
+}
+
+
+def _dates(text):
+    """Returns the valid dates of a text with the text preceding each of them."""
+    found = []
+    for pattern, order in ((_numeric_date, "dmy"), (_iso_date, "ymd"), (_written_date, "dmy")):
+        for match in pattern.finditer(text):
+            first, second, third = match.groups()
+            if order == "ymd":
+                year, month, day = int(first), int(second), int(third)
+            else:
+                day, year = int(first), int(third)
+                month = months[second.lower()] if not second.isdigit() else int(second)
+            try:
+                value = date(year, month, day)
+            except ValueError:
+                continue
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            found.append((value.isoformat(), text[line_start:match.start()]))
+    return found
+
+
+def match_date(content):
+    """
+    Finds the production date of a document.
+
+    :param content: The document text.
+    :return: A (date, confidence) tuple, date in YYYY-MM-DD format, or (None, 0).
+    """
+    found = _dates(content)
+    if not found:
+        return None, 0.0
+    labelled = {value for value, before in found if _date_label.search(before)}
+    if len(labelled) == 1:
+        return labelled.pop(), 0.95
+    distinct = {value for value, _ in found}
+    if len(distinct) == 1:
+        return distinct.pop(), 0.9
+    # Several dates: the first one is often, but not always, the right one.
+    return found[0][0], 0.5
+
+
+def match_type(content):
+    """
+    Finds the type of a document from its keywords.
+
+    :param content: The document text.
+    :return: A (type, confidence) tuple, or (None, 0).
+    """
+    header = "\n".join(content.strip().splitlines()[:header_lines])
+    scores = {}
+    for doc_type, patterns in type_keywords.items():
+        for pattern in patterns:
+            if re.search(pattern, header, re.IGNORECASE | re.MULTILINE):
+                scores[doc_type] = max(scores.get(doc_type, 0), 0.95)
+            elif re.search(pattern, content, re.IGNORECASE | re.MULTILINE):
+                scores[doc_type] = max(scores.get(doc_type, 0), 0.6)
+    if not scores:
+        return None, 0.0
+    best = max(scores, key=scores.get)
+    if len(scores) > 1:
+        return best, min(scores[best], 0.6)
+    return best, scores[best]
+
+
+def match_recipient(content, recipients):
+    """
+    Finds which of the known recipients a document is addressed to.
+
+    :param content: The document text.
+    :param recipients: The list of valid recipient names.
+    :return: A (recipient, confidence) tuple, or (None, 0).
+    """
+    counts = {}
+    for recipient in recipients:
+        # Short names are matched case-sensitively to avoid matching words.
+        flags = 0 if recipient.isupper() else re.IGNORECASE
+        count = len(re.findall(r"\b" + re.escape(recipient) + r"\b", content, flags))
+        if count:
+            counts[recipient] = count
+    if not counts:
+        return None, 0.0
+    best = max(counts, key=counts.get)
+    if len(counts) == 1:
+        return best, 0.95
+    # Several names (e.g. "Pauline OLTMANNS"): ambiguous, leave it to the LLM.
+    return best, 0.5 * counts[best] / sum(counts.values())
+
+
+def pre_extract(content, recipients, threshold=None):
+    """
+    Resolves the date, type and recipient of a document with deterministic
+    rules, keeping only the matches confident enough to skip the LLM.
+
+    :param content: The document text.
+    :param recipients: The list of valid recipient names.
+    :param threshold: Minimum confidence, defaults to confidence_threshold.
+    :return: A dictionary of the resolved fields and their values.
+    """
+    threshold = confidence_threshold if threshold is None else threshold
+    matches = {
+        "date": match_date(content),
+        "type": match_type(content),
+        "recipient": match_recipient(content, recipients),
+    }
+    rule_stats["documents"] += 1
+    resolved = {}
+    for field, (value, confidence) in matches.items():
+        if value is not None and confidence >= threshold:
+            resolved[field] = value
+            rule_stats["hits"][field] += 1
+    return resolved
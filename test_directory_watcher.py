@@ -0,0 +1,83 @@
+import os
+import tempfile
+import time
+import unittest
+
+from directory_watcher import Debouncer, InotifyWatcher, PollingWatcher, scan_pdf_files, watch_pdf_files
+
+
+def write(path, data=b"%PDF-1.4", age=0):
+    with open(path, "wb") as file:
+        file.write(data)
+    if age:
+        timestamp = time.time() - age
+        os.utime(path, (timestamp, timestamp))
+
+
+class TestDirectoryWatcher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_scan_pdf_files(self):
+        os.makedirs(os.path.join(self.directory, "sub"))
+        write(os.path.join(self.directory, "a.PDF"))
+        write(os.path.join(self.directory, "notes.txt"))
+        write(os.path.join(self.directory, "sub", "b.pdf"))
+        self.assertEqual(list(scan_pdf_files(self.directory)), [os.path.join(self.directory, "a.PDF")])
+        self.assertEqual(len(list(scan_pdf_files(self.directory, recursive=True))), 2)
+
+    def test_debouncer_waits_for_files_to_settle(self):
+        old = os.path.join(self.directory, "old.pdf")
+        fresh = os.path.join(self.directory, "fresh.pdf")
+        write(old, age=60)
+        write(fresh)
+        debouncer = Debouncer(settle=30)
+        debouncer.add(old)
+        debouncer.add(fresh)
+        self.assertEqual(debouncer.ready(), [old])
+        self.assertGreater(debouncer.next_check(), 0)
+
+        # A file still growing restarts its wait.
+        write(fresh, b"%PDF-1.4 more", age=60)
+        self.assertEqual(debouncer.ready(), [])
+        self.assertEqual(debouncer.ready(), [fresh])
+        self.assertIsNone(debouncer.next_check())
+
+    def test_polling_watcher_reports_changes(self):
+        write(os.path.join(self.directory, "existing.pdf"))
+        watcher = PollingWatcher(self.directory, interval=0)
+        new = os.path.join(self.directory, "new.pdf")
+        write(new)
+        self.assertEqual(watcher.wait(), [new])
+        self.assertEqual(watcher.wait(), [])
+
+    @unittest.skipUnless(os.uname().sysname == "Linux", "inotify is Linux only")
+    def test_inotify_watcher_reports_written_files(self):
+        watcher = InotifyWatcher(self.directory, recursive=True)
+        try:
+            self.assertEqual(watcher.wait(0), [])
+            os.makedirs(os.path.join(self.directory, "sub"))
+            watcher.wait(1)
+            new = os.path.join(self.directory, "sub", "new.pdf")
+            write(new)
+            self.assertIn(new, watcher.wait(1))
+        finally:
+            watcher.close()
+
+    def test_watch_yields_existing_files_and_skips_excluded(self):
+        output = os.path.join(self.directory, "output")
+        os.makedirs(output)
+        existing = os.path.join(self.directory, "existing.pdf")
+        write(existing, age=60)
+        write(os.path.join(output, "sorted.pdf"), age=60)
+        files = watch_pdf_files(self.directory, recursive=True, settle=0.1, exclude=[output])
+        self.assertEqual(next(files), existing)
+        files.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
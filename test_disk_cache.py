@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_values_persist_across_instances(self):
+        cache = DiskCache(self.path)
+        cache.put('key', {'date': '2023-05-15'})
+        cache.close()
+
+        cache = DiskCache(self.path)
+        self.assertEqual(cache.get('key'), {'date': '2023-05-15'})
+        self.assertIsNone(cache.get('missing'))
+        cache.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DiskCache(self.path, max_bytes=250)
+        cache.put('a', 'x' * 98)
+        cache.put('b', 'x' * 98)
+        cache.get('a')
+        cache.put('c', 'x' * 98)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+        cache.close()
+
+    def test_total_size_is_kept_up_to_date(self):
+        cache = DiskCache(self.path, max_bytes=250)
+        self.assertEqual(cache.size(), 0)
+        cache.put('a', 'x' * 98)
+        cache.put('a', 'x' * 48)
+        self.assertEqual(cache.size(), 50)
+        cache.put('b', 'x' * 98)
+        cache.put('c', 'x' * 98)
+        self.assertEqual(cache.size(), 250)
+        # 'a' and 'b' are evicted to fit 'd'.
+        cache.put('d', 'x' * 98)
+        self.assertEqual(cache.size(), 200)
+        self.assertIsNone(cache.get('b'))
+        cache.close()
+
+        # Reopening the cache keeps its total.
+        cache = DiskCache(self.path, max_bytes=250)
+        self.assertEqual(cache.size(), 200)
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import ollama
+
+import document_analyzer
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm_pool import LLMPool
+from rule_extractor import rule_stats
+
+
+def tool_response(arguments, prompt_eval_count=100):
+    """Builds a fake Ollama chat response carrying a single tool call."""
+    return {
+        "message": {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{"function": {"name": "push", "arguments": arguments}}],
+        },
+        "prompt_eval_count": prompt_eval_count,
+    }
+
+
+class TestCombinedExtraction(unittest.TestCase):
+    def setUp(self):
+        for key in document_analyzer.llm_stats:
+            document_analyzer.llm_stats[key] = 0
+
+    def test_combined_uses_single_call(self):
+        arguments = {
+            "subject": "Facture Loyer",
+            "date": "2023-05-15",
+            "type": "facture",
+            "emitter": "TechCorp",
+            "recipient": "WAX",
+            "reasoning": "Invoice.",
+        }
+        with mock.patch.object(ollama.Client, "chat",
+                               return_value=tool_response(arguments)) as chat:
+            info = document_analyzer.analyze_document("content", combined=True)
+
+        self.assertEqual(chat.call_count, 1)
+        self.assertEqual(info["type"], "facture")
+        self.assertEqual(info["recipient"], "WAX")
+        self.assertEqual(document_analyzer.llm_stats["calls_saved"], 4)
+        self.assertEqual(document_analyzer.llm_stats["prompt_tokens_saved"], 400)
+
+    def test_combined_reasks_only_invalid_fields(self):
+        combined = {
+            "subject": "Facture Loyer",
+            "date": "15/05/2023",
+            "type": "facture",
+            "emitter": "TechCorp",
+            "recipient": "Wax Industries",
+            "reasoning": "Invoice.",
+        }
+        responses = [
+            tool_response(combined),
+            tool_response({"date": "2023-05-15", "reasoning": "Explicit."}),
+            tool_response({"recipient": "WAX", "confidence": "High", "reasoning": "Client."}),
+        ]
+        with mock.patch.object(ollama.Client, "chat",
+                               side_effect=responses) as chat:
+            info = document_analyzer.analyze_document("content", combined=True)
+
+        self.assertEqual(chat.call_count, 3)
+        self.assertEqual(info["date"], "2023-05-15")
+        self.assertEqual(info["recipient"], "WAX")
+        self.assertEqual(document_analyzer.llm_stats["calls_saved"], 2)
+
+    def test_savings_are_only_counted_for_combined_calls_made(self):
+        arguments = {"subject": "Facture Loyer", "date": "2023-05-15", "type": "facture",
+                     "emitter": "TechCorp", "recipient": "WAX", "reasoning": "Invoice."}
+        with tempfile.TemporaryDirectory() as directory:
+            document_analyzer.enable_llm_cache(os.path.join(directory, "llm_cache.sqlite"))
+            try:
+                with mock.patch.object(ollama.Client, "chat", return_value=tool_response(arguments)):
+                    document_analyzer.analyze_document("content", combined=True)
+                    document_analyzer.analyze_document("content", combined=True)
+            finally:
+                document_analyzer.llm_cache.close()
+                document_analyzer.llm_cache = None
+        # The second run was answered from the cache.
+        self.assertEqual(document_analyzer.llm_stats["calls_saved"], 4)
+        self.assertEqual(document_analyzer.llm_stats["prompt_tokens_saved"], 400)
+
+        responses = [tool_response({"reasoning": "Unreadable."})] + [
+            tool_response(answer) for answer in (
+                {"subject": "Facture", "reasoning": "Title."},
+                {"date": "2023-05-15", "reasoning": "Explicit."},
+                {"type": "facture", "reasoning": "Invoice."},
+                {"emitter": "TechCorp", "confidence": "High", "reasoning": "Header."},
+                {"recipient": "WAX", "confidence": "High", "reasoning": "Client."},
+            )]
+        with mock.patch.object(ollama.Client, "chat", side_effect=responses):
+            document_analyzer.analyze_document("other content", combined=True)
+        # Six calls instead of five: nothing saved, rather than a negative saving.
+        self.assertEqual(document_analyzer.llm_stats["calls_saved"], 4)
+        self.assertEqual(document_analyzer.llm_stats["prompt_tokens_saved"], 400)
+
+    def test_savings_of_concurrent_documents(self):
+        answers = {
+            "first": {"subject": "Facture Loyer", "date": "2023-05-15", "type": "facture",
+                      "emitter": "TechCorp", "recipient": "WAX", "reasoning": "Invoice."},
+            "second": {"subject": "Contrat", "date": "05/2023", "type": "facture",
+                       "emitter": "TechCorp", "recipient": "WAX", "reasoning": "Contract."},
+        }
+        second_done = threading.Event()
+
+        def chat(model, messages, tools, keep_alive=None):
+            document = "first" if "first document" in json.dumps(messages) else "second"
+            if "subject" not in tools[0]["function"]["parameters"]["properties"]:
+                # The second document's date is asked again.
+                response = tool_response({"date": "2023-05-01", "reasoning": "Explicit."})
+                second_done.set()
+                return response
+            if document == "first":
+                # The second document's calls are made while the first one's
+                # combined call is in flight.
+                second_done.wait(5)
+            return tool_response(answers[document])
+
+        with mock.patch.object(ollama.Client, "chat", side_effect=chat):
+            thread = threading.Thread(target=document_analyzer.analyze_document,
+                                      args=("first document",), kwargs={"combined": True})
+            thread.start()
+            info = document_analyzer.analyze_document("second document", combined=True)
+            thread.join()
+
+        self.assertEqual(info["date"], "2023-05-01")
+        self.assertEqual(document_analyzer.llm_stats["calls"], 3)
+        # 4 calls saved on the first document, 3 on the second.
+        self.assertEqual(document_analyzer.llm_stats["calls_saved"], 7)
+        self.assertEqual(document_analyzer.llm_stats["prompt_tokens_saved"], 400 + 300)
+
+    def test_validate_field(self):
+        self.assertTrue(document_analyzer.validate_field("date", "2023-05-15"))
+        self.assertFalse(document_analyzer.validate_field("date", "15/05/2023"))
+        self.assertFalse(document_analyzer.validate_field("type", "invoice"))
+        self.assertFalse(document_analyzer.validate_field("recipient", "Martin"))
+        self.assertFalse(document_analyzer.validate_field("subject", ""))
+
+
+class TestRuleFastPath(unittest.TestCase):
+    def test_rule_resolved_fields_skip_the_llm(self):
+        content = "Facture n° 12\nDate: 15/05/2023\nClient: WAX Industries"
+        responses = [
+            tool_response({"subject": "Facture 12", "reasoning": "Title."}),
+            tool_response({"emitter": "TechCorp", "confidence": "High", "reasoning": "Header."}),
+        ]
+        with mock.patch.object(ollama.Client, "chat",
+                               side_effect=responses) as chat:
+            info = document_analyzer.analyze_document(content, rules=True)
+
+        self.assertEqual(chat.call_count, 2)
+        self.assertEqual(info, {"subject": "Facture 12", "date": "2023-05-15", "type": "facture",
+                                "emitter": "TechCorp", "recipient": "WAX"})
+
+    def test_model_typed_fields_are_not_counted_as_rule_hits(self):
+        content = "Facture n° 12\nClient: WAX Industries"
+        type_model = mock.Mock(predict=mock.Mock(return_value=("facture", 0.99)))
+        responses = [
+            tool_response({"subject": "Facture 12", "reasoning": "Title."}),
+            tool_response({"date": "2023-05-15", "reasoning": "Explicit."}),
+            tool_response({"emitter": "TechCorp", "confidence": "High", "reasoning": "Header."}),
+        ]
+        avoided = rule_stats["calls_avoided"]
+        with mock.patch.object(document_analyzer, "type_model", type_model), \
+                mock.patch.object(document_analyzer, "_resolve_with_rules", return_value={"recipient": "WAX"}), \
+                mock.patch.object(ollama.Client, "chat", side_effect=responses) as chat:
+            info = document_analyzer.analyze_document(content, rules=True)
+
+        self.assertEqual(chat.call_count, 3)
+        self.assertEqual(info["type"], "facture")
+        self.assertEqual(rule_stats["calls_avoided"], avoided + 1)
+
+
+class TestLLMCache(unittest.TestCase):
+    answers = [
+        tool_response({"subject": "Facture", "reasoning": "Title."}),
+        tool_response({"date": "2023-05-15", "reasoning": "Explicit."}),
+        tool_response({"type": "facture", "reasoning": "Invoice."}),
+        tool_response({"emitter": "TechCorp", "confidence": "High", "reasoning": "Header."}),
+        tool_response({"recipient": "WAX", "confidence": "High", "reasoning": "Client."}),
+    ]
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        document_analyzer.enable_llm_cache(
+            os.path.join(self.temp_dir.name, "llm_cache.sqlite"))
+
+    def tearDown(self):
+        document_analyzer.llm_cache.close()
+        document_analyzer.llm_cache = None
+        self.temp_dir.cleanup()
+
+    def test_rerun_is_served_from_cache(self):
+        with mock.patch.object(ollama.Client, "chat",
+                               side_effect=self.answers) as chat:
+            first = document_analyzer.analyze_document("content")
+            second = document_analyzer.analyze_document("content")
+
+        self.assertEqual(chat.call_count, 5)
+        self.assertEqual(first, second)
+
+    def test_type_description_edit_only_invalidates_type(self):
+        with mock.patch.object(ollama.Client, "chat",
+                               side_effect=self.answers):
+            document_analyzer.analyze_document("content")
+
+        types = dict(document_analyzer.valid_types, facture="An invoice")
+        with mock.patch.object(document_analyzer, "valid_types", types), \
+                mock.patch.object(ollama.Client, "chat",
+                                  return_value=self.answers[2]) as chat:
+            document_analyzer.analyze_document("content")
+
+        self.assertEqual(chat.call_count, 1)
+        self.assertIn("An invoice", chat.call_args.kwargs["messages"][1]["content"])
+
+
+class TestPromptLayout(unittest.TestCase):
+    def tearDown(self):
+        document_analyzer.prompt_layout = "classic"
+
+    def test_classic_layout_is_unchanged(self):
+        self.assertEqual(document_analyzer.build_request("date", "content"),
+                         document_analyzer.date_request("content"))
+
+    def test_shared_prefix_layout_starts_with_the_document(self):
+        document_analyzer.prompt_layout = "shared-prefix"
+        requests = [document_analyzer.build_request(field, "Facture n° 12")
+                    for field in document_analyzer.document_fields]
+
+        prefixes = {json.dumps(request["messages"][:2]) for request in requests}
+        self.assertEqual(len(prefixes), 1)
+        self.assertIn("Facture n° 12", requests[0]["messages"][1]["content"])
+        for field, request in zip(document_analyzer.document_fields, requests):
+            instructions = request["messages"][2]["content"]
+            self.assertNotIn("Facture n° 12", instructions)
+            self.assertIn(request["tools"][0]["function"]["name"], instructions)
+
+
+class FakeAsyncClient:
+    """Stand-in for ollama.AsyncClient answering each field after a delay."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+
+    async def chat(self, model, messages, tools, keep_alive=None):
+        field = next(name for name in tools[0]["function"]["parameters"]["required"]
+                     if name in document_analyzer.document_fields)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.answers[field][1])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        answer = self.answers[field][0]
+        if isinstance(answer, Exception):
+            raise answer
+        return tool_response(answer)
+
+
+class TestAsyncExtraction(unittest.TestCase):
+    answers = {
+        "subject": ({"subject": "Facture", "reasoning": "Title."}, 0.05),
+        "date": ({"date": "2023-05-15", "reasoning": "Explicit."}, 0.05),
+        "type": ({"type": "facture", "reasoning": "Invoice."}, 0.05),
+        "emitter": ({"emitter": "TechCorp", "confidence": "High", "reasoning": "Header."}, 0.05),
+        "recipient": ({"recipient": "WAX", "confidence": "High", "reasoning": "Client."}, 0.05),
+    }
+
+    def test_fields_run_concurrently_within_limit(self):
+        client = FakeAsyncClient(self.answers)
+        info = asyncio.run(document_analyzer.analyze_document_async(
+            "content", max_in_flight=3, client=client))
+
+        self.assertEqual(list(info), document_analyzer.document_fields)
+        self.assertEqual(client.max_in_flight, 3)
+
+    def test_critical_failure_cancels_outstanding_calls(self):
+        answers = {field: (answer, 0) for field, (answer, _) in self.answers.items()}
+        answers["date"] = (ValueError("no date"), 0.01)
+        answers["emitter"] = (answers["emitter"][0], 10)
+        client = FakeAsyncClient(answers)
+        info = asyncio.run(document_analyzer.analyze_document_async(
+            "content", max_retries=2, client=client))
+
+        self.assertIsNone(info)
+        self.assertEqual(client.cancelled, 1)
+
+
+class SlowEmitterServer(FakeOllamaServer):
+    """Stand-in Ollama server taking long on the emitter and rejecting the date requests."""
+
+    def chat(self, request):
+        required = request["tools"][0]["function"]["parameters"]["required"]
+        if "date" in required:
+            return 400, {"error": "no date"}
+        if "emitter" in required:
+            time.sleep(3)
+        return super().chat(request)
+
+
+class TestPooledAsyncExtraction(unittest.TestCase):
+    def tearDown(self):
+        document_analyzer.llm_pool = None
+
+    def test_critical_failure_aborts_outstanding_requests(self):
+        with SlowEmitterServer(latency=0) as server:
+            document_analyzer.llm_pool = LLMPool([server.url])
+            start = time.perf_counter()
+            info = document_analyzer.analyze_document("Facture du 15/05/2023", max_retries=1, max_in_flight=5)
+            elapsed = time.perf_counter() - start
+
+        self.assertIsNone(info)
+        # The emitter request is aborted instead of waited for.
+        self.assertLess(elapsed, 2)
+        self.assertEqual(document_analyzer.llm_pool.stats()[0]["requests"], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
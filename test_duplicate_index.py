@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import main
+import metrics
+from duplicate_index import DuplicateIndex, minhash_signature, similarity
+
+INVOICE = " ".join(
+    f"Ligne {number}: prestation de maintenance du serveur {number * 7} pour le client WAX Industries"
+    for number in range(40)
+)
+DOC_INFO = {"subject": "Facture maintenance", "date": "2023-05-15", "type": "facture",
+            "emitter": "TechCorp", "recipient": "WAX"}
+
+
+class TestDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "index.sqlite")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_signature_similarity(self):
+        rescanned = INVOICE.replace("Ligne 12:", "Ligne l2:")
+        other = " ".join(f"Relevé de compte opération {number} virement" for number in range(40))
+        self.assertGreater(similarity(minhash_signature(INVOICE), minhash_signature(rescanned)), 0.9)
+        self.assertLess(similarity(minhash_signature(INVOICE), minhash_signature(other)), 0.2)
+        self.assertIsNone(minhash_signature("  --- "))
+
+    def test_exact_and_near_duplicates_across_runs(self):
+        index = DuplicateIndex(self.path)
+        index.add("abc", "/inbox/a.pdf", DOC_INFO, minhash_signature(INVOICE), "/sorted/a.pdf")
+        index.close()
+
+        index = DuplicateIndex(self.path)
+        original = index.find_exact("abc")
+        self.assertEqual(original["doc_info"], DOC_INFO)
+        self.assertEqual(original["destination"], "/sorted/a.pdf")
+        self.assertIsNone(index.find_exact("def"))
+
+        rescanned = INVOICE.replace("Ligne 12:", "Ligne l2:")
+        original, score = index.find_similar(minhash_signature(rescanned))
+        self.assertEqual(original["path"], "/inbox/a.pdf")
+        self.assertGreaterEqual(score, 0.9)
+        self.assertEqual(index.find_similar(minhash_signature("Bonjour, cordialement")), (None, 0.0))
+        index.close()
+
+
+class TestDuplicatePolicy(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.inbox = os.path.join(self.temp_dir.name, "inbox")
+        self.output = os.path.join(self.temp_dir.name, "output")
+        os.makedirs(self.inbox)
+        for name in ("a.pdf", "b.pdf"):
+            with open(os.path.join(self.inbox, name), "wb") as file:
+                file.write(b"%PDF-1.4 same bytes")
+
+    def tearDown(self):
+        main.duplicate_index.close()
+        main.duplicate_index = None
+        self.temp_dir.cleanup()
+
+    def run_directory(self, policy):
+        main.enable_duplicate_index(self.output, policy)
+        with mock.patch.object(main, "extract_text_from_pdf", return_value=INVOICE), \
+                mock.patch.object(main, "analyze_document", return_value=DOC_INFO) as analyze:
+            main.process_directory(self.inbox, self.output)
+        return analyze
+
+    def test_skip_leaves_the_duplicate_in_place(self):
+        analyze = self.run_directory("skip")
+        self.assertEqual(analyze.call_count, 1)
+        self.assertEqual(len(os.listdir(self.inbox)), 1)
+
+    def test_move_puts_the_duplicate_next_to_the_original(self):
+        analyze = self.run_directory("move")
+        self.assertEqual(analyze.call_count, 1)
+        sorted_files = os.listdir(os.path.join(self.output, "facture", "2023-05"))
+        self.assertEqual(len(sorted_files), 2)
+        self.assertTrue(any("(duplicate)" in name for name in sorted_files))
+
+    def test_identical_files_analyzed_concurrently_are_detected(self):
+        main.enable_duplicate_index(self.output, "skip")
+
+        def analyze(*args, **kwargs):
+            # Both files pass the dedup stage before either is organized.
+            time.sleep(0.2)
+            return DOC_INFO
+
+        # Extraction runs in threads, so the mocks apply to it.
+        with mock.patch.object(main.concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor), \
+                mock.patch.object(metrics, "_buffer", None), \
+                mock.patch.object(main, "extract_text_from_pdf", return_value=INVOICE), \
+                mock.patch.object(main, "analyze_document", side_effect=analyze) as analyze_document:
+            main.process_directory(self.inbox, self.output, llm_workers=2)
+
+        self.assertEqual(analyze_document.call_count, 2)
+        self.assertEqual(len(os.listdir(self.inbox)), 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.output, "facture", "2023-05"))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import file_discovery
+from file_discovery import discover_files, discovery_settings, order_files, walk_files
+
+
+def write(path, size=10, age=60):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(b"%" * size)
+    timestamp = time.time() - age
+    os.utime(path, (timestamp, timestamp))
+
+
+class TestFileDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        self.settings = mock.patch.dict(discovery_settings)
+        self.settings.start()
+
+    def tearDown(self):
+        self.settings.stop()
+        self.temp_dir.cleanup()
+
+    def names(self, recursive=True, skip_directories=()):
+        return sorted(os.path.relpath(path, self.directory)
+                      for path in discover_files(self.directory, recursive, skip_directories))
+
+    def test_globs_and_recursion(self):
+        write(os.path.join(self.directory, "a.PDF"))
+        write(os.path.join(self.directory, "notes.txt"))
+        write(os.path.join(self.directory, "sub", "b.pdf"))
+        write(os.path.join(self.directory, "archive", "c.pdf"))
+        write(os.path.join(self.directory, "sub", "d-draft.pdf"))
+
+        self.assertEqual(self.names(recursive=False), ["a.PDF"])
+        discovery_settings["exclude"] = ["archive", "*draft*"]
+        self.assertEqual(self.names(), ["a.PDF", os.path.join("sub", "b.pdf")])
+        self.assertEqual(self.names(skip_directories=[os.path.join(self.directory, "sub")]),
+                         ["a.PDF"])
+
+    def test_size_and_age_filters(self):
+        write(os.path.join(self.directory, "empty.pdf"), size=0)
+        write(os.path.join(self.directory, "small.pdf"), size=100)
+        write(os.path.join(self.directory, "large.pdf"), size=10000)
+        write(os.path.join(self.directory, "copying.pdf"), size=100, age=0)
+        discovery_settings.update(min_size=1, max_size=1000, min_age=30)
+        skipped = file_discovery.discovery_stats["skipped"]
+
+        self.assertEqual(self.names(), ["small.pdf"])
+        self.assertEqual(file_discovery.discovery_stats["skipped"], skipped + 3)
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "symbolic links are not supported")
+    def test_symlink_policies(self):
+        write(os.path.join(self.directory, "real", "a.pdf"))
+        os.symlink(os.path.join(self.directory, "real"), os.path.join(self.directory, "linked"))
+        os.symlink(os.path.join(self.directory, "real", "a.pdf"), os.path.join(self.directory, "b.pdf"))
+        # A loop back to the top directory is walked once.
+        os.symlink(self.directory, os.path.join(self.directory, "real", "loop"))
+
+        self.assertEqual(self.names(), ["b.pdf", os.path.join("real", "a.pdf")])
+        discovery_settings["symlinks"] = "skip"
+        self.assertEqual(self.names(), [os.path.join("real", "a.pdf")])
+        discovery_settings["symlinks"] = "follow"
+        self.assertEqual(len(self.names()), 2)
+
+    def test_orders(self):
+        files = [("a", 5), ("b", 1), ("c", 9), ("d", 3)]
+        self.assertEqual(list(order_files(files)), ["a", "b", "c", "d"])
+        self.assertEqual(list(order_files(files, "largest-first", window=0)), ["c", "a", "d", "b"])
+        self.assertEqual(list(order_files(files, "smallest-first", window=0)), ["b", "d", "a", "c"])
+        # With a window of 1 file, each file goes out before the rest is seen.
+        self.assertEqual(list(order_files(files, "largest-first", window=1)), ["a", "c", "d", "b"])
+
+    def test_walk_streams_files(self):
+        for index in range(3):
+            write(os.path.join(self.directory, f"{index}.pdf"))
+        files = walk_files(self.directory)
+        path, size = next(files)
+        self.assertTrue(path.endswith(".pdf"))
+        self.assertEqual(size, 10)
+        files.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
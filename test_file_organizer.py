@@ -0,0 +1,92 @@
+import errno
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import file_organizer
+from file_organizer import copy_data, organize_file, place, placement_stats
+
+DOC_INFO = {"subject": "Facture", "date": "2023-05-15", "type": "facture", "emitter": "EDF", "recipient": "OLTMANNS"}
+
+
+class TestFileOrganizer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.inbox = os.path.join(self.temp_dir.name, "inbox")
+        self.output = os.path.join(self.temp_dir.name, "output")
+        os.makedirs(self.inbox)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, name, data=b"%PDF-1.4 content"):
+        path = os.path.join(self.inbox, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    def test_collisions_are_numbered_instead_of_overwritten(self):
+        first = organize_file(self.write("scan.pdf", b"first"), self.output, DOC_INFO)
+        second = organize_file(self.write("scan.pdf", b"second"), self.output, DOC_INFO)
+
+        self.assertTrue(first.endswith("Facture - EDF - OLTMANNS - scan.pdf"))
+        self.assertTrue(second.endswith("Facture - EDF - OLTMANNS - scan (2).pdf"))
+        with open(first, "rb") as file:
+            self.assertEqual(file.read(), b"first")
+        self.assertEqual(os.listdir(self.inbox), [])
+
+    def test_modes_keeping_the_original(self):
+        for mode in ("hardlink", "copy", "symlink"):
+            source = self.write(f"{mode}.pdf")
+            new_file_path = place(source, os.path.join(self.output, f"{mode}.pdf"), mode)
+            with open(new_file_path, "rb") as file:
+                self.assertEqual(file.read(), b"%PDF-1.4 content")
+            self.assertTrue(os.path.exists(source))
+        self.assertTrue(os.path.islink(os.path.join(self.output, "symlink.pdf")))
+        self.assertEqual(os.stat(os.path.join(self.output, "hardlink.pdf")).st_nlink, 2)
+
+    def test_cross_device_move_copies_then_deletes(self):
+        source = self.write("scan.pdf")
+        copied = placement_stats["copied"]
+        cross_device = OSError(errno.EXDEV, "Invalid cross-device link")
+        real_link = os.link
+
+        def link(source_path, path):
+            if source_path.startswith(self.inbox):
+                raise cross_device
+            real_link(source_path, path)
+
+        with mock.patch.object(file_organizer.os, "link", side_effect=link):
+            new_file_path = place(source, os.path.join(self.output, "scan.pdf"), "move")
+            with self.assertRaises(OSError):
+                place(self.write("other.pdf"), os.path.join(self.output, "other.pdf"), "rename")
+
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(placement_stats["copied"], copied + 1)
+        # Only the placed file, no temporary file left behind.
+        self.assertEqual(os.listdir(self.output), ["scan.pdf"])
+        with open(new_file_path, "rb") as file:
+            self.assertEqual(file.read(), b"%PDF-1.4 content")
+
+    def test_copy_data_falls_back_to_python(self):
+        source = self.write("scan.pdf", os.urandom(300000))
+        destination = os.path.join(self.temp_dir.name, "copy.pdf")
+        with mock.patch.object(file_organizer, "_copy_range", return_value=False), \
+                mock.patch.dict("sys.modules", fcntl=None):
+            self.assertEqual(copy_data(source, destination), 300000)
+        with open(source, "rb") as original, open(destination, "rb") as copy:
+            self.assertEqual(original.read(), copy.read())
+
+    def test_removed_directory_is_created_again(self):
+        place(self.write("a.pdf"), os.path.join(self.output, "2023-05", "a.pdf"))
+        for name in os.listdir(os.path.join(self.output, "2023-05")):
+            os.unlink(os.path.join(self.output, "2023-05", name))
+        os.rmdir(os.path.join(self.output, "2023-05"))
+
+        new_file_path = place(self.write("b.pdf"), os.path.join(self.output, "2023-05", "b.pdf"))
+        self.assertTrue(os.path.exists(new_file_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
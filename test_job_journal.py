@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from job_journal import JobJournal
+
+
+class TestJobJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "journal.sqlite")
+        self.pdf = os.path.join(self.temp_dir.name, "a.pdf")
+        with open(self.pdf, "wb") as file:
+            file.write(b"%PDF-1.4")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def stored_rows(self):
+        reader = JobJournal(self.path)
+        rows = len(reader._entries)
+        reader.close()
+        return rows
+
+    def test_states_are_written_in_batches(self):
+        journal = JobJournal(self.path, batch_size=3, flush_interval=3600)
+        journal.record(self.pdf, "discovered")
+        journal.record(self.pdf, "extracted")
+        journal.record("b.pdf", "discovered")
+        # Successive states of a file are coalesced while pending.
+        self.assertEqual(self.stored_rows(), 0)
+        journal.record("c.pdf", "discovered")
+        self.assertEqual(self.stored_rows(), 3)
+        journal.close()
+
+    def test_states_survive_a_restart(self):
+        journal = JobJournal(self.path)
+        journal.record(self.pdf, "discovered")
+        journal.record(self.pdf, "analyzed", doc_info={"type": "facture"})
+        journal.close()
+
+        journal = JobJournal(self.path)
+        entry = journal.entry(self.pdf)
+        self.assertEqual(entry["state"], "analyzed")
+        self.assertEqual(entry["doc_info"], {"type": "facture"})
+        self.assertEqual(journal.counts()["analyzed"], 1)
+        journal.close()
+
+    def test_changed_file_is_not_matched(self):
+        journal = JobJournal(self.path)
+        journal.record(self.pdf, "discovered")
+        journal.record(self.pdf, "failed", "analysis failed")
+        with open(self.pdf, "ab") as file:
+            file.write(b" new version")
+        self.assertIsNone(journal.entry(self.pdf))
+        journal.close()
+
+    def test_unknown_state(self):
+        journal = JobJournal(self.path)
+        with self.assertRaises(ValueError):
+            journal.record(self.pdf, "done")
+        journal.close()
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.temp_dir.name, "output")
+        self.pdfs = []
+        for name in ("analyzed.pdf", "failed.pdf", "new.pdf"):
+            path = os.path.join(self.temp_dir.name, name)
+            with open(path, "wb") as file:
+                file.write(b"%PDF-1.4")
+            self.pdfs.append(path)
+        main.enable_journal(self.output)
+
+    def tearDown(self):
+        main.journal.close()
+        main.journal = None
+        self.temp_dir.cleanup()
+
+    def test_resume_reuses_analyses_and_retries_the_rest(self):
+        analyzed, failed, new = self.pdfs
+        doc_info = {"subject": "Facture", "date": "2023-05-15", "type": "facture",
+                    "emitter": "TechCorp", "recipient": "WAX"}
+        main.journal.record(analyzed, "discovered")
+        main.journal.record(analyzed, "analyzed", doc_info=doc_info)
+        main.journal.record(failed, "discovered")
+        main.journal.record(failed, "failed", "analysis failed")
+
+        with mock.patch.object(main, "extract_text_from_pdf", return_value="text") as extract, \
+                mock.patch.object(main, "analyze_document", return_value=None), \
+                mock.patch.object(main, "organize_file", return_value="moved.pdf") as organize:
+            main.process_directory(self.temp_dir.name, self.output, resume=True)
+
+        self.assertEqual(sorted(call.args[0] for call in extract.call_args_list), [failed, new])
+        organize.assert_called_once_with(analyzed, self.output, doc_info)
+        self.assertEqual(main.journal.entry(analyzed)["state"], "moved")
+        self.assertEqual(main.journal.entry(failed)["state"], "failed")
+        self.assertEqual(main.journal.entry(new)["reason"], "analysis failed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import httpx
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm_pool import LLMPool, pool_stats
+
+MESSAGES = [{"role": "user", "content": "Facture du 15/05/2023"}]
+
+
+class TestLLMPool(unittest.TestCase):
+    def test_requests_are_balanced_over_hosts(self):
+        with FakeOllamaServer(latency=0.05) as first, FakeOllamaServer(latency=0.05) as second:
+            pool = LLMPool([first.url, second.url])
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                responses = list(executor.map(lambda _: pool.chat(model="llama3.2", messages=MESSAGES),
+                                              range(12)))
+
+        self.assertEqual(len(responses), 12)
+        self.assertEqual([host["requests"] for host in pool.stats()], [6, 6])
+        self.assertEqual(first.stats["requests"] + second.stats["requests"], 12)
+
+    def test_failover_and_ejection(self):
+        dead = FakeOllamaServer()
+        dead_url = dead.url
+        dead.stop()
+        ejections = pool_stats["ejections"]
+
+        with FakeOllamaServer(latency=0) as live:
+            pool = LLMPool([dead_url, live.url], max_failures=1, eject_seconds=60)
+            for _ in range(3):
+                response = pool.chat(model="llama3.2", messages=MESSAGES)
+                self.assertTrue(response["done"])
+
+        dead_stats, live_stats = pool.stats()
+        self.assertTrue(dead_stats["ejected"])
+        self.assertEqual(dead_stats["requests"], 1)
+        self.assertEqual(live_stats["requests"], 3)
+        self.assertEqual(pool_stats["ejections"], ejections + 1)
+
+    def test_last_healthy_host_is_not_ejected(self):
+        dead = FakeOllamaServer()
+        dead_url = dead.url
+        dead.stop()
+
+        pool = LLMPool([dead_url], max_failures=1)
+        with self.assertRaises(ConnectionError):
+            pool.chat(model="llama3.2", messages=MESSAGES)
+        self.assertEqual(pool.check_all(), [dead_url])
+
+    def test_check_model(self):
+        with FakeOllamaServer(latency=0) as server:
+            pool = LLMPool([server.url])
+            self.assertEqual(pool.check_model("Llama3.2"), [])
+            problems = pool.check_model("mistral")
+
+        self.assertEqual(len(problems), 1)
+        self.assertIn("not found", problems[0])
+
+    def test_load_model_sets_keep_alive(self):
+        with FakeOllamaServer(latency=0) as first, FakeOllamaServer(latency=0) as second:
+            pool = LLMPool([first.url, second.url])
+            pool.load_model("llama3.2", -1)
+
+        self.assertEqual([first.stats["loads"], second.stats["loads"]], [1, 1])
+        self.assertEqual([first.keep_alive, second.keep_alive], [-1, -1])
+
+    def test_async_clients_are_shared_across_documents_until_closed(self):
+        with FakeOllamaServer(latency=0) as server:
+            pool = LLMPool([server.url])
+            async_client = pool.endpoints[0].async_client
+            for _ in range(2):
+                response = pool.run(pool.achat(model="llama3.2", messages=MESSAGES))
+                self.assertTrue(response["done"])
+            self.assertIs(pool.endpoints[0].async_client, async_client)
+            thread = pool._loop_thread
+            with mock.patch.object(httpx.HTTPTransport, "close", autospec=True,
+                                   side_effect=httpx.HTTPTransport.close) as close, \
+                    mock.patch.object(httpx.AsyncHTTPTransport, "aclose", autospec=True,
+                                      side_effect=httpx.AsyncHTTPTransport.aclose) as aclose:
+                pool.close()
+
+        self.assertFalse(thread.is_alive())
+        close.assert_called_once_with(pool.endpoints[0].transport)
+        aclose.assert_awaited_once_with(pool.endpoints[0].async_transport)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ollama
+
+import document_analyzer
+import metrics
+from test_document_analyzer import tool_response
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        metrics.event_totals.clear()
+
+    def tearDown(self):
+        metrics.close()
+        metrics.prometheus_path = None
+        metrics.event_totals.clear()
+        self.temp_dir.cleanup()
+
+    def test_events_and_prometheus_export(self):
+        events_path = os.path.join(self.temp_dir.name, 'events.jsonl')
+        prometheus_path = os.path.join(self.temp_dir.name, 'pdf_sorter.prom')
+        metrics.enable_metrics(events_path, prometheus_path)
+
+        metrics.record("extract", file="a.pdf", seconds=0.5, pages=3, pages_ocr=1, cache_hit=False)
+        metrics.record("extract", file="b.pdf", seconds=0.25, pages=2, pages_ocr=0, cache_hit=True)
+        with self.assertRaises(ValueError):
+            with metrics.timed("organize", file="a.pdf"):
+                raise ValueError("disk full")
+        metrics.close()
+
+        with open(events_path) as file:
+            events = [json.loads(line) for line in file]
+        self.assertEqual([event["event"] for event in events], ["extract", "extract", "organize", "run"])
+        self.assertEqual(events[2]["errors"], 1)
+        self.assertEqual(events[3]["totals"]["extract"], {"count": 2, "seconds": 0.75, "pages": 5, "pages_ocr": 1})
+
+        with open(prometheus_path) as file:
+            exported = file.read()
+        self.assertIn("# TYPE pdf_sorter_extract_events_total counter", exported)
+        self.assertIn("pdf_sorter_extract_pages_ocr_total 1", exported)
+        self.assertIn("pdf_sorter_organize_errors_total 1", exported)
+
+    def test_llm_usage_is_recorded_per_field(self):
+        response = dict(tool_response({"date": "2023-05-15", "reasoning": "Explicit."}, prompt_eval_count=120),
+                        eval_count=30, prompt_eval_duration=2_000_000_000, eval_duration=500_000_000)
+        with mock.patch.object(ollama.Client, "chat", side_effect=[ValueError("bad"), response]):
+            document_analyzer.extract_field("date", "content")
+
+        totals = metrics.event_totals
+        self.assertEqual(totals[("retry", "date")]["count"], 1)
+        self.assertEqual(totals[("llm", "date")]["prompt_tokens"], 120)
+        self.assertEqual(totals[("llm", "date")]["eval_tokens"], 30)
+        self.assertEqual(totals[("llm", "date")]["prompt_eval_seconds"], 2.0)
+
+        metrics.write_prometheus(os.path.join(self.temp_dir.name, 'pdf_sorter.prom'))
+        with open(os.path.join(self.temp_dir.name, 'pdf_sorter.prom')) as file:
+            self.assertIn('pdf_sorter_llm_eval_tokens_total{field="date"} 30', file.read())
+
+    def test_worker_events_are_replayed(self):
+        metrics.buffer_events()
+        try:
+            metrics.record("ocr", pages=4, seconds=1.5)
+            events = metrics.drain()
+        finally:
+            metrics._buffer = None
+        metrics.event_totals.clear()
+
+        metrics.replay(events)
+        self.assertEqual(metrics.summary()["ocr"], {"count": 1, "pages": 4, "seconds": 1.5})
+
+
+if __name__ == '__main__':
+    unittest.main()
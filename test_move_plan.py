@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from move_plan import MovePlan, apply_plan
+
+DOC_INFO = {"subject": "Facture", "date": "2023-05-15", "type": "facture", "emitter": "EDF", "recipient": "OLTMANNS"}
+
+
+class TestMovePlan(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.inbox = os.path.join(self.temp_dir.name, "inbox")
+        self.output = os.path.join(self.temp_dir.name, "output")
+        self.plan_path = os.path.join(self.temp_dir.name, "plan.json")
+        os.makedirs(self.inbox)
+        self.pdfs = []
+        for name in ("a.pdf", "b.pdf", "c.pdf"):
+            path = os.path.join(self.inbox, name)
+            with open(path, "wb") as file:
+                file.write(f"%PDF-1.4 {name}".encode())
+            self.pdfs.append(path)
+
+    def tearDown(self):
+        main.move_plan = None
+        self.temp_dir.cleanup()
+
+    def test_plan_run_moves_nothing_and_apply_does_not_analyze(self):
+        main.enable_plan(self.plan_path, self.inbox, self.output)
+        with mock.patch.object(main, "extract_text_from_pdf", return_value="text"), \
+                mock.patch.object(main, "analyze_document", return_value=DOC_INFO) as analyze:
+            main.process_directory(self.inbox, self.output, dry_run=True)
+        main.move_plan.write()
+        self.assertEqual(analyze.call_count, 3)
+        self.assertFalse(os.path.exists(self.output))
+
+        plan = MovePlan.load(self.plan_path)
+        self.assertEqual([entry["source"] for entry in plan.entries], self.pdfs)
+        self.assertEqual(plan.entries[0]["doc_info"], DOC_INFO)
+        self.assertTrue(plan.entries[0]["target"].endswith("Facture - EDF - OLTMANNS - a.pdf"))
+
+        with mock.patch.object(main, "extract_text_from_pdf") as extract:
+            counts = apply_plan(plan, workers=2, batch_size=2)
+        extract.assert_not_called()
+        self.assertEqual(counts["moved"], 3)
+        self.assertTrue(all(os.path.exists(entry["target"]) for entry in plan.entries))
+        self.assertEqual(os.listdir(self.inbox), [])
+
+    def test_changed_and_missing_files_are_not_moved(self):
+        plan = MovePlan(self.plan_path, self.inbox, self.output)
+        for path in self.pdfs:
+            plan.add(path, DOC_INFO, os.path.join(self.output, os.path.basename(path)))
+        with open(self.pdfs[0], "ab") as file:
+            file.write(b" edited")
+        os.unlink(self.pdfs[1])
+        results = []
+
+        counts = apply_plan(plan, on_result=lambda entry, state, detail: results.append(state))
+
+        self.assertEqual(counts, {"moved": 1, "changed": 1, "missing": 1, "failed": 0})
+        self.assertEqual(results, ["changed", "missing", "moved"])
+        self.assertTrue(os.path.exists(self.pdfs[0]))
+
+    def test_unknown_plan_version_is_rejected(self):
+        with open(self.plan_path, "w") as file:
+            file.write('{"version": 99, "entries": []}')
+        with self.assertRaises(ValueError):
+            MovePlan.load(self.plan_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
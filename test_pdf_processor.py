@@ -1,42 +1,171 @@
 import unittest
 import os
 import tempfile
-from file_scanner import extract_text_from_pdf, process_directory
-from llama_handler import get_information_from_pdf
+import time
+import concurrent.futures
+from unittest import mock
+
+from PIL import Image
+
+import metrics
+import pdf_processor
+from benchmarks.corpus import write_pdf
+from pdf_processor import extract_pages, extract_text_from_pdf, extraction_stats, ocr_windows
+
 
 class TestPDFProcessor(unittest.TestCase):
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
-        self.csv_file = os.path.join(self.temp_dir, 'output.csv')
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.pdf_path = os.path.join(self.temp_dir.name, 'sample.pdf')
 
     def tearDown(self):
-        for file in os.listdir(self.temp_dir):
-            os.remove(os.path.join(self.temp_dir, file))
-        os.rmdir(self.temp_dir)
+        if pdf_processor.text_cache is not None:
+            pdf_processor.text_cache.close()
+            pdf_processor.text_cache = None
+        self.temp_dir.cleanup()
 
     def test_extract_text_from_pdf(self):
-        # Create a sample PDF file for testing
-        sample_pdf_path = os.path.join(self.temp_dir, 'sample.pdf')
-        with open(sample_pdf_path, 'w') as f:
-            f.write("Sample PDF content")
-        
-        extracted_text = extract_text_from_pdf(sample_pdf_path)
-        self.assertIsInstance(extracted_text, str)
-        self.assertGreater(len(extracted_text), 0)
-
-    def test_process_directory(self):
-        # Create a sample PDF file in the temp directory
-        sample_pdf_path = os.path.join(self.temp_dir, 'sample.pdf')
-        with open(sample_pdf_path, 'w') as f:
+        write_pdf(self.pdf_path, [["Facture n° 2023-042", "Date : 15/05/2023"], ["Total : 12 500,00 EUR"]])
+
+        with mock.patch.object(pdf_processor, 'ocr_pages') as ocr_pages:
+            extracted_text = extract_text_from_pdf(self.pdf_path)
+
+        self.assertIn("Facture n° 2023-042", extracted_text)
+        self.assertIn("Total : 12 500,00 EUR", extracted_text)
+        ocr_pages.assert_called_once_with(self.pdf_path, set(), mock.ANY)
+
+    def test_only_pages_without_text_are_ocrd(self):
+        write_pdf(self.pdf_path, [["Relevé de comptes", "Solde : 1 200,00 EUR"], Image.new("L", (100, 140), 255)])
+
+        with mock.patch.object(pdf_processor, 'ocr_pages',
+                               return_value=iter([(2, {"text": "Opérations du mois de mai", "dpi": 150,
+                                                       "confidence": 91.5, "passes": 1})])) as ocr_pages:
+            pages = extract_pages(self.pdf_path)
+
+        self.assertEqual(ocr_pages.call_args.args[1], {2})
+        self.assertEqual([page["method"] for page in pages], ["text", "ocr"])
+        self.assertEqual(pages[1]["text"], "Opérations du mois de mai")
+        self.assertEqual((pages[1]["dpi"], pages[1]["confidence"]), (150, 91.5))
+
+    def test_pages_with_too_little_text_are_ocrd(self):
+        # Page 2 only has a page number in its text layer, page 3 a stamp the
+        # OCR reads worse than the text layer.
+        write_pdf(self.pdf_path, [["Avis d'imposition 2023", "Revenu fiscal : 32 000 EUR"],
+                                  ["p. 2"], ["Payé"]])
+        results = [(2, {"text": "Détail du calcul de l'impôt", "dpi": 150, "confidence": 88.0, "passes": 1}),
+                   (3, {"text": "Pa", "dpi": 150, "confidence": 40.0, "passes": 1})]
+
+        with mock.patch.dict(pdf_processor.ocr_settings, min_page_chars=10), \
+                mock.patch.object(pdf_processor, 'ocr_pages', return_value=iter(results)) as ocr_pages:
+            pages = extract_pages(self.pdf_path)
+
+        self.assertEqual(ocr_pages.call_args.args[1], {2, 3})
+        self.assertEqual([page["method"] for page in pages], ["text", "ocr", "text"])
+        self.assertEqual(pages[1]["text"], "Détail du calcul de l'impôt")
+        self.assertIn("Payé", pages[2]["text"])
+
+    def test_unreadable_file(self):
+        with open(self.pdf_path, 'w') as f:
             f.write("Sample PDF content")
-        
-        process_directory(self.temp_dir, self.csv_file)
-        self.assertTrue(os.path.exists(self.csv_file))
 
-    def test_get_information_from_pdf(self):
-        pdf_content = "Invoice\nNumber: 2024-08-01-01\nName: John Doe\nPrice: 100€\nDate: 21/02/2021"
-        get_information_from_pdf(pdf_content, self.csv_file, "Pauline OLTMANNS", "test_file.pdf")
-        self.assertTrue(os.path.exists(self.csv_file))
+        self.assertEqual(extract_text_from_pdf(self.pdf_path), "")
+
+    def test_text_cache(self):
+        write_pdf(self.pdf_path, [["Devis n° 7", "Date : 01/02/2024"]])
+        pdf_processor.enable_text_cache(os.path.join(self.temp_dir.name, 'text_cache.sqlite'))
+        hits = extraction_stats["cache_hits"]
+
+        first = extract_text_from_pdf(self.pdf_path)
+        with mock.patch.object(pdf_processor, 'extract_pages') as extract:
+            second = extract_text_from_pdf(self.pdf_path)
+
+        extract.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(extraction_stats["cache_hits"], hits + 1)
+
+    def test_ocr_windows(self):
+        page_bytes = {number: 100 * 1024 * 1024 for number in range(1, 11)}
+        with mock.patch.dict(pdf_processor.raster_settings, window=4, to_disk=True, max_memory_mb=256):
+            self.assertEqual(ocr_windows([1, 2, 3, 4, 5, 7, 8], page_bytes),
+                             [(1, 4), (5, 5), (7, 8)])
+        # In memory, a window holds at most max_memory_mb of rendered pages.
+        with mock.patch.dict(pdf_processor.raster_settings, window=4, to_disk=False, max_memory_mb=256):
+            self.assertEqual(ocr_windows([1, 2, 3, 4, 5], page_bytes), [(1, 2), (3, 4), (5, 5)])
+
+    def test_ocr_windows_fit_the_memory_budget(self):
+        megabyte = 1024 * 1024
+        page_bytes = {1: 40 * megabyte, 2: 40 * megabyte, 3: 30 * megabyte, 4: 150 * megabyte,
+                      5: 20 * megabyte, 6: 20 * megabyte}
+        with mock.patch.dict(pdf_processor.raster_settings, window=8, to_disk=False, max_memory_mb=100):
+            windows = ocr_windows(list(range(1, 7)), page_bytes)
+        # A page larger than the budget is rendered on its own.
+        self.assertEqual(windows, [(1, 2), (3, 3), (4, 4), (5, 6)])
+
+        # Without a budget only the window size applies.
+        with mock.patch.dict(pdf_processor.raster_settings, window=8, to_disk=False, max_memory_mb=0):
+            self.assertEqual(ocr_windows(list(range(1, 7)), page_bytes), [(1, 6)])
+
+    def test_pooled_ocr_keeps_page_order(self):
+        def ocr_window(file_path, first, last):
+            # The first windows finish last.
+            time.sleep((11 - first) * 0.01)
+            for number in range(first, last + 1):
+                yield number, {"text": f"page {number}", "dpi": 150, "confidence": 90.0, "passes": 1}
+
+        with mock.patch.object(pdf_processor, "ocr_window", side_effect=ocr_window) as window, \
+                mock.patch.object(pdf_processor.concurrent.futures, "ProcessPoolExecutor",
+                                  concurrent.futures.ThreadPoolExecutor), \
+                mock.patch.dict(os.environ), \
+                mock.patch.dict(pdf_processor.raster_settings, window=2, to_disk=True, ocr_workers=3):
+            results = list(pdf_processor.ocr_pages("scan.pdf", set(range(1, 11))))
+
+        self.assertEqual(window.call_count, 5)
+        self.assertEqual([number for number, _ in results], list(range(1, 11)))
+        self.assertEqual([result["text"] for _, result in results], [f"page {n}" for n in range(1, 11)])
+
+    def test_ocr_image_reads_word_confidences(self):
+        data = {"text": ["", "Total", "12", "", "EUR", "", "Merci"],
+                "conf": [-1, 96, 88, -1, 90, -1, "42"],
+                "block_num": [1, 1, 1, 1, 1, 2, 2], "par_num": [1, 1, 1, 1, 1, 1, 1],
+                "line_num": [1, 1, 1, 2, 2, 1, 1]}
+        with mock.patch("pytesseract.image_to_data", return_value=data):
+            text, confidence = pdf_processor._ocr_image(Image.new("L", (10, 10)))
+        self.assertEqual(text, "Total 12\nEUR\n\nMerci\n")
+        self.assertEqual(confidence, 79.0)
+
+    def test_only_low_confidence_pages_are_escalated(self):
+        def render(file_path, first, last, dpi):
+            for number in range(first, last + 1):
+                yield number, Image.new("L", (dpi, number), 128)
+
+        def ocr(image):
+            dpi, number = image.size
+            # Page 1 is clean, page 2 is readable at 300 DPI, page 3 only once
+            # binarized, and page 4 is blank.
+            if number == 4:
+                return "", 0.0
+            binarized = set(image.getextrema()) <= {0, 255}
+            confidence = {1: 92, 2: 50 if dpi < 300 else 85, 3: 75 if binarized else 20}[number]
+            return f"page {number} at {dpi}", confidence
+
+        with mock.patch.object(pdf_processor, "_render", side_effect=render), \
+                mock.patch.object(pdf_processor, "_ocr_image", side_effect=ocr), \
+                mock.patch.dict(pdf_processor.ocr_settings, dpi=150, escalation_dpi=[300],
+                                min_confidence=70, binarize=True):
+            results = dict(pdf_processor.ocr_window("scan.pdf", 1, 4))
+
+        self.assertEqual([(result["dpi"], result["passes"]) for result in results.values()],
+                         [(150, 1), (300, 2), (300, 3), (150, 1)])
+        self.assertEqual(results[2]["text"], "page 2 at 300")
+        self.assertTrue(results[3]["binarized"])
+        self.assertEqual(results[3]["confidence"], 75)
+
+        pdf_processor._record_pages("scan.pdf", results.items())
+        totals = metrics.event_totals[("ocr_page", None)]
+        self.assertGreaterEqual(totals["escalated"], 2)
+        self.assertNotIn("dpi", totals)
+        self.assertNotIn("confidence", totals)
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
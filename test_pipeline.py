@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import pipeline
+from pipeline import Stage, percentile, run_pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_items_flow_through_all_stages(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        stats = run_pipeline(range(20), [
+            Stage('double', lambda item: item * 2, workers=3),
+            Stage('drop_odd_tens', lambda item: None if item % 20 == 10 else item, workers=2),
+            Stage('collect', collect),
+        ], queue_size=2)
+
+        self.assertEqual(sorted(results), [i * 2 for i in range(20) if (i * 2) % 20 != 10])
+        self.assertEqual(stats['double']['items'], 20)
+        self.assertEqual(stats['collect']['items'], 18)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+
+    def test_latencies_are_bounded(self):
+        with mock.patch.object(pipeline, 'latency_window', 5):
+            stage = Stage('identity', lambda item: item)
+        for item in range(20):
+            stage.process(item)
+
+        self.assertEqual(len(stage.latencies), 5)
+        self.assertEqual(stage.stats(1.0)['items'], 20)
+
+    def test_stages_overlap(self):
+        def slow(item):
+            time.sleep(0.05)
+            return item
+
+        start = time.perf_counter()
+        run_pipeline(range(10), [
+            Stage('first', slow, workers=2),
+            Stage('second', slow, workers=2),
+        ], queue_size=2)
+        elapsed = time.perf_counter() - start
+
+        # Sequential stages would take 10 * 2 * 0.05 / 2 = 0.5s.
+        self.assertLess(elapsed, 0.45)
+
+    def test_backpressure_bounds_buffered_items(self):
+        fed = []
+        consumed = []
+        buffered = []
+
+        def items():
+            for i in range(30):
+                fed.append(i)
+                yield i
+
+        def slow(item):
+            consumed.append(item)
+            buffered.append(len(fed) - len(consumed))
+            time.sleep(0.005)
+
+        run_pipeline(items(), [
+            Stage('pass', lambda item: item),
+            Stage('slow', slow),
+        ], queue_size=2)
+        self.assertEqual(len(consumed), 30)
+        # Two queues of two items, one item in the first stage and one
+        # item blocked in the feeder.
+        self.assertLessEqual(max(buffered), 6)
+
+    def test_stage_errors_drop_the_item(self):
+        results = []
+        run_pipeline([1, 0, 2], [
+            Stage('invert', lambda item: 1 / item),
+            Stage('collect', results.append),
+        ])
+        self.assertEqual(sorted(results), [0.5, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
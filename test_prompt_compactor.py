@@ -0,0 +1,58 @@
+import unittest
+
+from prompt_compactor import clean_text, compact, compact_for_field, compaction_stats, estimate_tokens
+
+PROSE = "\n".join(f"Clause {i}: " + "lorem ipsum " * (i % 5 + 1) for i in range(1000))
+
+STATEMENT = "\n".join(
+    ["RELEVÉ DE COMPTE", "Banque Populaire", "Date: 31/05/2023", "M. OLTMANNS"]
+    + [f"{day:02d}/05/2023   Paiement CB   MAGASIN {day}   {day * 3},50" for day in range(1, 31)]
+    + ["Page 1/2", "-----------", "Banque Populaire - SA au capital de 100 000 EUR - RCS Paris"]
+)
+
+
+class TestPromptCompactor(unittest.TestCase):
+    def test_clean_text_collapses_rows_and_boilerplate(self):
+        lines = clean_text("  Facture   n°12  \n\nPage 1/2\n" + STATEMENT)
+
+        self.assertEqual(lines[0], "Facture n°12")
+        self.assertNotIn("Page 1/2", lines)
+        self.assertNotIn("-----------", lines)
+        self.assertIn("[... 27 similar rows ...]", lines)
+
+    def test_compact_keeps_header_and_footer_within_budget(self):
+        compacted = compact(STATEMENT + "\n" + PROSE, 300, "emitter")
+
+        self.assertLessEqual(estimate_tokens(compacted), 300)
+        self.assertTrue(compacted.startswith("RELEVÉ DE COMPTE\nBanque Populaire"))
+        self.assertTrue(compacted.endswith("Clause 999: " + " ".join(["lorem ipsum"] * 5)))
+
+    def test_fields_get_different_slices(self):
+        recipient = compact(PROSE, 200, "recipient")
+        emitter = compact(PROSE, 200, "emitter")
+
+        self.assertGreater(recipient.index("[...]"), emitter.index("[...]"))
+        self.assertGreater(emitter.count("\n", emitter.rindex("[...]")),
+                           recipient.count("\n", recipient.rindex("[...]")))
+
+    def test_single_long_line_keeps_header_and_footer(self):
+        text = ("FACTURE N° 42 Date : 15/05/2023 EDF à M. OLTMANNS "
+                + "lorem ipsum " * 2000 + "Total : 12,50 EUR")
+        compacted = compact(text, 200, "all")
+
+        self.assertLessEqual(estimate_tokens(compacted), 200)
+        # The line is split into chunks, at word boundaries.
+        self.assertTrue(compacted.replace("\n", " ").startswith("FACTURE N° 42 Date : 15/05/2023 EDF à M. OLTMANNS"))
+        self.assertTrue(compacted.replace("\n", " ").endswith("Total : 12,50 EUR"))
+
+    def test_compact_for_field_records_savings(self):
+        before = dict(compaction_stats)
+        self.assertEqual(compact_for_field(PROSE, None), PROSE)
+        compact_for_field(PROSE, 200, "date")
+
+        self.assertEqual(compaction_stats["tokens_before"] - before["tokens_before"], estimate_tokens(PROSE))
+        self.assertLessEqual(compaction_stats["tokens_after"] - before["tokens_after"], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+import ollama
+
+import document_analyzer
+from llm_pool import CircuitBreaker
+from response_repair import normalize_enum, repair_response, repair_stats
+
+TYPE_TOOL = document_analyzer.type_request("content")["tools"][0]
+
+
+def content_response(content):
+    """Builds a fake Ollama chat response without a tool call."""
+    return {"message": {"role": "assistant", "content": content}, "prompt_eval_count": 100}
+
+
+class TestResponseRepair(unittest.TestCase):
+    def test_normalize_enum(self):
+        self.assertEqual(normalize_enum("Facture", list(document_analyzer.valid_types)), "facture")
+        self.assertEqual(normalize_enum("releve de comptes", list(document_analyzer.valid_types)),
+                         "relevé de comptes")
+        self.assertEqual(normalize_enum("Oltmanns", document_analyzer.valid_recipients), "OLTMANNS")
+        self.assertIsNone(normalize_enum("Wax Industries", document_analyzer.valid_recipients))
+
+    def test_arguments_written_in_content_are_salvaged(self):
+        saved = repair_stats["calls_saved"]
+        response = content_response(
+            'Here is the result:\n```json\n{"name": "push_extracted_type", '
+            '"parameters": {"type": "Facture", "reasoning": "Invoice."}}\n```')
+
+        repaired = repair_response(response, TYPE_TOOL, "type")
+
+        arguments = repaired["message"]["tool_calls"][0]["function"]["arguments"]
+        self.assertEqual(arguments, {"type": "facture", "reasoning": "Invoice."})
+        self.assertEqual(repair_stats["calls_saved"], saved + 1)
+
+    def test_prose_is_left_alone(self):
+        response = content_response("I think this document is an invoice.")
+        self.assertIs(repair_response(response, TYPE_TOOL, "type"), response)
+
+    def test_repaired_extraction_is_not_retried(self):
+        response = content_response('{"type": "Devis", "reasoning": "A quote."}')
+        with mock.patch.object(ollama.Client, "chat", return_value=response) as chat:
+            value = document_analyzer.extract_field("type", "content")
+
+        self.assertEqual(value, "devis")
+        self.assertEqual(chat.call_count, 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_closes_after_trial(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        with mock.patch("llm_pool.time.monotonic", return_value=breaker.opened_at + 1):
+            self.assertTrue(breaker.allow())
+            # A single trial request goes through until it reports back.
+            self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from rule_extractor import match_date, match_recipient, match_type, pre_extract
+
+RECIPIENTS = ["Jérôme", "Pauline", "Grégoire", "OLTMANNS", "WAX"]
+
+INVOICE = """
+Facture n° 2023-042
+Date: 15/05/2023
+
+TechCorp Solutions
+À l'attention de WAX Industries
+
+Prestations réalisées du 01/04/2023 au 30/04/2023
+Total: 12 500,00 EUR
+"""
+
+
+class TestRuleExtractor(unittest.TestCase):
+    def test_labelled_date_wins_over_other_dates(self):
+        self.assertEqual(match_date(INVOICE), ("2023-05-15", 0.95))
+
+    def test_written_french_date(self):
+        value, confidence = match_date("Fait à Paris, le 3 février 2024")
+        self.assertEqual(value, "2024-02-03")
+        self.assertGreaterEqual(confidence, 0.9)
+
+    def test_ambiguous_dates_have_low_confidence(self):
+        _, confidence = match_date("Période du 01/04/2023 au 30/04/2023")
+        self.assertLess(confidence, 0.9)
+
+    def test_type_from_header_keyword(self):
+        self.assertEqual(match_type(INVOICE), ("facture", 0.95))
+        self.assertEqual(match_type("Bonjour,\nMerci pour votre visite."), (None, 0.0))
+
+    def test_recipient(self):
+        self.assertEqual(match_recipient(INVOICE, RECIPIENTS), ("WAX", 0.95))
+        # "wax" as a word in lower case is not the WAX recipient.
+        self.assertEqual(match_recipient("Car wax and polish", RECIPIENTS), (None, 0.0))
+        _, confidence = match_recipient("Pauline OLTMANNS", RECIPIENTS)
+        self.assertLess(confidence, 0.9)
+
+    def test_pre_extract_keeps_confident_fields(self):
+        self.assertEqual(pre_extract(INVOICE, RECIPIENTS),
+                         {"date": "2023-05-15", "type": "facture", "recipient": "WAX"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Cold-start budget of `import main`, in milliseconds, as reported by
+# python -X importtime. Importing the PDF, OCR and LLM libraries up front
+# took over 500 ms; without them it takes under 100 ms.
+STARTUP_BUDGET_MS = 250
+
+# Libraries that must only be loaded once a file needs them.
+LAZY_MODULES = ["PyPDF2", "pdf2image", "PIL", "pytesseract", "ollama", "httpx", "pydantic", "numpy",
+                "multiprocessing"]
+
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    :param module: The module name.
+    :return: A dictionary of the cumulative import time of each loaded module, in microseconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_heavy_libraries_are_loaded_lazily(self):
+        loaded = import_times("main")
+        self.assertIn("main", loaded)
+        self.assertEqual([module for module in LAZY_MODULES if module in loaded], [])
+
+    def test_import_within_budget(self):
+        # The first import may compile the bytecode, the best of three runs
+        # is the cold start of an installed tree.
+        best = min(import_times("main")["main"] for _ in range(3))
+        self.assertLess(best / 1000, STARTUP_BUDGET_MS)
+
+    def test_empty_inbox_does_not_reach_ollama(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, OLLAMA_HOSTS="http://127.0.0.1:9")
+            result = subprocess.run([sys.executable, "main.py", directory, os.path.join(directory, "out")],
+                                    cwd=ROOT, capture_output=True, text=True, env=env, timeout=60)
+            self.assertFalse(os.path.exists(os.path.join(directory, "out")))
+
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("No PDF files found", result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
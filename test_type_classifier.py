@@ -0,0 +1,84 @@
+import os
+import random
+import tempfile
+import unittest
+
+from type_classifier import TypeClassifier, archived_documents, features
+
+LABELS = ["facture", "devis", "mail"]
+
+DOCUMENTS = [
+    ("Facture numéro 12 montant total TTC à payer avant échéance", "facture"),
+    ("Facture client montant HT TVA total TTC règlement par virement", "facture"),
+    ("Devis estimatif des travaux proposition valable trente jours", "devis"),
+    ("Devis pour la rénovation proposition commerciale bon pour accord", "devis"),
+    ("Bonjour, je vous écris au sujet de notre réunion de demain. Cordialement", "mail"),
+    ("Bonjour, merci pour votre message. Bien cordialement", "mail"),
+]
+
+
+class TestTypeClassifier(unittest.TestCase):
+    def setUp(self):
+        self.model = TypeClassifier(LABELS)
+        for text, label in DOCUMENTS:
+            self.model.learn(text, label)
+
+    def test_features_are_hashed_and_deduplicated(self):
+        indices, frequencies = features("total total TTC")
+        self.assertEqual(len(indices), len(set(indices.tolist())))
+        self.assertEqual(len(indices), len(frequencies))
+        self.assertEqual(len(features("123 !!")[0]), 0)
+
+    def test_predict(self):
+        label, confidence = self.model.predict("Facture: montant total TTC 120 EUR")
+        self.assertEqual(label, "facture")
+        self.assertGreater(confidence, 0.5)
+        self.assertEqual(self.model.predict("Bonjour, cordialement")[0], "mail")
+
+    def test_off_distribution_text_is_not_confident(self):
+        rng = random.Random(0)
+        words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+                 for _ in range(400)]
+        self.assertLess(self.model.predict(" ".join(words) + " total")[1], 0.9)
+        # Known words pointing to several types at once.
+        self.assertLess(self.model.predict("Bonjour, facture et devis")[1], 0.9)
+        # The confidence doesn't grow with the length of the document.
+        self.assertLess(self.model.predict("Bonjour, facture et devis " * 100)[1], 0.9)
+
+    def test_untrained_model_has_no_confidence(self):
+        self.assertEqual(TypeClassifier(LABELS).predict("Facture"), (None, 0.0))
+
+    def test_known_documents_are_learned_once(self):
+        self.assertTrue(self.model.learn("Devis travaux", "devis", key="abc"))
+        self.assertFalse(self.model.learn("Devis travaux", "devis", key="abc"))
+        self.assertEqual(self.model.documents, len(DOCUMENTS) + 1)
+
+    def test_new_type_is_learned(self):
+        self.assertTrue(self.model.learn("Relevé de compte solde créditeur opérations", "relevé de comptes"))
+        self.assertEqual(self.model.labels, LABELS + ["relevé de comptes"])
+        self.assertEqual(self.model.predict("Relevé de compte, solde créditeur")[0], "relevé de comptes")
+
+    def test_save_and_load(self):
+        self.model.learn("Devis travaux", "devis", key="abc")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.npz")
+            self.model.save(path)
+            loaded = TypeClassifier.load(path)
+        self.assertEqual(loaded.labels, LABELS)
+        self.assertEqual(loaded.trained, {"abc"})
+        text = "Devis estimatif proposition"
+        self.assertEqual(loaded.predict(text), self.model.predict(text))
+
+    def test_archived_documents(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "facture", "2024-01"))
+            open(os.path.join(directory, "facture", "2024-01", "a.pdf"), "w").close()
+            open(os.path.join(directory, "facture", "2024-01", "notes.txt"), "w").close()
+            os.makedirs(os.path.join(directory, "unknown"))
+            open(os.path.join(directory, "unknown", "b.pdf"), "w").close()
+            found = list(archived_documents(directory, LABELS))
+        self.assertEqual(found, [(os.path.join(directory, "facture", "2024-01", "a.pdf"), "facture")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,297 @@
+import os
+import re
+import sys
+import time
+import zlib
+import argparse
+import numpy as np
+
+# Number of hashed features. Collisions are rare enough at this size for the
+# vocabulary of our documents, and the model stays a few MB.
+n_features = 2 ** 17
+
+_token = re.compile(r"[^\W\d_]{2,}")
+
+# Calibration of the confidence. The log-likelihoods are averaged per unit
+# of TF-IDF weight and scaled to evidence_weight, so that a long document
+# doesn't make the posterior saturate. Documents with less than
+# min_known_share of their weight on words seen in training are off the
+# model's distribution: their confidence shrinks in proportion.
+evidence_weight = 5.0
+min_known_share = 0.5
+
+
+def features(text):
+    """
+    Turns a text into hashed bag-of-words features.
+
+    :param text: The document text.
+    :return: A (indices, term_frequencies) tuple of NumPy arrays, with
+             log-scaled term frequencies.
+    """
+    words = _token.findall(text.lower())
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not tokens:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                         dtype=np.int64, count=len(tokens)) % n_features
+    indices, counts = np.unique(hashes, return_counts=True)
+    return indices, np.log1p(counts).astype(np.float32)
+
+
+class TypeClassifier:
+    """
+    A naive Bayes document type classifier over hashed TF-IDF features.
+
+    The model only keeps per-class term frequencies and document frequencies,
+    so it can be trained incrementally and saved to a small .npz file. The
+    IDF is applied when predicting, with the document frequencies of that
+    time, to the class weights and the document alike.
+    """
+
+    def __init__(self, labels):
+        """
+        :param labels: The document types the classifier chooses from.
+        """
+        self.labels = list(labels)
+        self.class_counts = np.zeros((len(self.labels), n_features), dtype=np.float32)
+        self.class_documents = np.zeros(len(self.labels), dtype=np.int64)
+        self.document_frequency = np.zeros(n_features, dtype=np.int64)
+        self.trained = set()
+        self._log_theta = None
+        self._idf_weights = None
+
+    @property
+    def documents(self):
+        return int(self.class_documents.sum())
+
+    def _idf(self):
+        return np.log((1 + self.documents) / (1 + self.document_frequency)) + 1
+
+    def _add_label(self, label):
+        """Adds a document type, e.g. one added to valid_types after the model was saved."""
+        self.labels.append(label)
+        self.class_counts = np.vstack([self.class_counts, np.zeros((1, n_features), dtype=np.float32)])
+        self.class_documents = np.append(self.class_documents, 0)
+
+    def learn(self, text, label, key=None):
+        """
+        Adds a labelled document to the model.
+
+        :param text: The document text.
+        :param label: The document type.
+        :param key: Optional identifier (e.g. the content hash) recorded so the
+                    same document is not learned twice.
+        :return: True if the document was learned, False if it was already known.
+        """
+        if key is not None and key in self.trained:
+            return False
+        indices, frequencies = features(text)
+        if label not in self.labels:
+            self._add_label(label)
+        row = self.labels.index(label)
+        self.document_frequency[indices] += 1
+        self.class_documents[row] += 1
+        self.class_counts[row, indices] += frequencies
+        if key is not None:
+            self.trained.add(key)
+        self._log_theta = None
+        return True
+
+    def predict(self, text):
+        """
+        Predicts the type of a document.
+
+        :param text: The document text.
+        :return: A (type, confidence) tuple, confidence being the calibrated
+                 posterior probability of the predicted type, among the
+                 types with training documents.
+        """
+        if not self.documents:
+            return None, 0.0
+        if self._log_theta is None:
+            self._idf_weights = self._idf()
+            smoothed = self.class_counts * self._idf_weights + 0.01
+            self._log_theta = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+        indices, frequencies = features(text)
+        weights = frequencies * self._idf_weights[indices]
+        total = float(weights.sum())
+        if not total:
+            return None, 0.0
+        # Types without any training document would win on unknown words,
+        # their smoothed weights being uniform.
+        trained = np.flatnonzero(self.class_documents)
+        log_prior = np.log((self.class_documents[trained] + 1) / (self.documents + len(self.labels)))
+        log_likelihood = self._log_theta[trained][:, indices] @ weights
+        scores = log_prior + log_likelihood * (evidence_weight / total)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        known_share = float(weights[self.document_frequency[indices] > 0].sum()) / total
+        confidence = float(probabilities[best]) * min(1.0, known_share / min_known_share)
+        return self.labels[trained[best]], confidence
+
+    def save(self, path):
+        """Saves the model to a .npz file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = path + ".tmp.npz"
+        np.savez(
+            temporary_path,
+            labels=np.array(self.labels),
+            class_counts=self.class_counts,
+            class_documents=self.class_documents,
+            document_frequency=self.document_frequency,
+            trained=np.array(sorted(self.trained), dtype=str),
+        )
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model saved with save()."""
+        with np.load(path) as data:
+            model = cls(data["labels"].tolist())
+            model.class_counts = data["class_counts"]
+            model.class_documents = data["class_documents"]
+            model.document_frequency = data["document_frequency"]
+            model.trained = set(data["trained"].tolist())
+        return model
+
+
+def archived_documents(archive_directory, labels):
+    """
+    Lists the documents filed by organize_file under <type>/<YYYY-MM>/.
+
+    :param archive_directory: The output directory of previous runs.
+    :param labels: The known document types.
+    :return: A generator of (file_path, type) tuples.
+    """
+    for label in labels:
+        type_directory = os.path.join(archive_directory, label)
+        if not os.path.isdir(type_directory):
+            continue
+        for root, _, files in os.walk(type_directory):
+            for file in sorted(files):
+                if file.lower().endswith('.pdf'):
+                    yield os.path.join(root, file), label
+
+
+def _labelled_texts(archive_directory, labels):
+    """Extracts the text of the archived documents, skipping unreadable ones."""
+    from pdf_processor import extract_text_from_pdf, file_hash
+
+    for file_path, label in archived_documents(archive_directory, labels):
+        text = extract_text_from_pdf(file_path)
+        if text.strip():
+            yield file_hash(file_path), text, label
+
+
+def train(archive_directory, model_path, labels):
+    """
+    Trains the model incrementally on the archive, skipping known documents.
+
+    :param archive_directory: The output directory of previous runs.
+    :param model_path: Path to the model file, created if missing.
+    :param labels: The known document types.
+    :return: The trained model.
+    """
+    model = TypeClassifier.load(model_path) if os.path.exists(model_path) else TypeClassifier(labels)
+    learned = sum(model.learn(text, label, key)
+                  for key, text, label in _labelled_texts(archive_directory, labels))
+    model.save(model_path)
+    print(f"Learned {learned} new documents ({model.documents} in total). Model saved to {model_path}")
+    return model
+
+
+def evaluate(archive_directory, labels, holdout=5, with_llm=False, threshold=0.9):
+    """
+    Evaluates the classifier on the archive: every holdout-th document is set
+    aside for testing and the model is trained on the others.
+
+    :param archive_directory: The output directory of previous runs.
+    :param labels: The known document types.
+    :param holdout: One document out of holdout is used for testing.
+    :param with_llm: If True, also classify the test documents with the LLM.
+    :param threshold: The confidence from which predictions replace the LLM,
+                      to report the precision and coverage at.
+    :return: A dictionary of accuracy, precision and per-document latency figures.
+    """
+    model = TypeClassifier(labels)
+    tests = []
+    for key, text, label in _labelled_texts(archive_directory, labels):
+        if int(key[:8], 16) % holdout == 0:
+            tests.append((text, label))
+        else:
+            model.learn(text, label)
+
+    results = {"train_documents": model.documents, "test_documents": len(tests)}
+    if not tests:
+        return results
+
+    correct = confident = confident_correct = 0
+    start = time.perf_counter()
+    for text, label in tests:
+        predicted, confidence = model.predict(text)
+        correct += predicted == label
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += predicted == label
+    results["classifier_accuracy"] = correct / len(tests)
+    results["classifier_ms_per_document"] = (time.perf_counter() - start) * 1000 / len(tests)
+    # The predictions used instead of the LLM: how many, and how many right.
+    results["coverage_at_threshold"] = confident / len(tests)
+    results["precision_at_threshold"] = confident_correct / confident if confident else 0.0
+
+    if with_llm:
+        from document_analyzer import retry_extraction, extract_type
+
+        correct = 0
+        start = time.perf_counter()
+        for text, label in tests:
+            info = retry_extraction(extract_type, text)
+            correct += bool(info) and info["type"] == label
+        results["llm_accuracy"] = correct / len(tests)
+        results["llm_ms_per_document"] = (time.perf_counter() - start) * 1000 / len(tests)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Train and evaluate the local document type classifier on the sorted archive.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='Train the model on the archive, incrementally.')
+    train_parser.add_argument('archive_directory', type=str,
+                              help='The output directory of previous runs.')
+    train_parser.add_argument('--model', type=str, default=None,
+                              help='Path to the model file. Defaults to .type_classifier.npz in the archive.')
+    eval_parser = subparsers.add_parser('eval', help='Evaluate the classifier on a holdout of the archive.')
+    eval_parser.add_argument('archive_directory', type=str,
+                             help='The output directory of previous runs.')
+    eval_parser.add_argument('--holdout', type=int, default=5,
+                             help='Use one document out of this many for testing.')
+    eval_parser.add_argument('--llm', action='store_true',
+                             help='Also classify the test documents with the LLM, for comparison.')
+    eval_parser.add_argument('--threshold', type=float, default=0.9,
+                             help='Report the precision and coverage of the predictions at or above '
+                                  'this confidence, as with --type-threshold.')
+    args = parser.parse_args()
+
+    from document_analyzer import valid_types
+
+    if not os.path.isdir(args.archive_directory):
+        print(f"Error: {args.archive_directory} is not a valid directory.")
+        sys.exit(1)
+
+    if args.command == 'train':
+        model_path = args.model or os.path.join(args.archive_directory, '.type_classifier.npz')
+        train(args.archive_directory, model_path, valid_types)
+    else:
+        results = evaluate(args.archive_directory, valid_types, args.holdout, args.llm, args.threshold)
+        for key, value in results.items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()